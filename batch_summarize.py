@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resumen masivo de documentos con la API de lotes (Batch API) de OpenAI.
+
+Extrae el texto de los documentos en paralelo con DocumentHandler (y la caché
+de extracción), genera el archivo JSONL de peticiones, lo envía como lote,
+espera a que termine y escribe un resumen por documento. Los lotes no pasan por
+el bot ni consumen su límite de peticiones, a cambio de tardar hasta 24 h.
+
+Uso:
+    python batch_summarize.py documentos/ --output resumenes/
+    python batch_summarize.py documentos/ --output resumenes/ --dry-run   # solo genera el JSONL
+    python batch_summarize.py --resume --output resumenes/                 # sigue esperando los lotes enviados
+
+Sin red, contra el servidor falso de benchmarks/stub_openai.py:
+    python -m benchmarks.stub_openai --profile instant --port 8900
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=sk-stub python batch_summarize.py documentos/ --output resumenes/
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types import Batch
+
+from config.settings import (
+    setup_rotating_logger, OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TIMEOUT, SYSTEM_PROMPT, MAX_TOKENS,
+    DOC_MAX_CHARS, DOC_PARSE_TIMEOUT
+)
+from document_cache import document_cache, CachedDocument
+from document_handler import DocumentHandler
+
+logger = setup_rotating_logger("batch-summarize", "batch-summarize.log")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+
+# Límites de la API por lote
+MAX_REQUESTS_PER_BATCH = 50_000
+MAX_BATCH_FILE_BYTES = 200 * 1024 * 1024
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+DEFAULT_INSTRUCTIONS = (
+    "Resume el siguiente documento en el idioma en que está escrito. Empieza con una frase "
+    "que diga de qué trata y sigue con los puntos clave en viñetas (datos, cifras, fechas, "
+    "conclusiones). Si el texto está truncado, resume solo lo que se incluye."
+)
+
+STATE_FILE = "batch_state.json"
+REQUESTS_FILE = "requests.jsonl"
+SUMMARIES_FILE = "summaries.jsonl"
+SUMMARIES_MARKDOWN = "summaries.md"
+
+class Extraction(NamedTuple):
+    """Texto extraído de un documento (o el motivo por el que no se pudo)."""
+    path: Path
+    success: bool
+    message: str  # Cobertura de la extracción o error
+    content: Optional[str]
+
+def collect_files(inputs: Sequence[Path], handler: DocumentHandler) -> List[Path]:
+    """Archivos soportados en las rutas dadas (los directorios se recorren recursivamente)."""
+    files = set()
+    for path in inputs:
+        candidates = path.rglob("*") if path.is_dir() else [path]
+        files.update(candidate for candidate in candidates
+                     if candidate.is_file() and handler.is_supported(candidate.name))
+    return sorted(files)
+
+async def extract_document(path: Path, handler: DocumentHandler) -> Extraction:
+    """Extrae un documento reutilizando la caché de extracción del bot si está activa."""
+    try:
+        file_bytes = await asyncio.to_thread(path.read_bytes)
+    except OSError as e:
+        # Borrado, sin permisos... tras collect_files(): se anota y se sigue con el resto
+        return Extraction(path, False, f"❌ No se pudo leer el archivo: {e}", None)
+    cache_key = None
+    if document_cache is not None:
+        cache_key = await asyncio.to_thread(document_cache.content_key, file_bytes, handler.extraction_signature())
+        cached = await asyncio.to_thread(document_cache.get, cache_key)
+        if cached is not None:
+            return Extraction(path, True, cached.coverage, cached.content)
+
+    success, message, content = await handler.process_document(file_bytes, path.name)
+    if success and cache_key is not None:
+        await asyncio.to_thread(document_cache.put, cache_key, None, CachedDocument(path.name, message, content))
+    return Extraction(path, success, message, content)
+
+async def extract_all(paths: List[Path], handler: DocumentHandler) -> List[Extraction]:
+    """
+    Extrae todos los documentos en paralelo.
+
+    Como mucho hay tantos documentos en curso (leídos y en memoria) como procesos
+    de extracción; el resto espera sin haber leído su archivo.
+    """
+    start_time = time.perf_counter()
+    slots = asyncio.Semaphore(max(1, handler.workers))
+
+    async def extract_bounded(path: Path) -> Extraction:
+        async with slots:
+            return await extract_document(path, handler)
+
+    extractions = await asyncio.gather(*(extract_bounded(path) for path in paths))
+    ok = sum(1 for extraction in extractions if extraction.success)
+    logger.info(f"📄 {ok}/{len(paths)} documentos extraídos en {time.perf_counter() - start_time:.1f}s")
+    return list(extractions)
+
+def build_request(custom_id: str, extraction: Extraction, model: str, max_tokens: int, instructions: str) -> dict:
+    """Línea del archivo de lote para resumir un documento."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": 0.3,
+            "messages": [
+                {"role": "system", "content": f"{SYSTEM_PROMPT} {instructions}"},
+                {"role": "user", "content": f"Documento: {extraction.path.name}\n\n{extraction.content}"}
+            ]
+        }
+    }
+
+def split_batches(lines: List[str]) -> List[List[str]]:
+    """Reparte las líneas en lotes que respetan los límites de peticiones y tamaño."""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_bytes = 0
+    for line in lines:
+        line_bytes = len(line.encode("utf-8")) + 1
+        if current and (len(current) >= MAX_REQUESTS_PER_BATCH or current_bytes + line_bytes > MAX_BATCH_FILE_BYTES):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(line)
+        current_bytes += line_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+def load_state(out_dir: Path) -> dict:
+    path = out_dir / STATE_FILE
+    if not path.exists():
+        raise FileNotFoundError(f"No hay lotes enviados en {out_dir} (falta {STATE_FILE})")
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def save_state(out_dir: Path, state: dict):
+    (out_dir / STATE_FILE).write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+
+async def submit_batches(client: AsyncOpenAI, batches: List[List[str]], model: str) -> List[str]:
+    """Sube cada archivo de peticiones y crea su lote. Devuelve los ids de los lotes."""
+    batch_ids = []
+    for number, lines in enumerate(batches, 1):
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        input_file = await client.files.create(file=(f"summaries_{number}.jsonl", data), purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=COMPLETION_WINDOW,
+            metadata={"source": "batch_summarize", "model": model}
+        )
+        batch_ids.append(batch.id)
+        logger.info(f"📤 Lote {batch.id} enviado: {len(lines)} peticiones ({len(data) / 1024:.0f} KB)")
+    return batch_ids
+
+async def wait_for_batch(client: AsyncOpenAI, batch_id: str, poll_interval: float) -> Batch:
+    """Consulta el lote cada poll_interval segundos hasta que termina."""
+    last_progress = None
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = (batch.status, counts.completed if counts else 0, counts.failed if counts else 0)
+        if progress != last_progress:
+            total = counts.total if counts else "?"
+            logger.info(f"⏳ Lote {batch_id}: {batch.status} | {progress[1]}/{total} completadas, {progress[2]} fallidas")
+            last_progress = progress
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        await asyncio.sleep(poll_interval)
+
+async def download_jsonl(client: AsyncOpenAI, file_id: Optional[str]) -> List[dict]:
+    if not file_id:
+        return []
+    content = await client.files.content(file_id)
+    return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+def parse_result(row: dict) -> dict:
+    """Convierte una línea de salida o de errores del lote en el resultado de un documento."""
+    response = row.get("response") or {}
+    body = response.get("body") or {}
+    if row.get("error") or response.get("status_code") != 200:
+        error = row.get("error") or body.get("error") or {}
+        return {"status": "error", "error": error.get("message") or f"HTTP {response.get('status_code')}"}
+    choices = body.get("choices") or [{}]
+    return {
+        "status": "ok",
+        "summary": ((choices[0].get("message") or {}).get("content") or "").strip(),
+        "usage": body.get("usage"),
+    }
+
+async def collect_results(client: AsyncOpenAI, state: dict, poll_interval: float) -> List[dict]:
+    """Espera a los lotes del estado y devuelve un resultado por documento."""
+    results: Dict[str, dict] = {}
+    for batch_id in state["batches"]:
+        batch = await wait_for_batch(client, batch_id, poll_interval)
+        if batch.status != "completed":
+            logger.error(f"❌ Lote {batch_id} terminó como {batch.status}")
+        for row in await download_jsonl(client, batch.output_file_id) + await download_jsonl(client, batch.error_file_id):
+            results[row.get("custom_id")] = parse_result(row)
+
+    rows = []
+    for custom_id, path in state["documents"].items():
+        result = results.get(custom_id, {"status": "missing", "error": "El lote no devolvió resultado"})
+        rows.append({"file": path, **result})
+    for path, error in state["extraction_errors"].items():
+        rows.append({"file": path, "status": "extraction_error", "error": error})
+    return rows
+
+def write_results(out_dir: Path, rows: List[dict]):
+    """Guarda los resultados en JSONL y en un Markdown legible."""
+    with open(out_dir / SUMMARIES_FILE, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    sections = []
+    for row in rows:
+        body = row["summary"] if row["status"] == "ok" else f"⚠️ {row['status']}: {row.get('error')}"
+        sections.append(f"## {row['file']}\n\n{body}\n")
+    (out_dir / SUMMARIES_MARKDOWN).write_text("\n".join(sections), encoding="utf-8")
+
+async def run(args: argparse.Namespace) -> int:
+    args.output.mkdir(parents=True, exist_ok=True)
+    client = None
+    if not args.dry_run:
+        if not OPENAI_API_KEY:
+            raise RuntimeError("Falta la variable de entorno OPENAI_API_KEY")
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT,
+                             http_client=DefaultAsyncHttpxClient(timeout=OPENAI_TIMEOUT))
+
+    try:
+        if args.resume:
+            state = load_state(args.output)
+        else:
+            handler = DocumentHandler(workers=args.workers, max_pending_jobs=args.workers * 2,
+                                      parse_timeout=DOC_PARSE_TIMEOUT, max_chars=args.max_chars)
+            try:
+                paths = collect_files(args.inputs, handler)
+                if not paths:
+                    logger.error("No se encontraron documentos soportados")
+                    return 1
+                logger.info(f"🔎 {len(paths)} documentos encontrados, extrayendo con {args.workers} procesos")
+                extractions = await extract_all(paths, handler)
+            finally:
+                handler.shutdown()
+
+            state = {"model": args.model, "batches": [], "documents": {}, "extraction_errors": {}}
+            lines = []
+            for number, extraction in enumerate(extractions):
+                if not extraction.success:
+                    state["extraction_errors"][str(extraction.path)] = extraction.message
+                    continue
+                custom_id = f"doc-{number:06d}"
+                state["documents"][custom_id] = str(extraction.path)
+                request = build_request(custom_id, extraction, args.model, args.max_tokens, args.instructions)
+                lines.append(json.dumps(request, ensure_ascii=False))
+
+            (args.output / REQUESTS_FILE).write_text("\n".join(lines) + "\n", encoding="utf-8")
+            logger.info(f"📝 {len(lines)} peticiones escritas en {args.output / REQUESTS_FILE}")
+            if args.dry_run or not lines:
+                save_state(args.output, state)
+                return 0
+
+            state["batches"] = await submit_batches(client, split_batches(lines), args.model)
+            save_state(args.output, state)
+
+        rows = await collect_results(client, state, args.poll_interval)
+        write_results(args.output, rows)
+        ok = sum(1 for row in rows if row["status"] == "ok")
+        logger.info(f"✅ {ok}/{len(rows)} resúmenes escritos en {args.output / SUMMARIES_FILE}")
+        return 0 if ok == len(rows) else 1
+    finally:
+        if client is not None:
+            await client.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Resume documentos en bloque con la API de lotes de OpenAI")
+    parser.add_argument("inputs", nargs="*", type=Path, help="Archivos o directorios con documentos")
+    parser.add_argument("--output", type=Path, required=True, help="Directorio de peticiones, estado y resultados")
+    parser.add_argument("--model", default=OPENAI_MODEL)
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="Longitud máxima de cada resumen")
+    parser.add_argument("--max-chars", type=int, default=DOC_MAX_CHARS, help="Caracteres extraídos por documento")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos de extracción")
+    parser.add_argument("--instructions", default=DEFAULT_INSTRUCTIONS, help="Qué pedir al modelo para cada documento")
+    parser.add_argument("--poll-interval", type=float, default=30, help="Segundos entre consultas del estado del lote")
+    parser.add_argument("--dry-run", action="store_true", help="Solo extrae y genera el JSONL, sin enviar nada")
+    parser.add_argument("--resume", action="store_true", help="Espera a los lotes ya enviados desde --output")
+    args = parser.parse_args(argv)
+    if not args.resume and not args.inputs:
+        parser.error("Indica al menos un archivo o directorio (o --resume)")
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extracción de documentos por formato y tamaño.
+
+Mide DocumentHandler.process_document sobre el corpus de doc_corpus.py y
+guarda en un historial JSON el rendimiento (MB/s y páginas, párrafos o filas
+por segundo) y el pico de memoria (RSS). Compara cada ejecución con la anterior
+y marca las regresiones.
+
+Cada archivo se mide en un proceso nuevo para que el pico de RSS sea el suyo.
+
+Uso:
+    python -m benchmarks.bench_documents --sizes 1kb,1mb,20mb
+    python -m benchmarks.bench_documents --full      # sin presupuesto de caracteres
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.doc_corpus import GENERATORS, generate_corpus
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_HISTORY = BENCH_DIR / "results" / "document_history.json"
+
+# Presupuesto "sin límite" para medir la extracción completa
+FULL_EXTRACTION_CHARS = 10 ** 12
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso actual en MB (None si no se puede medir)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _measure(path: str, max_chars: int, repeat: int) -> dict:
+    """Se ejecuta en un proceso nuevo: extrae el documento repeat veces y mide."""
+    from document_handler import DocumentHandler
+
+    file_path = Path(path)
+    file_bytes = file_path.read_bytes()
+    rss_before = peak_rss_mb()
+    handler = DocumentHandler(workers=0, max_chars=max_chars)  # en este mismo proceso
+
+    async def run() -> List[float]:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            success, message, _ = await handler.process_document(file_bytes, file_path.name, max_chars)
+            timings.append(time.perf_counter() - start)
+            if not success:
+                raise RuntimeError(message)
+        return timings
+
+    try:
+        # Unidades leídas (páginas, párrafos, filas) con el extractor directamente
+        extractor = handler.supported_extensions[file_path.suffix.lower().lstrip(".")]
+        result = extractor(file_bytes, file_path.name, max_chars)
+        timings = asyncio.run(run())
+    finally:
+        handler.shutdown()
+
+    median = statistics.median(timings)
+    size_mb = len(file_bytes) / (1024 * 1024)
+    return {
+        "bytes": len(file_bytes),
+        "seconds": round(median, 5),
+        "seconds_min": round(min(timings), 5),
+        "mb_per_second": round(size_mb / median, 3) if median else None,
+        "unit": result.unit,
+        "units_read": result.units_read,
+        "units_total": result.units_total,
+        "units_per_second": round(result.units_read / median, 1) if median else None,
+        "truncated": result.truncated,
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1) or None,
+        "baseline_rss_mb": round(rss_before or 0, 1) or None,
+    }
+
+def find_regressions(current: Dict[str, dict], previous: Dict[str, dict], tolerance: float) -> List[str]:
+    """Compara con la ejecución anterior: menos MB/s o más memoria que la tolerancia."""
+    regressions = []
+    for name, result in current.items():
+        before = previous.get(name)
+        if not before or "error" in result or "error" in before:
+            continue
+        if before.get("mb_per_second") and result["mb_per_second"] < before["mb_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['mb_per_second']} MB/s (antes {before['mb_per_second']})")
+        if before.get("peak_rss_mb") and result.get("peak_rss_mb") and \
+                result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: pico de RSS {result['peak_rss_mb']} MB (antes {before['peak_rss_mb']})")
+    return regressions
+
+def load_history(path: Path) -> dict:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"runs": []}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de extracción de documentos")
+    parser.add_argument("--sizes", default="1kb,100kb,1mb,5mb,20mb")
+    parser.add_argument("--formats", default=",".join(GENERATORS))
+    parser.add_argument("--corpus", type=Path, default=BENCH_DIR / "corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por archivo (se usa la mediana)")
+    parser.add_argument("--full", action="store_true", help="Extrae el documento completo (sin DOC_MAX_CHARS)")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento tolerado frente a la ejecución anterior")
+    parser.add_argument("--no-save", action="store_true", help="No añade la ejecución al historial")
+    args = parser.parse_args(argv)
+
+    # Silenciar los logs informativos de los procesos de medida
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from config.settings import DOC_MAX_CHARS
+    max_chars = FULL_EXTRACTION_CHARS if args.full else DOC_MAX_CHARS
+
+    paths = generate_corpus(args.corpus, args.sizes.split(","), args.formats.split(","))
+    results: Dict[str, dict] = {}
+    context = multiprocessing.get_context("spawn")
+    print(f"{'archivo':<26} {'tamaño':>10} {'mediana':>9} {'MB/s':>9} {'unidades/s':>20} {'RSS pico':>9}")
+    for path in paths:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                result = pool.submit(_measure, str(path), max_chars, args.repeat).result()
+            except Exception as e:
+                results[path.name] = {"error": str(e)}
+                print(f"{path.name:<26} ERROR: {e}")
+                continue
+        results[path.name] = result
+        print(f"{path.name:<26} {result['bytes'] / 1024:>8.0f}KB {result['seconds']:>8.3f}s "
+              f"{result['mb_per_second'] or 0:>9.2f} {result['units_per_second'] or 0:>10.0f} {result['unit']:<9} "
+              f"{result['peak_rss_mb'] or 0:>7.0f}MB")
+
+    history = load_history(args.history)
+    mode = "full" if args.full else f"budget-{max_chars}"
+    previous = next((run for run in reversed(history["runs"]) if run.get("mode") == mode), None)
+    regressions = find_regressions(results, previous["results"], args.tolerance) if previous else []
+    for regression in regressions:
+        print(f"⚠️ Regresión: {regression}")
+
+    if not args.no_save:
+        history["runs"].append({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": mode,
+            "repeat": args.repeat,
+            "results": results,
+            "regressions": regressions,
+        })
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        args.history.write_text(json.dumps(history, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Historial actualizado: {args.history}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
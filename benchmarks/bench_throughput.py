@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extremo a extremo: ejecuta los handlers reales de bot.py
+(handle_buttons/chat/handle_document) contra un OpenAI falso y una Bot API
+de Telegram falsa, con un número creciente de usuarios concurrentes.
+
+Cada usuario simulado envía sus mensajes de uno en uno (espera la respuesta
+antes del siguiente), como un usuario real. Se informa la latencia p50/p95/p99
+por actualización y el rendimiento en mensajes por segundo.
+
+Uso:
+    python -m benchmarks.bench_throughput --users 1,10,50,100 --profile fast
+    python -m benchmarks.bench_throughput --output resultados.json --baseline anterior.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.stub_openai import PROFILES, StubOpenAI
+
+BENCH_TOKEN = "123456:BENCHMARK"
+BUTTONS = ("📊 Estadísticas", "🆘 Ayuda")
+QUESTIONS = (
+    "¿Puedes explicarme cómo funciona la fotosíntesis?",
+    "Dame tres ideas para un proyecto de fin de semana",
+    "Resume las ventajas de usar SQLite en una aplicación pequeña",
+    "¿Qué diferencia hay entre un proceso y un hilo?",
+)
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentil por el método del rango más cercano."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'text=0.8,button=0.1,document=0.1' -> pesos por tipo de actualización."""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in ("text", "button", "document"):
+            raise ValueError(f"Tipo de actualización desconocido: {kind}")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+class UpdateFactory:
+    """Construye actualizaciones de Telegram como las que enviaría la Bot API."""
+
+    def __init__(self, fake_telegram: FakeTelegram, document_kb: int):
+        self.fake_telegram = fake_telegram
+        self.document_kb = document_kb
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"usuario{user_id}"},
+                **fields
+            }
+        }
+
+    def build(self, kind: str, user_id: int, sequence: int) -> dict:
+        if kind == "button":
+            return self._message(user_id, text=BUTTONS[sequence % len(BUTTONS)])
+        if kind == "document":
+            # Contenido único por envío para que no lo resuelva la caché de documentos
+            file_id = f"doc-{user_id}-{sequence}"
+            line = f"Línea de informe del usuario {user_id}, envío {sequence}: ventas, costes y previsiones.\n"
+            content = (line * (self.document_kb * 1024 // len(line) + 1)).encode("utf-8")
+            self.fake_telegram.add_file(file_id, content)
+            return self._message(user_id, document={
+                "file_id": file_id, "file_unique_id": file_id, "file_name": f"informe_{sequence}.txt",
+                "mime_type": "text/plain", "file_size": len(content)
+            })
+        return self._message(user_id, text=QUESTIONS[sequence % len(QUESTIONS)])
+
+async def run_level(app, factory: UpdateFactory, fake_telegram: FakeTelegram, users: int,
+                    messages_per_user: int, mix: Dict[str, float], first_user_id: int, seed: int) -> dict:
+    """Ejecuta una ronda con users usuarios concurrentes y devuelve sus métricas."""
+    from telegram import Update
+
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    latencies: Dict[str, List[float]] = {kind: [] for kind in kinds}
+    fake_telegram.reset_stats()
+
+    async def simulate_user(user_id: int):
+        for sequence in range(messages_per_user):
+            kind = rng.choices(kinds, weights)[0]
+            update = Update.de_json(factory.build(kind, user_id, sequence), app.bot)
+            start = time.perf_counter()
+            await app.update_processor.process_update(update, app.process_update(update))
+            latencies[kind].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(simulate_user(first_user_id + offset) for offset in range(users)))
+    wall_time = time.perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "users": users,
+        "messages": len(all_latencies),
+        "wall_seconds": round(wall_time, 3),
+        "throughput": round(len(all_latencies) / wall_time, 2) if wall_time else 0.0,
+        "p50": round(percentile(all_latencies, 0.50), 4),
+        "p95": round(percentile(all_latencies, 0.95), 4),
+        "p99": round(percentile(all_latencies, 0.99), 4),
+        "by_kind": {kind: {"count": len(values), "p50": round(percentile(values, 0.5), 4),
+                           "p95": round(percentile(values, 0.95), 4)}
+                    for kind, values in latencies.items() if values},
+        "error_replies": fake_telegram.error_replies,
+        "telegram_calls": dict(fake_telegram.calls),
+    }
+
+def compare_with_baseline(results: List[dict], baseline_path: Path, tolerance: float) -> List[str]:
+    """Regresiones respecto a una ejecución anterior (mismo número de usuarios)."""
+    baseline = {level["users"]: level for level in json.loads(baseline_path.read_text(encoding="utf-8"))["levels"]}
+    regressions = []
+    for level in results:
+        previous = baseline.get(level["users"])
+        if previous is None:
+            continue
+        if level["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{level['users']} usuarios: rendimiento {level['throughput']} < {previous['throughput']} msg/s")
+        if level["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append(f"{level['users']} usuarios: p95 {level['p95']}s > {previous['p95']}s")
+    return regressions
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    profile = PROFILES[args.profile]
+    stub = StubOpenAI(profile)
+    fake_telegram = FakeTelegram(BENCH_TOKEN, latency=args.telegram_latency)
+    await stub.start()
+    await fake_telegram.start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bot-bench-"))
+    # La configuración se lee al importar: el entorno debe estar listo antes de importar bot
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": BENCH_TOKEN,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": stub.base_url,
+        "OPENAI_WARMUP_CONNECTIONS": "0",
+        "STORE_DB_PATH": str(workdir / "bench.sqlite3"),
+        "DOC_CACHE_DIR": str(workdir / "documents"),
+        "AUTHORIZED_USER_IDS": "",
+        "METRICS_ENABLED": "false",
+        "WEBHOOK_ENABLED": "false",
+        "STREAM_RESPONSES": "true" if args.stream else "false",
+        # Cada usuario simulado espera su respuesta antes de enviar el siguiente
+        # mensaje: la ventana de debounce solo sumaría latencia
+        "CHAT_DEBOUNCE_SECONDS": "0",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    bot = importlib.import_module("bot")
+
+    app = bot.build_application(
+        base_url=fake_telegram.base_url,
+        base_file_url=fake_telegram.base_file_url,
+        rate_limit=not args.no_rate_limit
+    )
+    await app.initialize()
+    await app.post_init(app)
+
+    factory = UpdateFactory(fake_telegram, args.document_kb)
+    mix = parse_mix(args.mix)
+    levels = []
+    try:
+        first_user_id = 1000
+        for users in (int(value) for value in args.users.split(",")):
+            result = await run_level(app, factory, fake_telegram, users, args.messages, mix,
+                                     first_user_id, args.seed)
+            first_user_id += users
+            levels.append(result)
+            print(f"{users:>6} usuarios | {result['messages']:>6} msgs | {result['throughput']:>8.2f} msg/s | "
+                  f"p50 {result['p50']:.3f}s | p95 {result['p95']:.3f}s | p99 {result['p99']:.3f}s | "
+                  f"errores {result['error_replies']}")
+    finally:
+        await app.shutdown()
+        await app.post_shutdown(app)
+        await fake_telegram.stop()
+        await stub.stop()
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "profile": args.profile,
+        "stream": args.stream,
+        "rate_limit": not args.no_rate_limit,
+        "mix": mix,
+        "messages_per_user": args.messages,
+        "levels": levels,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento de extremo a extremo del bot")
+    parser.add_argument("--users", default="1,10,50,100", help="Usuarios concurrentes por ronda (separados por coma)")
+    parser.add_argument("--messages", type=int, default=5, help="Mensajes por usuario en cada ronda")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="Perfil del OpenAI falso")
+    parser.add_argument("--mix", default="text=0.8,button=0.1,document=0.1", help="Proporción de tipos de actualización")
+    parser.add_argument("--document-kb", type=int, default=32, help="Tamaño de los documentos enviados")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="Latencia de la Bot API falsa (s)")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="Respuestas sin streaming")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Desactiva el limitador de envíos a Telegram")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Guarda los resultados en JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento tolerado frente al baseline")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args))
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Resultados guardados en {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(report["levels"], args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"⚠️ Regresión: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generador del corpus de documentos para el benchmark de extracción.
+Crea PDF, DOCX, XLSX, CSV y TXT deterministas de distintos tamaños
+(de 1 KB a 20 MB), con muchas páginas, hojas o filas.
+
+Uso:
+    python -m benchmarks.doc_corpus --sizes 1kb,1mb,20mb --out benchmarks/corpus
+"""
+
+import argparse
+import csv
+import io
+import random
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Límite de DocumentHandler (20 MB): los archivos mayores se rechazan antes de extraer
+MAX_FIXTURE_BYTES = 20 * 1024 * 1024 - 64 * 1024
+
+WORDS = (
+    "informe ventas trimestre cliente proyecto presupuesto analisis resultado objetivo equipo "
+    "mercado producto servicio calidad proceso datos sistema usuario contrato factura pedido "
+    "entrega plazo riesgo mejora coste ingreso margen region oficina reunion acuerdo revision"
+).split()
+
+# Sílabas para palabras inventadas (DOCX y XLSX, que se comprimen)
+SYLLABLES = ("ca", "lo", "ter", "mi", "sa", "dor", "pe", "ri", "con", "ta", "ble", "nu", "vi", "gra", "so",
+             "fen", "qui", "ma", "to", "res", "al", "bu", "cle", "do", "ex", "fi", "go", "har", "in", "ju")
+
+SIZE_UNITS = {"kb": 1024, "mb": 1024 * 1024}
+
+# Partes mínimas de los paquetes OOXML
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+DOCX_DOCUMENT = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>'
+)
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}</Types>'
+)
+XLSX_SHEET_OVERRIDE = (
+    '<Override PartName="/xl/worksheets/sheet{index}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>{sheets}</sheets></workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{sheets}</Relationships>'
+)
+XLSX_SHEET_REL = (
+    '<Relationship Id="rId{index}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{index}.xml"/>'
+)
+XLSX_SHEET = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>{rows}</sheetData></worksheet>'
+)
+
+def parse_size(text: str) -> int:
+    """'1kb' / '20mb' -> bytes (limitado al máximo que acepta el bot)."""
+    text = text.strip().lower()
+    for suffix, factor in SIZE_UNITS.items():
+        if text.endswith(suffix):
+            return min(int(float(text[:-len(suffix)]) * factor), MAX_FIXTURE_BYTES)
+    return min(int(text), MAX_FIXTURE_BYTES)
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def make_txt(target_bytes: int, rng: random.Random) -> bytes:
+    """Texto en párrafos."""
+    parts: List[str] = []
+    size = 0
+    while size < target_bytes:
+        paragraph = " ".join(_sentence(rng) for _ in range(4)) + "\n\n"
+        parts.append(paragraph)
+        size += len(paragraph.encode("utf-8"))
+    return "".join(parts).encode("utf-8")
+
+def make_csv(target_bytes: int, rng: random.Random) -> bytes:
+    """Tabla con cabecera y columnas de texto y números."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "cliente", "region", "producto", "importe", "comentario"])
+    row_id = 0
+    while buffer.tell() < target_bytes:
+        row_id += 1
+        writer.writerow([row_id, rng.choice(WORDS), rng.choice(WORDS), rng.choice(WORDS),
+                         f"{rng.uniform(10, 10000):.2f}", _sentence(rng, 8)])
+    return buffer.getvalue().encode("utf-8")
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(target_bytes: int, rng: random.Random) -> bytes:
+    """
+    PDF construido a mano (sin dependencias): páginas de texto con la fuente
+    estándar Helvetica, sin comprimir, hasta alcanzar el tamaño pedido.
+    """
+    lines_per_page = 60
+    pages: List[bytes] = []
+    size = 0
+    while size < target_bytes or not pages:
+        lines = [_pdf_escape(_sentence(rng, 10)) for _ in range(lines_per_page)]
+        stream = "BT /F1 9 Tf 40 800 Td 12 TL\n" + "".join(f"({line}) '\n" for line in lines) + "ET"
+        pages.append(stream.encode("latin-1"))
+        size += len(pages[-1]) + 260  # contenido + objetos de la página y entradas xref
+
+    # Objetos: 1 catálogo, 2 árbol de páginas, 3 fuente, después (página, contenido) por página
+    page_ids = [4 + 2 * index for index in range(len(pages))]
+    objects: Dict[int, bytes] = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {len(pages)} >>".encode("latin-1"),
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for page_id, stream in zip(page_ids, pages):
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        ).encode("latin-1")
+        objects[page_id + 1] = f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets: Dict[int, int] = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = output.tell()
+        output.write(f"{object_id} 0 obj\n".encode("latin-1") + objects[object_id] + b"\nendobj\n")
+    xref_offset = output.tell()
+    count = max(objects) + 1
+    output.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode("latin-1"))
+    for object_id in range(1, count):
+        output.write(f"{offsets[object_id]:010d} 00000 n \n".encode("latin-1"))
+    output.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1"))
+    return output.getvalue()
+
+def _random_word(rng: random.Random) -> str:
+    """Palabra inventada: comprime mucho menos que un vocabulario fijo."""
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def _fit_zip(target_bytes: int, add_content: Callable[[], int], build: Callable[[], bytes]) -> bytes:
+    """
+    Añade contenido hasta que el paquete ZIP alcanza target_bytes.
+
+    La relación de compresión se estima y se corrige con cada empaquetado, así
+    basta con comprimir unas pocas veces aunque el archivo sea de 20 MB.
+    """
+    ratio = 1.5  # bytes sin comprimir por byte comprimido (estimación inicial, a la baja)
+    raw_size = 0
+    while True:
+        while raw_size < target_bytes * ratio:
+            raw_size += add_content()
+        package = build()
+        if len(package) >= target_bytes:
+            return package
+        ratio = raw_size / len(package)
+
+def make_docx(target_bytes: int, rng: random.Random) -> bytes:
+    """
+    Documento de Word con encabezados cada 20 párrafos.
+
+    El paquete se escribe directamente con zipfile: python-docx tarda minutos en
+    generar decenas de MB.
+    """
+    paragraphs: List[str] = []
+
+    def add_content() -> int:
+        if len(paragraphs) % 21 == 0:
+            paragraphs.append(f'<w:p><w:pPr><w:pStyle w:val="Heading2"/></w:pPr>'
+                              f'<w:r><w:t>Sección {len(paragraphs) // 21 + 1}</w:t></w:r></w:p>')
+        text = " ".join(_random_word(rng) for _ in range(40))
+        paragraphs.append(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>")
+        return len(paragraphs[-1])
+
+    def build() -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as package:
+            package.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+            package.writestr("_rels/.rels", DOCX_RELS)
+            package.writestr("word/document.xml", DOCX_DOCUMENT.format(body="".join(paragraphs)))
+        return buffer.getvalue()
+
+    return _fit_zip(target_bytes, add_content, build)
+
+def make_xlsx(target_bytes: int, rng: random.Random) -> bytes:
+    """
+    Libro de Excel con varias hojas de 20 000 filas (celdas de texto en línea).
+
+    Como el DOCX, se escribe directamente con zipfile para generar rápido los
+    archivos grandes; openpyxl lo lee igual que uno guardado por Excel.
+    """
+    rows_per_sheet = 20000
+    sheets: List[List[str]] = []
+
+    def cell(column: str, row: int, value: object) -> str:
+        if isinstance(value, str):
+            return f'<c r="{column}{row}" t="inlineStr"><is><t>{value}</t></is></c>'
+        return f'<c r="{column}{row}"><v>{value}</v></c>'
+
+    def add_content() -> int:
+        if not sheets or len(sheets[-1]) >= rows_per_sheet:
+            header = ["id", "cliente", "region", "producto", "importe", "comentario"]
+            sheets.append(['<row r="1">' + "".join(cell(col, 1, v) for col, v in zip("ABCDEF", header)) + "</row>"])
+        row = len(sheets[-1]) + 1
+        row_id = (len(sheets) - 1) * rows_per_sheet + row
+        values = [row_id, _random_word(rng), _random_word(rng), _random_word(rng),
+                  round(rng.uniform(10, 10000), 2), " ".join(_random_word(rng) for _ in range(6))]
+        sheets[-1].append(f'<row r="{row}">' + "".join(cell(col, row, v) for col, v in zip("ABCDEF", values)) + "</row>")
+        return len(sheets[-1][-1])
+
+    def build() -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as package:
+            package.writestr("[Content_Types].xml", XLSX_CONTENT_TYPES.format(sheets="".join(
+                XLSX_SHEET_OVERRIDE.format(index=index) for index in range(1, len(sheets) + 1))))
+            package.writestr("_rels/.rels", XLSX_RELS)
+            package.writestr("xl/workbook.xml", XLSX_WORKBOOK.format(sheets="".join(
+                f'<sheet name="Hoja{index}" sheetId="{index}" r:id="rId{index}"/>' for index in range(1, len(sheets) + 1))))
+            package.writestr("xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS.format(sheets="".join(
+                XLSX_SHEET_REL.format(index=index) for index in range(1, len(sheets) + 1))))
+            for index, rows in enumerate(sheets, 1):
+                package.writestr(f"xl/worksheets/sheet{index}.xml", XLSX_SHEET.format(rows="".join(rows)))
+        return buffer.getvalue()
+
+    return _fit_zip(target_bytes, add_content, build)
+
+GENERATORS: Dict[str, Callable[[int, random.Random], bytes]] = {
+    "txt": make_txt,
+    "csv": make_csv,
+    "pdf": make_pdf,
+    "docx": make_docx,
+    "xlsx": make_xlsx,
+}
+
+def generate_corpus(out_dir: Path, sizes: List[str], formats: List[str], seed: int = 1234,
+                    overwrite: bool = False) -> List[Path]:
+    """Genera (o reutiliza) los archivos del corpus y devuelve sus rutas."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for size_label in sizes:
+        target = parse_size(size_label)
+        for extension in formats:
+            path = out_dir / f"corpus_{size_label.strip().lower()}.{extension}"
+            if overwrite or not path.exists():
+                rng = random.Random(f"{seed}-{size_label}-{extension}")
+                path.write_bytes(GENERATORS[extension](target, rng))
+            paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el corpus del benchmark de documentos")
+    parser.add_argument("--sizes", default="1kb,100kb,1mb,5mb,20mb")
+    parser.add_argument("--formats", default=",".join(GENERATORS))
+    parser.add_argument("--out", type=Path, default=Path(__file__).resolve().parent / "corpus")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--overwrite", action="store_true", help="Regenera aunque el archivo exista")
+    args = parser.parse_args()
+
+    for path in generate_corpus(args.out, args.sizes.split(","), args.formats.split(","), args.seed, args.overwrite):
+        print(f"{path.name:<28} {path.stat().st_size / 1024:>10.1f} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bot API de Telegram falsa para benchmarks: responde a los métodos que usa el bot
+y sirve los archivos registrados para handle_document.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Dict
+
+from http_server import MiniHTTPServer, Request, Response, json_response
+
+class FakeTelegram:
+    """
+    Implementa getMe, sendMessage, editMessageText, deleteMessage, sendChatAction,
+    getFile y setWebhook, con una latencia fija por petición.
+    """
+
+    def __init__(self, token: str, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.token = token
+        self.latency = latency
+        self.server = MiniHTTPServer(self.handle, host, port)
+        self.calls: Counter = Counter()
+        self.error_replies = 0  # Mensajes de error ("❌ ...") enviados por el bot
+        self.files: Dict[str, bytes] = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.server.url}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"{self.server.url}/file/bot"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    def add_file(self, file_id: str, content: bytes):
+        """Registra el contenido de un archivo para getFile y su descarga."""
+        self.files[file_id] = content
+
+    def _message(self, params: Dict[str, str]) -> dict:
+        chat_id = int(params.get("chat_id", "0"))
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bench_bot"},
+            "text": params.get("text", "")
+        }
+
+    async def handle(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        file_prefix = f"/file/bot{self.token}/"
+        if request.path.startswith(file_prefix):
+            file_id = request.path[len(file_prefix):].rsplit("/", 1)[-1]
+            content = self.files.get(file_id)
+            if content is None:
+                return json_response({"ok": False, "description": "Not Found"}, 404)
+            return 200, "application/octet-stream", content
+
+        method = request.path.rsplit("/", 1)[-1]
+        self.calls[method] += 1
+        params = request.form()
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench_bot", "username": "bench_bot",
+                      "can_join_groups": False, "can_read_all_group_messages": False,
+                      "supports_inline_queries": False}
+        elif method in ("sendMessage", "editMessageText"):
+            if params.get("text", "").startswith("❌"):
+                self.error_replies += 1
+            result = self._message(params)
+        elif method == "getFile":
+            file_id = params.get("file_id", "")
+            result = {"file_id": file_id, "file_unique_id": file_id,
+                      "file_size": len(self.files.get(file_id, b"")), "file_path": f"documents/{file_id}"}
+        elif method in ("sendChatAction", "deleteMessage", "setWebhook", "deleteWebhook"):
+            result = True
+        else:
+            return json_response({"ok": False, "error_code": 404, "description": f"Método no simulado: {method}"}, 404)
+        return json_response({"ok": True, "result": result})
+
+    def reset_stats(self):
+        self.calls.clear()
+        self.error_replies = 0
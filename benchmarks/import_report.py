@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Informe del tiempo de importación del bot (arranque en frío).
+
+Ejecuta `python -X importtime -c "import bot"` en procesos nuevos, toma la
+mediana por módulo y muestra qué importaciones pesan más. Falla si el total
+supera el presupuesto o si se importa al arrancar alguna biblioteca que debe
+cargarse bajo demanda (las de documentos).
+
+Uso:
+    python -m benchmarks.import_report
+    python -m benchmarks.import_report --runs 10 --budget-ms 1200 --output importtime.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Bibliotecas que solo deben importarse al llegar un documento de su tipo
+LAZY_MODULES = ("PyPDF2", "docx", "openpyxl")
+
+class ImportTiming(NamedTuple):
+    module: str
+    depth: int  # 0 = el módulo pedido, 1 = sus importaciones directas...
+    self_us: int
+    cumulative_us: int
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """Interpreta las líneas 'import time: self | cumulative | módulo' de -X importtime."""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Cabecera
+        name = fields[2].rstrip()
+        indent = len(name) - len(name.lstrip())
+        timings.append(ImportTiming(name.strip(), (indent - 1) // 2, int(fields[0]), int(fields[1])))
+    return timings
+
+def measure(module: str, runs: int) -> List[List[ImportTiming]]:
+    """Importa module en runs procesos nuevos y devuelve los tiempos de cada uno."""
+    env = {**os.environ, "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"), "PYTHONDONTWRITEBYTECODE": "1"}
+    results = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_DIR, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"No se pudo importar {module}:\n{completed.stderr[-2000:]}")
+        results.append(parse_importtime(completed.stderr))
+    return results
+
+def summarize(runs: List[List[ImportTiming]], module: str) -> dict:
+    """Mediana por módulo de todas las ejecuciones."""
+    cumulative: Dict[str, List[int]] = {}
+    self_time: Dict[str, List[int]] = {}
+    depths: Dict[str, int] = {}
+    for timings in runs:
+        for timing in timings:
+            cumulative.setdefault(timing.module, []).append(timing.cumulative_us)
+            self_time.setdefault(timing.module, []).append(timing.self_us)
+            depths.setdefault(timing.module, timing.depth)
+
+    modules = {
+        name: {
+            "depth": depths[name],
+            "self_ms": round(statistics.median(self_time[name]) / 1000, 2),
+            "cumulative_ms": round(statistics.median(values) / 1000, 2),
+        }
+        for name, values in cumulative.items()
+    }
+    total = modules.get(module, {}).get("cumulative_ms", 0.0)
+    return {"module": module, "runs": len(runs), "total_ms": total, "modules": modules}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Informe del tiempo de importación del bot")
+    parser.add_argument("--module", default="bot", help="Módulo a importar")
+    parser.add_argument("--runs", type=int, default=5, help="Procesos nuevos a medir (se usa la mediana)")
+    parser.add_argument("--top", type=int, default=15, help="Módulos a mostrar")
+    parser.add_argument("--budget-ms", type=float, help="Falla si la importación tarda más")
+    parser.add_argument("--output", type=Path, help="Guarda el informe en JSON")
+    args = parser.parse_args(argv)
+
+    report = summarize(measure(args.module, args.runs), args.module)
+    modules = report["modules"]
+
+    print(f"Importación de {args.module}: {report['total_ms']:.0f} ms (mediana de {report['runs']} procesos)\n")
+    print(f"{'importación directa':<40} {'acumulado':>10}")
+    direct = sorted((item for item in modules.items() if item[1]["depth"] == 1),
+                    key=lambda item: item[1]["cumulative_ms"], reverse=True)
+    for name, timing in direct[:args.top]:
+        print(f"{name:<40} {timing['cumulative_ms']:>8.1f}ms")
+    print(f"\n{'módulo (tiempo propio)':<40} {'propio':>10}")
+    for name, timing in sorted(modules.items(), key=lambda item: item[1]["self_ms"], reverse=True)[:args.top]:
+        print(f"{name:<40} {timing['self_ms']:>8.1f}ms")
+
+    problems = [f"{name} se importa al arrancar (debe cargarse bajo demanda)"
+                for name in LAZY_MODULES if name in modules]
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        problems.append(f"la importación tarda {report['total_ms']:.0f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    report["problems"] = problems
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nInforme guardado en {args.output}")
+    for problem in problems:
+        print(f"⚠️ {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor falso compatible con la API de chat de OpenAI para benchmarks.
+Simula latencia hasta el primer token y velocidad de generación configurables,
+y la API de lotes (/v1/files y /v1/batches) para probar batch_summarize.py.
+
+Uso independiente:
+    python -m benchmarks.stub_openai --profile typical --port 8900
+    set OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import time
+from typing import AsyncIterator, Dict, List, NamedTuple
+
+from http_server import MiniHTTPServer, Request, Response, json_response
+
+class LatencyProfile(NamedTuple):
+    """Comportamiento simulado del modelo."""
+    first_token_latency: float  # Segundos hasta el primer token
+    tokens_per_second: float  # Velocidad de generación (0 = instantánea)
+    completion_tokens: int  # Tokens de cada respuesta
+
+PROFILES: Dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(0.0, 0, 50),
+    "fast": LatencyProfile(0.2, 200, 150),
+    "typical": LatencyProfile(0.5, 60, 300),
+    "slow": LatencyProfile(2.0, 20, 300),
+}
+
+# Las pausas se agrupan en ticks para no crear un temporizador por token
+TICK_SECONDS = 0.05
+# Caché de prefijos como la de OpenAI: a partir de 1024 tokens, en bloques de 128
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_BLOCK_TOKENS = 128
+PREFIX_CACHE_MAX_ENTRIES = 100_000
+
+WORDS = ("la", "respuesta", "del", "modelo", "simulado", "incluye", "texto", "de", "prueba", "para", "medir", "rendimiento.")
+
+class StubOpenAI:
+    """
+    Implementa /v1/chat/completions (con y sin streaming), /v1/models y la API de
+    lotes: subida y descarga de archivos, creación, consulta y cancelación de lotes.
+    Cada lote pasa por validating -> in_progress -> completed en batch_seconds.
+
+    Simula la caché de prefijos del proveedor: los mensajes iniciales idénticos a
+    los de una petición anterior se informan en usage.prompt_tokens_details.cached_tokens.
+    """
+
+    def __init__(self, profile: LatencyProfile, host: str = "127.0.0.1", port: int = 0,
+                 batch_seconds: float = 1.0):
+        self.profile = profile
+        self.batch_seconds = batch_seconds
+        self.server = MiniHTTPServer(self.handle, host, port)
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._seen_prefixes = set()
+        self.files: Dict[str, dict] = {}
+        self.file_contents: Dict[str, bytes] = {}
+        self.batches: Dict[str, dict] = {}
+        self._batch_tasks: List[asyncio.Task] = []
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.server.url}/v1"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        for task in self._batch_tasks:
+            task.cancel()
+        await self.server.stop()
+
+    async def handle(self, request: Request) -> Response:
+        if request.path.endswith("/models"):
+            return json_response({"object": "list", "data": [
+                {"id": model, "object": "model", "created": 0, "owned_by": "stub"}
+                for model in ("gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo")
+            ]})
+        if request.path.endswith("/chat/completions") and request.method == "POST":
+            self.requests += 1
+            payload = request.json()
+            if payload.get("stream"):
+                return 200, "text/event-stream", self._stream(payload)
+            return await self._complete(payload)
+        if request.path.startswith("/v1/files") or request.path.startswith("/v1/batches"):
+            return self._handle_batch_api(request)
+        return json_response({"error": {"message": f"Ruta no soportada: {request.path}"}}, 404)
+
+    @staticmethod
+    def _message_tokens(message: dict) -> int:
+        # Estimación rápida (~4 caracteres por token), suficiente para el benchmark
+        return len(str(message.get("content", ""))) // 4 + 1
+
+    def _usage(self, payload: dict, completion_tokens: int) -> dict:
+        """Consumo de la petición, con los tokens del prefijo ya visto como cacheados."""
+        if len(self._seen_prefixes) > PREFIX_CACHE_MAX_ENTRIES:
+            self._seen_prefixes.clear()
+        digest = hashlib.sha256()
+        prompt_tokens = cached_tokens = 0
+        for message in payload.get("messages", []):
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            prompt_tokens += self._message_tokens(message)
+            key = digest.hexdigest()
+            if key in self._seen_prefixes:
+                cached_tokens = prompt_tokens
+            else:
+                self._seen_prefixes.add(key)
+        if cached_tokens < PREFIX_CACHE_MIN_TOKENS:
+            cached_tokens = 0
+        cached_tokens -= cached_tokens % PREFIX_CACHE_BLOCK_TOKENS
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+    def _tokens(self, max_tokens: int):
+        count = min(self.profile.completion_tokens, max_tokens or self.profile.completion_tokens)
+        return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+    def _completion(self, payload: dict) -> dict:
+        tokens = self._tokens(payload.get("max_tokens", 0))
+        return {
+            "id": f"chatcmpl-stub{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(payload, len(tokens))
+        }
+
+    async def _complete(self, payload: dict) -> Response:
+        completion = self._completion(payload)
+        delay = self.profile.first_token_latency
+        if self.profile.tokens_per_second:
+            delay += completion["usage"]["completion_tokens"] / self.profile.tokens_per_second
+        if delay:
+            await asyncio.sleep(delay)
+        return json_response(completion)
+
+    # ------------------------------------------------------------------
+    # API de lotes
+    # ------------------------------------------------------------------
+
+    def _store_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        file_id = f"file-stub{next(self._ids)}"
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                               "filename": filename, "purpose": purpose, "status": "processed"}
+        self.file_contents[file_id] = content
+        return self.files[file_id]
+
+    def _handle_batch_api(self, request: Request) -> Response:
+        parts = request.path.strip("/").split("/")  # v1, files|batches, [id], [content|cancel]
+        resource, object_id = parts[1], parts[2] if len(parts) > 2 else None
+        action = parts[3] if len(parts) > 3 else None
+        not_found = json_response({"error": {"message": f"No existe: {request.path}"}}, 404)
+
+        if resource == "files":
+            if object_id is None and request.method == "POST":
+                fields = request.multipart()
+                filename, content = fields.get("file", ("upload.jsonl", b""))
+                purpose = fields.get("purpose", (None, b"batch"))[1].decode("utf-8")
+                return json_response(self._store_file(filename or "upload.jsonl", purpose, content))
+            if object_id not in self.files:
+                return not_found
+            if action == "content":
+                return 200, "application/octet-stream", self.file_contents[object_id]
+            return json_response(self.files[object_id])
+
+        if object_id is None and request.method == "POST":
+            params = request.json()
+            if params.get("input_file_id") not in self.files:
+                return json_response({"error": {"message": "input_file_id desconocido"}}, 400)
+            batch_id = f"batch_stub{next(self._ids)}"
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": params.get("endpoint"),
+                "input_file_id": params["input_file_id"], "completion_window": params.get("completion_window"),
+                "status": "validating", "created_at": int(time.time()), "metadata": params.get("metadata"),
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self._batch_tasks.append(asyncio.create_task(self._run_batch(self.batches[batch_id])))
+            return json_response(self.batches[batch_id])
+        batch = self.batches.get(object_id)
+        if batch is None:
+            return not_found
+        if action == "cancel" and batch["status"] in ("validating", "in_progress"):
+            batch["status"] = "cancelled"
+            batch["cancelled_at"] = int(time.time())
+        return json_response(batch)
+
+    async def _run_batch(self, batch: dict):
+        """Procesa las peticiones del archivo de entrada y genera los de salida y errores."""
+        await asyncio.sleep(self.batch_seconds / 2)
+        if batch["status"] == "cancelled":
+            return
+        batch.update(status="in_progress", in_progress_at=int(time.time()))
+        lines = [json.loads(line) for line in self.file_contents[batch["input_file_id"]].splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(lines)
+
+        outputs, errors = [], []
+        for line in lines:
+            body = line.get("body") or {}
+            result = {"id": f"batch_req_stub{next(self._ids)}", "custom_id": line.get("custom_id")}
+            if line.get("url") != batch["endpoint"] or not body.get("messages"):
+                errors.append({**result, "response": None, "error": {
+                    "code": "invalid_request", "message": "Petición sin mensajes o con endpoint distinto del lote"}})
+                batch["request_counts"]["failed"] += 1
+            else:
+                outputs.append({**result, "error": None, "response": {
+                    "status_code": 200, "request_id": result["id"], "body": self._completion(body)}})
+                batch["request_counts"]["completed"] += 1
+
+        await asyncio.sleep(self.batch_seconds / 2)
+        if batch["status"] == "cancelled":
+            return
+
+        def jsonl(rows: List[dict]) -> bytes:
+            return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+        if outputs:
+            batch["output_file_id"] = self._store_file(f"{batch['id']}_output.jsonl", "batch_output", jsonl(outputs))["id"]
+        if errors:
+            batch["error_file_id"] = self._store_file(f"{batch['id']}_errors.jsonl", "batch_output", jsonl(errors))["id"]
+        batch.update(status="completed", completed_at=int(time.time()))
+
+    async def _stream(self, payload: dict) -> AsyncIterator[bytes]:
+        completion_id = f"chatcmpl-stub{next(self._ids)}"
+        model = payload.get("model", "stub")
+        created = int(time.time())
+        tokens = self._tokens(payload.get("max_tokens", 0))
+
+        def event(choices, usage=None) -> bytes:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": choices}
+            if usage is not None:
+                chunk["usage"] = usage
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        if self.profile.first_token_latency:
+            await asyncio.sleep(self.profile.first_token_latency)
+        yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+
+        per_tick = max(1, int(self.profile.tokens_per_second * TICK_SECONDS)) if self.profile.tokens_per_second else len(tokens)
+        for start in range(0, len(tokens), per_tick):
+            content = "".join(tokens[start:start + per_tick])
+            yield event([{"index": 0, "delta": {"content": content}, "finish_reason": None}])
+            if self.profile.tokens_per_second:
+                await asyncio.sleep(per_tick / self.profile.tokens_per_second)
+
+        yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            yield event([], self._usage(payload, len(tokens)))
+        yield b"data: [DONE]\n\n"
+
+async def _serve(profile: LatencyProfile, host: str, port: int):
+    stub = StubOpenAI(profile, host, port)
+    await stub.start()
+    print(f"Stub de OpenAI en {stub.base_url} ({profile})")
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor falso de OpenAI para benchmarks")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="typical")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(PROFILES[args.profile], args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
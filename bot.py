@@ -4,42 +4,101 @@
 Bot de chat con OpenAI con soporte para documentos.
 """
 
+import time
+
+# Inicio de las importaciones, para el informe de arranque en frío
+_IMPORT_STARTED = time.perf_counter()
+
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import asyncio
+from functools import lru_cache
+from pathlib import Path
 from time import sleep
 
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
+import httpx
+
+from telegram import Update, Message, Document, ReplyKeyboardMarkup, KeyboardButton
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, ContextTypes, filters
 from telegram.constants import ChatAction
 from telegram.error import NetworkError, RetryAfter, TimedOut, BadRequest
 
 # Importar manejador de documentos
 from document_handler import document_handler
+from document_cache import document_cache, CachedDocument
+from document_index import document_retriever, format_retrieved_chunks
+from storage import conversation_store
+from update_processor import AdmissionQueue, PerUserUpdateProcessor
+from debouncer import MessageDebouncer
+from inflight import inflight_completions, CompletionSuperseded
+from response_cache import response_cache
+from usage_tracker import usage_tracker
+from model_router import model_router, AUTO_MODEL
+from compactor import ConversationCompactor, is_summary_message, pinned_prefix_length
+from rate_limiter import OutboundRateLimiter
+from message_splitter import split_message, TELEGRAM_MAX_MESSAGE_LENGTH
+from metrics import (
+    registry, metrics_server, openai_request_seconds, openai_first_token_seconds, openai_tokens_total,
+    openai_errors_total, openai_in_flight, document_download_seconds, telegram_send_seconds,
+    telegram_send_retries_total, telegram_send_failures_total, startup_seconds
+)
+from token_counter import count_message_tokens, count_messages_tokens, count_tokens, get_prompt_budget, warmup_encodings
 
 from config.settings import (
     ensure_config, TELEGRAM_BOT_TOKEN, LOG_FORMAT, LOG_LEVEL,
     OPENAI_API_KEY, OPENAI_MODEL, SYSTEM_PROMPT, MAX_TOKENS, 
-    TEMPERATURE, MAX_HISTORY_MESSAGES, is_user_authorized, setup_rotating_logger
+    TEMPERATURE, MAX_HISTORY_MESSAGES, MAX_PROMPT_TOKENS, is_user_authorized, setup_rotating_logger,
+    OPENAI_TIMEOUT, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY, OPENAI_WARMUP_CONNECTIONS,
+    STREAM_RESPONSES, STREAM_EDIT_INTERVAL, STREAM_MIN_CHARS_PER_EDIT,
+    MAX_CONCURRENT_UPDATES, LLM_MAX_CONCURRENCY, RESPONSE_CACHE_MAX_TEMPERATURE,
+    WEBHOOK_ENABLED, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL,
+    WEBHOOK_SECRET_TOKEN, UPDATE_QUEUE_SIZE, MAX_PENDING_UPDATES, TELEGRAM_RATE_LIMIT_ENABLED, METRICS_ENABLED,
+    COMPACTION_ENABLED, CHAT_DEBOUNCE_SECONDS
 )
 
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types import CompletionUsage
 import openai
 
+# Lo que tardan las importaciones (el detalle por módulo: benchmarks/import_report.py)
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
 # Configurar logging con rotación automática
 logger = setup_rotating_logger("chat-bot", "chat-bot.log")
 
-# Cliente OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Cliente OpenAI asíncrono: todas las peticiones comparten un único pool de
+# conexiones keep-alive, así varias respuestas pueden estar en curso a la vez
+# sin bloquear el event loop.
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=OPENAI_TIMEOUT,
+    http_client=DefaultAsyncHttpxClient(
+        timeout=OPENAI_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+    ),
+)
+
+# Completions de OpenAI en curso como máximo (todas las conversaciones)
+llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Resúmenes en segundo plano de las conversaciones largas (ver compactor.py)
+conversation_compactor = ConversationCompactor(client, llm_slots) if COMPACTION_ENABLED else None
 
-# Memoria de conversación en RAM por usuario
-conversations: Dict[int, List[dict]] = {}
+# Conversaciones y configuración por usuario: SQLite (WAL) con caché LRU en RAM
+# (ver storage.py). Se accede siempre a través de las funciones de abajo.
 
-# Configuración personalizada por usuario
-user_configs: Dict[int, Dict] = {}
+# Texto provisional mientras llega la respuesta en streaming
+STREAM_PLACEHOLDER = "✍️ Escribiendo..."
+STREAM_CURSOR = " ▌"
 
-# Modelos válidos de OpenAI (lista centralizada)
-VALID_OPENAI_MODELS = ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"]
+# Modelos válidos de OpenAI (lista centralizada); con "auto" el bot elige el modelo
+# de cada turno (ver model_router.py)
+VALID_OPENAI_MODELS = ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo", AUTO_MODEL]
 
 # Modos de respuesta disponibles
 RESPONSE_MODES = {
@@ -60,26 +119,52 @@ RESPONSE_MODES = {
     "🧒 Simple": "Explica todo como si tu audiencia tuviera 10 años de edad. Usa vocabulario extremadamente simple y cotidiano. Evita completamente jerga técnica, acrónimos sin explicar y conceptos complejos sin descomponer. Utiliza analogías con cosas del día a día que cualquiera pueda entender (juguetes, comida, animales, familia). Divide información compleja en pasos pequeños y digeribles. Sé paciente, claro y asegúrate de que hasta un niño pueda comprender la explicación. Perfecto para principiantes absolutos, aprendizaje básico o explicar temas complicados de forma accesible."
 }
 
+async def preload_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Carga la sesión del usuario en un hilo antes de los handlers (que la leen de forma síncrona)."""
+    user = update.effective_user
+    if user is not None and is_user_authorized(user.id):
+        await conversation_store.load_session(user.id)
+
 def get_user_config(user_id: int) -> Dict:
     """Obtiene la configuración personalizada del usuario."""
-    if user_id not in user_configs:
-        user_configs[user_id] = {
+    config = conversation_store.get_config(user_id)
+    if config is None:
+        config = {
             "mode": "😊 Casual",
             "temperature": TEMPERATURE,
             "model": OPENAI_MODEL,
             "max_tokens": MAX_TOKENS
         }
-    return user_configs[user_id]
+        conversation_store.set_config(user_id, config)
+    return config
 
-def get_system_prompt(user_id: int) -> str:
-    """Genera el system prompt personalizado según el modo del usuario."""
-    config = get_user_config(user_id)
-    mode = config["mode"]
-    
-    base_prompt = SYSTEM_PROMPT
+def save_user_config(user_id: int, config: Dict):
+    """Guarda la configuración del usuario (escritura diferida)."""
+    conversation_store.set_config(user_id, config)
+
+@lru_cache(maxsize=None)
+def build_system_messages(mode: str) -> Tuple[dict, dict]:
+    """Instrucciones base (iguales para todos los usuarios) e instrucción del modo de respuesta."""
     mode_instruction = RESPONSE_MODES.get(mode, RESPONSE_MODES["😊 Casual"])
-    
-    return f"{base_prompt} {mode_instruction}"
+    return {"role": "system", "content": SYSTEM_PROMPT}, {"role": "system", "content": mode_instruction}
+
+def build_prompt_prefix(mode: str, document_names: List[str]) -> List[dict]:
+    """
+    Parte estable del prompt, ordenada de lo más a lo menos estable: instrucciones
+    base, instrucción del modo y documentos fijados del usuario.
+
+    OpenAI reutiliza el procesamiento de un prefijo de prompt idéntico al de una
+    petición reciente (menos latencia y tokens más baratos), así que este prefijo
+    solo cambia al cambiar de modo o de documentos; lo que varía en cada turno va al final.
+    """
+    prefix = list(build_system_messages(mode))
+    if document_names:
+        prefix.append({
+            "role": "system",
+            "content": "Documentos enviados por el usuario (sus fragmentos relevantes se incluyen "
+                       f"antes de cada pregunta): {', '.join(document_names)}"
+        })
+    return prefix
 
 def get_main_keyboard():
     """Crea el teclado principal con botones de comandos."""
@@ -123,7 +208,7 @@ def get_model_keyboard():
     """Crea el teclado para seleccionar modelo."""
     keyboard = [
         [KeyboardButton("🧠 gpt-4o"), KeyboardButton("⚡ gpt-4o-mini")],
-        [KeyboardButton("� gpt-3.5-turbo")],
+        [KeyboardButton("� gpt-3.5-turbo"), KeyboardButton("🚦 auto")],
         [KeyboardButton("�🔙 Volver Config")]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
@@ -137,6 +222,54 @@ def get_tokens_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
 
+# Textos que handle_buttons trata como botones
+MENU_BUTTONS = {
+    "🆘 Ayuda", "📊 Estadísticas", "🔄 Resetear Chat", "💬 Chat Libre", "🎭 Cambiar Modo",
+    "⚙️ Configuración", "🔙 Volver", "🌡️ Temperatura", "🧠 Modelo", "📏 Tokens",
+    "📋 Ver Config", "🔙 Volver Config"
+}
+TEMPERATURE_BUTTONS = ["🔥 0.1", "🌡️ 0.5", "🌡️ 0.7", "🌡️ 1.0", "🌡️ 1.5", "🔥 2.0"]
+MODEL_BUTTONS = ["🧠 gpt-4o", "⚡ gpt-4o-mini", "🔷 gpt-3.5-turbo", "🚦 auto"]
+TOKEN_BUTTONS = ["📏 500", "📏 1000", "📏 2000", "📏 4000"]
+BUTTON_TEXTS = frozenset(MENU_BUTTONS.union(TEMPERATURE_BUTTONS, MODEL_BUTTONS, TOKEN_BUTTONS, RESPONSE_MODES))
+
+def is_debounced_message(update: object) -> bool:
+    """Mensaje de texto libre (no un botón ni un comando) que puede unirse a los siguientes."""
+    message = update.message if isinstance(update, Update) else None
+    if message is None or not message.text:
+        return False
+    return not message.text.startswith("/") and message.text not in BUTTON_TEXTS
+
+# Mensajes seguidos de un usuario -> un solo turno (ver debouncer.py)
+message_debouncer = MessageDebouncer(is_debounced_message) if CHAT_DEBOUNCE_SECONDS > 0 else None
+
+# Comandos que reinician la conversación
+RESET_COMMANDS = {"/start", "/reset"}
+
+def superseding_reason(update: object) -> Optional[str]:
+    """Motivo por el que una actualización deja obsoleta la respuesta en curso (None si no lo hace)."""
+    message = update.message if isinstance(update, Update) else None
+    if message is None or not message.text:
+        return None
+    text = message.text
+    command = text.split(maxsplit=1)[0].split("@")[0] if text.startswith("/") else None
+    if text == "🔄 Resetear Chat" or command in RESET_COMMANDS:
+        return "reset"
+    if text in RESPONSE_MODES:
+        return "mode"
+    if is_debounced_message(update):
+        return "message"
+    return None
+
+def cancel_superseded_completion(user_id: int, update: object):
+    """
+    Se llama al llegar cada actualización, antes de esperar turno: si deja
+    obsoleta la respuesta en curso del usuario, la cancela sin esperar a que acabe.
+    """
+    reason = superseding_reason(update)
+    if reason is not None:
+        inflight_completions.cancel(user_id, reason)
+
 # ============================================================================
 # FUNCIONES DE MANEJO DE ERRORES
 # ============================================================================
@@ -180,8 +313,16 @@ async def handle_openai_error(error: Exception, user_id: int) -> str:
     
     # Contexto muy largo
     if "context_length_exceeded" in error_msg or "maximum context length" in error_msg:
+        if conversation_compactor is not None:
+            logger.info(f"Contexto excedido para usuario {user_id}, resumiendo historial")
+            conversation_compactor.cancel(user_id)
+            try:
+                if await conversation_compactor.compact(user_id, keep_recent=2):
+                    return "📚 **Conversación muy larga**\n\nHe resumido los mensajes anteriores para continuar.\n\n✨ Puedes repetir tu última pregunta."
+            except Exception as e:
+                logger.error(f"No se pudo resumir el historial del usuario {user_id}: {e}")
         logger.info(f"Contexto excedido para usuario {user_id}, limpiando historial")
-        reset_history(user_id)
+        await reset_history(user_id)
         return "📚 **Conversación muy larga**\n\nHe limpiado el historial para continuar.\n\n✨ Puedes repetir tu última pregunta."
     
     # Token inválido o problemas de autenticación
@@ -198,8 +339,36 @@ async def handle_openai_error(error: Exception, user_id: int) -> str:
     logger.error(f"Error OpenAI no identificado para usuario {user_id}: {error}")
     return "🤖 **Error temporal de IA**\n\nHubo un problema técnico inesperado.\n\n🔄 Intenta nuevamente o usa /reset para empezar de nuevo."
 
+def limiter_retries_retry_after(bot) -> bool:
+    """Indica si el limitador de envíos del bot ya reintenta los RetryAfter (ver rate_limiter.py)."""
+    return isinstance(getattr(bot, "rate_limiter", None), OutboundRateLimiter)
+
+async def _wait_retry_after(bot, error: RetryAfter, method: str, attempt: int, max_retries: int) -> bool:
+    """
+    Espera lo que pide un RetryAfter si nadie más lo reintenta.
+
+    Returns:
+        bool: True si hay que reintentar; False si ya lo reintentó el limitador o
+        se agotaron los intentos
+    """
+    if limiter_retries_retry_after(bot):
+        logger.error(f"Rate limit Telegram persistente tras los reintentos del limitador: {error}")
+        return False
+    if attempt >= max_retries - 1:
+        logger.error(f"Rate limit Telegram agotado después de {max_retries} intentos")
+        return False
+    telegram_send_retries_total.inc(method=method, reason="retry_after")
+    retry_after = error.retry_after.total_seconds() if hasattr(error.retry_after, "total_seconds") else float(error.retry_after)
+    logger.warning(f"Rate limit Telegram, esperando {retry_after:.1f} segundos...")
+    await asyncio.sleep(retry_after)
+    return True
+
 async def safe_send_message(update: Update, message: str, reply_markup=None, max_retries: int = 3):
     """Envía mensajes de forma segura con reintentos automáticos."""
+    with telegram_send_seconds.time(method="send"):
+        return await _send_with_retries(update, message, reply_markup, max_retries)
+
+async def _send_with_retries(update: Update, message: str, reply_markup, max_retries: int) -> bool:
     for attempt in range(max_retries):
         try:
             await update.message.reply_text(
@@ -209,14 +378,14 @@ async def safe_send_message(update: Update, message: str, reply_markup=None, max
             )
             return True
         except RetryAfter as e:
-            if attempt < max_retries - 1:
-                logger.warning(f"Rate limit Telegram, esperando {e.retry_after} segundos...")
-                await asyncio.sleep(e.retry_after)
-            else:
-                logger.error(f"Rate limit Telegram agotado después de {max_retries} intentos")
+            # Solo una capa reintenta: el limitador si está instalado, si no esta
+            if not await _wait_retry_after(update.get_bot(), e, "send", attempt, max_retries):
+                telegram_send_failures_total.inc(method="send")
+                return False
         except BadRequest as e:
             if "can't parse" in str(e).lower():
                 # Intenta enviar sin Markdown
+                telegram_send_retries_total.inc(method="send", reason="markdown")
                 try:
                     await update.message.reply_text(message, reply_markup=reply_markup)
                     return True
@@ -224,6 +393,7 @@ async def safe_send_message(update: Update, message: str, reply_markup=None, max
                     pass
             logger.error(f"BadRequest en Telegram: {e}")
         except (NetworkError, TimedOut) as e:
+            telegram_send_retries_total.inc(method="send", reason="network")
             if attempt < max_retries - 1:
                 logger.warning(f"Error de red Telegram, reintentando... ({attempt + 1}/{max_retries})")
                 await asyncio.sleep(2 ** attempt)  # Backoff exponencial
@@ -234,6 +404,7 @@ async def safe_send_message(update: Update, message: str, reply_markup=None, max
             break
     
     # Si llegamos aquí, falló todos los intentos
+    telegram_send_failures_total.inc(method="send")
     try:
         # Intento final sin markdown ni teclado
         await update.message.reply_text("❌ Error enviando respuesta. Intenta nuevamente.")
@@ -241,33 +412,303 @@ async def safe_send_message(update: Update, message: str, reply_markup=None, max
         logger.error("No se pudo enviar ni el mensaje de error")
     return False
 
+async def send_long_message(update: Update, message: str, reply_markup=None) -> bool:
+    """
+    Envía un texto que puede superar el límite de Telegram, dividido en varios mensajes.
+
+    Los trozos se envían en orden y solo el último lleva el teclado; si uno falla
+    no se envían los siguientes.
+    """
+    chunks = split_message(message)
+    for position, chunk in enumerate(chunks):
+        is_last = position == len(chunks) - 1
+        if not await safe_send_message(update, chunk, reply_markup if is_last else None):
+            return False
+    return True
+
+async def safe_edit_message(message: Message, text: str, parse_mode: Optional[str] = None, max_retries: int = 3) -> bool:
+    """Edita un mensaje ya enviado con reintentos; si el Markdown falla, edita en texto plano."""
+    with telegram_send_seconds.time(method="edit"):
+        success = await _edit_with_retries(message, text, parse_mode, max_retries)
+    if not success:
+        telegram_send_failures_total.inc(method="edit")
+    return success
+
+async def _edit_with_retries(message: Message, text: str, parse_mode: Optional[str], max_retries: int) -> bool:
+    for attempt in range(max_retries):
+        try:
+            await message.edit_text(text, parse_mode=parse_mode)
+            return True
+        except RetryAfter as e:
+            # Solo una capa reintenta: el limitador si está instalado, si no esta
+            if not await _wait_retry_after(message.get_bot(), e, "edit", attempt, max_retries):
+                return False
+        except BadRequest as e:
+            error_msg = str(e).lower()
+            if "not modified" in error_msg:
+                return True
+            if parse_mode and "can't parse" in error_msg:
+                # Reintenta sin Markdown
+                telegram_send_retries_total.inc(method="edit", reason="markdown")
+                parse_mode = None
+                continue
+            logger.error(f"BadRequest editando mensaje en Telegram: {e}")
+            return False
+        except (NetworkError, TimedOut) as e:
+            telegram_send_retries_total.inc(method="edit", reason="network")
+            if attempt < max_retries - 1:
+                logger.warning(f"Error de red editando mensaje, reintentando... ({attempt + 1}/{max_retries})")
+                await asyncio.sleep(2 ** attempt)  # Backoff exponencial
+            else:
+                logger.error(f"Error de red editando mensaje agotado: {e}")
+        except Exception as e:
+            logger.error(f"Error inesperado editando mensaje: {e}")
+            break
+    return False
+
+async def stream_completion(update: Update, config: dict, messages: List[dict]) -> Tuple[str, Optional[Message], Optional[CompletionUsage]]:
+    """
+    Genera la respuesta en streaming editando un mensaje provisional a medida que llegan tokens.
+    
+    Las ediciones intermedias se agrupan (como máximo una cada STREAM_EDIT_INTERVAL segundos)
+    y se envían en texto plano, porque el Markdown parcial suele ser inválido. El formato
+    definitivo se aplica en finalize_streamed_message.
+    
+    Returns:
+        Tuple[str, Optional[Message], Optional[CompletionUsage]]: (respuesta completa,
+        mensaje provisional o None, consumo de tokens si la API lo envía)
+    """
+    try:
+        placeholder = await update.message.reply_text(STREAM_PLACEHOLDER, reply_markup=get_main_keyboard())
+    except Exception as e:
+        # Sin mensaje provisional se envía la respuesta completa al final
+        logger.warning(f"No se pudo enviar el mensaje provisional: {e}")
+        placeholder = None
+    
+    loop = asyncio.get_running_loop()
+    parts: List[str] = []
+    received_chars = 0
+    shown_chars = 0
+    last_edit = loop.time()
+    usage = None
+    start_time = time.perf_counter()
+    first_token_time = None
+    telegram_seconds = 0.0  # Ediciones intermedias: no cuentan como latencia del modelo
+    
+    try:
+        stream = await client.chat.completions.create(
+            model=config["model"],
+            messages=messages,
+            temperature=config["temperature"],
+            max_tokens=config["max_tokens"],
+            stream=True,
+            stream_options={"include_usage": True}  # El último chunk trae el consumo de tokens
+        )
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if not parts:
+                    first_token_time = time.perf_counter()
+                    openai_first_token_seconds.observe(first_token_time - start_time, model=config["model"])
+                parts.append(delta)
+                received_chars += len(delta)
+                
+                if placeholder is None:
+                    continue
+                now = loop.time()
+                if now - last_edit < STREAM_EDIT_INTERVAL or received_chars - shown_chars < STREAM_MIN_CHARS_PER_EDIT:
+                    continue
+                
+                preview = "".join(parts)
+                limit = TELEGRAM_MAX_MESSAGE_LENGTH - len(STREAM_CURSOR)
+                if len(preview) > limit:
+                    preview = preview[:limit]
+                edit_started = time.perf_counter()
+                await safe_edit_message(placeholder, preview + STREAM_CURSOR, max_retries=1)
+                telegram_seconds += time.perf_counter() - edit_started
+                shown_chars = received_chars
+                last_edit = loop.time()
+    except BaseException:
+        # Error o cancelación: no dejar el mensaje provisional huérfano
+        if placeholder is not None:
+            try:
+                await placeholder.delete()
+            except Exception:
+                pass
+        raise
+    
+    answer = "".join(parts).strip()
+    if first_token_time is not None:
+        observe_model_latency(
+            config, first_token_time - start_time,
+            time.perf_counter() - first_token_time - telegram_seconds, usage, answer
+        )
+    return answer, placeholder, usage
+
+def observe_model_latency(config: dict, first_token_seconds: Optional[float], generation_seconds: float,
+                          usage: Optional[CompletionUsage], answer: str):
+    """Pasa la latencia de OpenAI de una petición al router del modelo "auto"."""
+    output_tokens = usage.completion_tokens if usage is not None else count_tokens(answer, config["model"])
+    model_router.observe(config["model"], config["mode"], first_token_seconds, generation_seconds, output_tokens)
+
+async def request_completion(update: Update, config: dict, messages: List[dict]) -> Tuple[str, Optional[Message]]:
+    """
+    Pide la respuesta a OpenAI (en streaming o no) registrando latencia, tokens y errores.
+    
+    Returns:
+        Tuple[str, Optional[Message]]: (respuesta, mensaje provisional del streaming o None)
+    """
+    labels = {"model": config["model"], "mode": config["mode"]}
+    start_time = time.perf_counter()
+    try:
+        with openai_in_flight.track_inprogress():
+            if STREAM_RESPONSES:
+                answer, placeholder, usage = await stream_completion(update, config, messages)
+            else:
+                resp = await client.chat.completions.create(
+                    model=config["model"],
+                    messages=messages,
+                    temperature=config["temperature"],
+                    max_tokens=config["max_tokens"]
+                )
+                answer = (resp.choices[0].message.content or "").strip()
+                placeholder, usage = None, resp.usage
+                observe_model_latency(config, None, time.perf_counter() - start_time, usage, answer)
+    except Exception as e:
+        openai_errors_total.inc(model=config["model"], error=type(e).__name__)
+        raise
+    
+    elapsed = time.perf_counter() - start_time
+    openai_request_seconds.observe(elapsed, stream=str(STREAM_RESPONSES).lower(), **labels)
+    if usage is not None:
+        cached_tokens = usage_tracker.record(update.effective_user.id, usage)
+        openai_tokens_total.inc(usage.prompt_tokens, kind="prompt", **labels)
+        openai_tokens_total.inc(cached_tokens, kind="cached_prompt", **labels)
+        openai_tokens_total.inc(usage.completion_tokens, kind="completion", **labels)
+    return answer, placeholder
+
+async def limited_completion(update: Update, config: dict, messages: List[dict]) -> Tuple[str, Optional[Message]]:
+    """request_completion dentro del tope global de completions en curso (el resto espera turno)."""
+    async with llm_slots:
+        return await request_completion(update, config, messages)
+
+async def finalize_streamed_message(update: Update, placeholder: Message, answer: str) -> bool:
+    """
+    Sustituye el texto provisional por la respuesta definitiva con formato Markdown.
+
+    Si la respuesta no cabe en un mensaje, el provisional pasa a ser el primer trozo
+    y el resto se envía a continuación (el último con el teclado).
+    """
+    first, *rest = split_message(answer)
+    if not await safe_edit_message(placeholder, first, parse_mode='Markdown'):
+        return False
+    for position, chunk in enumerate(rest):
+        is_last = position == len(rest) - 1
+        if not await safe_send_message(update, chunk, get_main_keyboard() if is_last else None):
+            break  # safe_send_message ya avisó al usuario; el primer trozo sí se entregó
+    return True
+
+def build_document_context(user_id: int, question: str) -> Optional[dict]:
+    """Mensaje con los fragmentos de documentos relevantes para la pregunta (no se guarda en el historial)."""
+    chunks = document_retriever.search(user_id, question)
+    if not chunks:
+        return None
+    return {"role": "system", "content": format_retrieved_chunks(chunks)}
+
+def assemble_messages(prefix: List[dict], history: List[dict], context_message: Optional[dict]) -> List[dict]:
+    """
+    Mensajes de la petición: prefijo estable, historial (resumen y turnos) y cola volátil.
+
+    Los fragmentos de documentos cambian con cada pregunta, así que van justo antes
+    de la última pregunta del usuario y no rompen el prefijo de las siguientes peticiones.
+    La lista es nueva: el historial puede compactarse mientras la petición está en curso.
+    """
+    if context_message is None:
+        return prefix + history
+    return prefix + history[:-1] + [context_message] + history[-1:]
+
+def route_model(user_id: int, config: dict, prefix: List[dict], history: List[dict],
+                context_message: Optional[dict]) -> str:
+    """Modelo de este turno para un usuario con el modelo "auto" (ver model_router.py)."""
+    messages = assemble_messages(prefix, history, context_message)
+    decision = model_router.choose(
+        user_id, config["mode"],
+        prompt_tokens=count_messages_tokens(messages, config["model"]),
+        question_tokens=count_tokens(history[-1]["content"], config["model"]),
+        has_documents=context_message is not None,
+        max_tokens=config["max_tokens"]
+    )
+    return decision.model
+
 def get_history(user_id: int) -> List[dict]:
-    if user_id not in conversations:
-        conversations[user_id] = [{"role": "system", "content": get_system_prompt(user_id)}]
-    return conversations[user_id]
-
-def reset_history(user_id: int):
-    conversations[user_id] = [{"role": "system", "content": get_system_prompt(user_id)}]
-
-def update_system_prompt(user_id: int):
-    """Actualiza el system prompt cuando cambia el modo."""
-    if user_id in conversations:
-        history = conversations[user_id]
-        if history and history[0]["role"] == "system":
-            history[0]["content"] = get_system_prompt(user_id)
-
-def trim_history(history: List[dict]) -> List[dict]:
-    """Mantiene solo los últimos N mensajes para evitar exceder límites de tokens."""
-    if len(history) <= MAX_HISTORY_MESSAGES:
-        return history
+    """Historial del usuario: resumen opcional y turnos (el system prompt se añade en cada petición)."""
+    history = conversation_store.get_history(user_id)
+    if history is None:
+        history = []
+        conversation_store.set_history(user_id, history)
+    elif history and history[0]["role"] == "system" and not is_summary_message(history[0]):
+        # Historial guardado con el system prompt dentro (formato anterior)
+        del history[0]
+        conversation_store.set_history(user_id, history)
+    return history
+
+def save_history(user_id: int, history: List[dict]):
+    """Guarda el historial del usuario (escritura diferida)."""
+    conversation_store.set_history(user_id, history)
+
+async def reset_history(user_id: int):
+    inflight_completions.cancel(user_id, "reset")
+    if conversation_compactor is not None:
+        conversation_compactor.cancel(user_id)
+    conversation_store.set_history(user_id, [])
+    document_retriever.clear(user_id)
+    await asyncio.to_thread(conversation_store.delete_documents, user_id)
+
+def trim_history(history: List[dict], model: str = OPENAI_MODEL, max_tokens: int = MAX_TOKENS,
+                 extra_tokens: int = 0) -> List[dict]:
+    """
+    Recorta el historial para que quepa en la ventana de contexto del modelo.
+    
+    Conserva el resumen de la conversación si lo hay (ver compactor.py) y los
+    mensajes más recientes cuyo total de tokens no supere el contexto del modelo
+    menos la reserva para la respuesta (max_tokens) y los tokens que se añadirán
+    fuera del historial (extra_tokens: prefijo estable y fragmentos de documentos).
+    MAX_HISTORY_MESSAGES se mantiene como tope adicional de mensajes.
+    """
+    pinned_count = pinned_prefix_length(history)
+    pinned = history[:pinned_count]
+    messages = history[pinned_count:]
+    
+    max_messages = max(1, MAX_HISTORY_MESSAGES - pinned_count)
+    if len(messages) > max_messages:
+        messages = messages[-max_messages:]
+    
+    budget = get_prompt_budget(model, max_tokens, MAX_PROMPT_TOKENS) - extra_tokens
+    used = sum(count_message_tokens(msg, model) for msg in pinned)
     
-    # Mantener el system prompt + últimos mensajes
-    system_msg = history[0] if history and history[0]["role"] == "system" else None
-    recent_messages = history[-(MAX_HISTORY_MESSAGES-1):] if system_msg else history[-MAX_HISTORY_MESSAGES:]
+    # Recorrer desde el más reciente hasta agotar el presupuesto
+    kept = 0
+    for msg in reversed(messages):
+        msg_tokens = count_message_tokens(msg, model)
+        if used + msg_tokens > budget and kept > 0:
+            break
+        used += msg_tokens
+        kept += 1
+    
+    if kept and used > budget:
+        logger.warning(f"El último mensaje excede el presupuesto de tokens ({used}/{budget}) para {model}")
     
-    if system_msg:
-        return [system_msg] + recent_messages
-    return recent_messages
+    recent_messages = messages[len(messages) - kept:]
+    if len(recent_messages) == len(history) - pinned_count:
+        return history
+    
+    return pinned + recent_messages
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -282,7 +723,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        reset_history(user.id)
+        await reset_history(user.id)
         await safe_send_message(
             update,
             f"🤖 **¡Hola {user.first_name}!** Soy tu asistente con OpenAI.\n\n"
@@ -359,18 +800,46 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         user_history = get_history(user.id)
-        total_users = len(conversations)
+        total_users = conversation_store.count_users()
         user_messages = len([msg for msg in user_history if msg["role"] == "user"])
         
         stats_text = (
             f"📊 **Estadísticas**\n\n"
             f"👤 **Tu sesión:**\n"
             f"• Mensajes enviados: {user_messages}\n"
-            f"• Contexto actual: {len(user_history)} mensajes\n\n"
+            f"• Contexto actual: {len(user_history)} mensajes"
+            f"{' (con resumen de los anteriores)' if pinned_prefix_length(user_history) else ''}\n\n"
             f"🌐 **Global:**\n"
             f"• Usuarios activos: {total_users}\n"
             f"• Modelo en uso: {OPENAI_MODEL}"
         )
+        if usage_tracker.totals.requests:
+            stats_text += f"\n• Tokens de prompt en caché: {usage_tracker.totals.cached_ratio:.0%}"
+        user_usage = usage_tracker.for_user(user.id)
+        if user_usage is not None:
+            stats_text += (
+                f"\n\n🧮 **Tus tokens (desde el arranque):**\n"
+                f"• Prompt: {user_usage.prompt_tokens} "
+                f"(en caché: {user_usage.cached_tokens} · {user_usage.cached_ratio:.0%})\n"
+                f"• Sin caché: {user_usage.uncached_tokens}\n"
+                f"• Respuesta: {user_usage.completion_tokens}"
+            )
+        if response_cache is not None:
+            cache_stats = response_cache.stats()
+            stats_text += (
+                f"\n\n🗃️ **Caché de respuestas:**\n"
+                f"• Aciertos: {cache_stats['hits']}\n"
+                f"• Fallos: {cache_stats['misses']}\n"
+                f"• Tasa de acierto: {cache_stats['hit_rate']:.0%}"
+            )
+        rate_limiter = context.bot.rate_limiter
+        if isinstance(rate_limiter, OutboundRateLimiter):
+            limiter_stats = rate_limiter.stats()
+            stats_text += (
+                f"\n\n🚦 **Envíos a Telegram:**\n"
+                f"• Demorados por el limitador: {limiter_stats['throttled']}\n"
+                f"• RetryAfter recibidos: {limiter_stats['retry_after']}"
+            )
         await safe_send_message(update, stats_text, get_main_keyboard())
     except Exception as e:
         logger.error(f"Error generando estadísticas para usuario {user.id}: {e}")
@@ -386,7 +855,7 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        reset_history(user.id)
+        await reset_history(user.id)
         await safe_send_message(
             update,
             "🧹 **Chat reiniciado**\n\nContexto borrado exitosamente.\n\n✨ Empecemos de nuevo.",
@@ -437,7 +906,7 @@ async def config_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 temp = float(value)
                 if 0.0 <= temp <= 2.0:
                     config["temperature"] = temp
-                    user_configs[user.id] = config
+                    save_user_config(user.id, config)
                     desc = '🎨 Más creativo' if temp > 1.0 else '🎯 Más preciso' if temp < 0.5 else '⚖️ Equilibrado'
                     await safe_send_message(
                         update,
@@ -460,8 +929,8 @@ async def config_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif setting == "modelo":
             if value in VALID_OPENAI_MODELS:
                 config["model"] = value
-                user_configs[user.id] = config
-                desc = "Más inteligente" if value == "gpt-4o" else "Rápido y económico" if value == "gpt-4o-mini" else "Básico y económico"
+                save_user_config(user.id, config)
+                desc = "Automático según el mensaje" if value == AUTO_MODEL else "Más inteligente" if value == "gpt-4o" else "Rápido y económico" if value == "gpt-4o-mini" else "Básico y económico"
                 await safe_send_message(
                     update,
                     f"✅ **Modelo actualizado**\n\n🧠 **Modelo:** {value}\n📊 **Tipo:** {desc}",
@@ -479,7 +948,7 @@ async def config_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 tokens = int(value)
                 if 100 <= tokens <= 4000:
                     config["max_tokens"] = tokens
-                    user_configs[user.id] = config
+                    save_user_config(user.id, config)
                     length = "cortas" if tokens <= 500 else "medianas" if tokens <= 1000 else "largas" if tokens <= 2000 else "muy largas"
                     await safe_send_message(
                         update,
@@ -525,10 +994,10 @@ async def mode_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         config = get_user_config(user.id)
         
         if text in RESPONSE_MODES:
+            inflight_completions.cancel(user.id, "mode")
             old_mode = config["mode"]
             config["mode"] = text
-            user_configs[user.id] = config
-            update_system_prompt(user.id)
+            save_user_config(user.id, config)
             
             mode_description = RESPONSE_MODES[text]
             await safe_send_message(
@@ -636,7 +1105,8 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "**Selecciona un modelo:**\n\n"
             "🧠 **gpt-4o** - Más inteligente y capaz\n"
             "⚡ **gpt-4o-mini** - Rápido y económico\n"
-            "🔷 **gpt-3.5-turbo** - Básico y económico\n\n"
+            "🔷 **gpt-3.5-turbo** - Básico y económico\n"
+            "🚦 **auto** - El más rápido que pueda con cada mensaje\n\n"
             "💡 gpt-4o es más capaz pero usa más tokens",
             parse_mode='Markdown',
             reply_markup=get_model_keyboard()
@@ -665,11 +1135,11 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     # Opciones de temperatura
-    elif text in ["🔥 0.1", "🌡️ 0.5", "🌡️ 0.7", "🌡️ 1.0", "🌡️ 1.5", "🔥 2.0"]:
+    elif text in TEMPERATURE_BUTTONS:
         temp_value = float(text.split()[-1])
         config = get_user_config(user.id)
         config["temperature"] = temp_value
-        user_configs[user.id] = config
+        save_user_config(user.id, config)
         
         temp_desc = "🎨 Creativo" if temp_value > 1.0 else "🎯 Preciso" if temp_value < 0.5 else "⚖️ Equilibrado"
         await update.message.reply_text(
@@ -681,13 +1151,13 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     # Opciones de modelo
-    elif text in ["🧠 gpt-4o", "⚡ gpt-4o-mini", "🔷 gpt-3.5-turbo"]:
+    elif text in MODEL_BUTTONS:
         model_value = text.split()[-1]
         config = get_user_config(user.id)
         config["model"] = model_value
-        user_configs[user.id] = config
+        save_user_config(user.id, config)
         
-        model_desc = "Más inteligente y capaz" if model_value == "gpt-4o" else "Rápido y económico" if model_value == "gpt-4o-mini" else "Básico y económico"
+        model_desc = "El más rápido que pueda con cada mensaje" if model_value == AUTO_MODEL else "Más inteligente y capaz" if model_value == "gpt-4o" else "Rápido y económico" if model_value == "gpt-4o-mini" else "Básico y económico"
         await update.message.reply_text(
             f"✅ **Modelo actualizado**\n\n"
             f"🧠 **Nuevo modelo:** {model_value}\n"
@@ -697,11 +1167,11 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     # Opciones de tokens
-    elif text in ["📏 500", "📏 1000", "📏 2000", "📏 4000"]:
+    elif text in TOKEN_BUTTONS:
         tokens_value = int(text.split()[-1])
         config = get_user_config(user.id)
         config["max_tokens"] = tokens_value
-        user_configs[user.id] = config
+        save_user_config(user.id, config)
         
         length_desc = "cortas" if tokens_value <= 500 else "medianas" if tokens_value <= 1000 else "largas" if tokens_value <= 2000 else "muy largas"
         await update.message.reply_text(
@@ -734,6 +1204,9 @@ async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     text = update.message.text.strip()
+    if message_debouncer is not None:
+        # Mensajes enviados seguidos justo después de este: un solo turno
+        text = message_debouncer.take(user.id, update.message.message_id) or text
     if not text:
         return
 
@@ -741,10 +1214,6 @@ async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         history = get_history(user.id)
         history.append({"role": "user", "content": text})
-        
-        # Recortar historial si es muy largo
-        history = trim_history(history)
-        conversations[user.id] = history
     except Exception as e:
         logger.error(f"Error manejando historial para usuario {user.id}: {e}")
         await safe_send_message(
@@ -768,12 +1237,12 @@ async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not is_valid:
             logger.warning(f"Configuración inválida para usuario {user.id}: {validation_msg}")
             # Resetear a configuración por defecto
-            user_configs[user.id] = {
+            save_user_config(user.id, {
                 "mode": "😊 Casual",
                 "temperature": 0.7,
                 "model": "gpt-4o-mini",
                 "max_tokens": 500
-            }
+            })
             config = get_user_config(user.id)
             await safe_send_message(
                 update,
@@ -787,25 +1256,73 @@ async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Llamada a OpenAI con manejo de errores robusto
+    # Prefijo estable (instrucciones, modo, documentos fijados) y fragmentos para esta pregunta
+    document_names: List[str] = []
+    document_context = None
     try:
-        resp = client.chat.completions.create(
-            model=config["model"],
-            messages=history,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            timeout=30  # Timeout de 30 segundos
+        await document_retriever.load_user(user.id)
+        document_names = document_retriever.document_names(user.id)
+        document_context = build_document_context(user.id, text)
+    except Exception as e:
+        logger.error(f"Error recuperando fragmentos de documentos para usuario {user.id}: {e}")
+    prefix = build_prompt_prefix(config["mode"], document_names)
+    if config["model"] == AUTO_MODEL:
+        # Solo para este turno: la configuración guardada sigue en "auto"
+        config = {**config, "model": route_model(user.id, config, prefix, history, document_context)}
+    extra_tokens = sum(count_message_tokens(msg, config["model"]) for msg in prefix)
+    if document_context:
+        extra_tokens += count_message_tokens(document_context, config["model"])
+
+    # Recortar historial al presupuesto de tokens del modelo elegido
+    try:
+        history = trim_history(history, config["model"], config["max_tokens"], extra_tokens)
+        save_history(user.id, history)
+    except Exception as e:
+        logger.error(f"Error recortando historial para usuario {user.id}: {e}")
+    messages = assemble_messages(prefix, history, document_context)
+
+    # Caché de respuestas exactas (solo configuraciones deterministas)
+    cache_key = None
+    if response_cache is not None and config["temperature"] <= RESPONSE_CACHE_MAX_TEMPERATURE:
+        cache_key = response_cache.make_key(
+            config["model"], config["mode"], config["temperature"], config["max_tokens"], messages
         )
+
+    # Llamada a OpenAI con manejo de errores robusto
+    placeholder = None
+    try:
+        answer = response_cache.get(cache_key) if cache_key else None
+        if answer is not None:
+            logger.info(f"Respuesta servida desde caché para usuario {user.id}")
+        else:
+            # En su propia tarea: un reinicio, un cambio de modo o una pregunta nueva la cancelan
+            completion = inflight_completions.start(user.id, limited_completion(update, config, messages))
+            answer, placeholder = await completion.result()
+            
+            if answer and cache_key:
+                response_cache.put(cache_key, answer)
         
-        answer = (resp.choices[0].message.content or "").strip()
         if not answer:
             answer = "🤔 La IA no generó una respuesta. Intenta reformular tu pregunta."
         
-        logger.info(f"Respuesta generada para usuario {user.id}: {len(answer)} caracteres | Modo: {config['mode']} | Modelo: {config['model']}")
+        # Log de alto volumen: muestreable con LOG_SAMPLE_RATE
+        logger.info(
+            f"Respuesta generada para usuario {user.id}: {len(answer)} caracteres | Modo: {config['mode']} | Modelo: {config['model']}",
+            extra={"sampled": True, "user_id": user.id, "chars": len(answer), "mode": config["mode"], "model": config["model"]}
+        )
         
         # Añadir respuesta al historial
         history.append({"role": "assistant", "content": answer})
-        conversations[user.id] = history
+        save_history(user.id, history)
+        
+        # Resumir en segundo plano los turnos antiguos si la conversación crece demasiado
+        if conversation_compactor is not None:
+            conversation_compactor.schedule(user.id, history, config["model"], config["max_tokens"])
+        
+    except CompletionSuperseded as e:
+        # La respuesta ya no sirve: ni se guarda en el historial ni se envía
+        logger.info(f"Respuesta para usuario {user.id} descartada ({e.reason})")
+        return
         
     except openai.RateLimitError as e:
         error_msg = await handle_openai_error(e, user.id)
@@ -843,12 +1360,66 @@ async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Enviar respuesta con manejo de errores
     try:
-        success = await safe_send_message(update, answer, get_main_keyboard())
+        success = False
+        if placeholder is not None:
+            success = await finalize_streamed_message(update, placeholder, answer)
+            if not success:
+                try:
+                    await placeholder.delete()
+                except Exception:
+                    pass
+        if not success:
+            success = await send_long_message(update, answer, get_main_keyboard())
         if not success:
             logger.error(f"No se pudo enviar respuesta a usuario {user.id} después de varios intentos")
     except Exception as e:
         logger.error(f"Error crítico enviando respuesta a usuario {user.id}: {e}")
 
+async def load_document(document: Document, context: ContextTypes.DEFAULT_TYPE) -> Tuple[bool, str, Optional[str]]:
+    """
+    Obtiene el texto de un documento de Telegram usando la caché de extracción.
+    
+    Primero busca por file_unique_id (un reenvío no se descarga); si no, descarga,
+    busca por hash del contenido (el mismo archivo subido de nuevo no se procesa)
+    y solo si ambas fallan ejecuta la extracción y guarda el resultado.
+    
+    Returns:
+        Tuple[bool, str, Optional[str]]: mismo formato que DocumentHandler.process_document
+    """
+    filename = document.file_name
+    signature = document_handler.extraction_signature()
+    
+    if document_cache is not None:
+        cached = await asyncio.to_thread(document_cache.get_by_file_id, document.file_unique_id, signature)
+        if cached is not None:
+            logger.info(f"Documento {filename} servido desde caché (file_unique_id)")
+            return True, cached.coverage, cached.content
+    
+    # Descargar archivo
+    extension = Path(filename).suffix.lower().lstrip('.') or "none"
+    with document_download_seconds.time(extension=extension):
+        file = await context.bot.get_file(document.file_id)
+        file_bytes = bytes(await file.download_as_bytearray())
+    
+    cache_key = None
+    if document_cache is not None:
+        cache_key = await asyncio.to_thread(document_cache.content_key, file_bytes, signature)
+        cached = await asyncio.to_thread(document_cache.get, cache_key)
+        if cached is not None:
+            await asyncio.to_thread(document_cache.link, document.file_unique_id, cache_key)
+            logger.info(f"Documento {filename} servido desde caché (hash de contenido)")
+            return True, cached.coverage, cached.content
+    
+    # Procesar documento
+    success, message, content = await document_handler.process_document(file_bytes, filename)
+    
+    if success and cache_key is not None:
+        await asyncio.to_thread(
+            document_cache.put, cache_key, document.file_unique_id,
+            CachedDocument(filename, message, content)
+        )
+    return success, message, content
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja documentos enviados por los usuarios."""
     user = update.effective_user
@@ -895,38 +1466,33 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Indicador de procesamiento
         await update.message.chat.send_action(action=ChatAction.TYPING)
         
-        # Descargar archivo
-        file = await context.bot.get_file(document.file_id)
-        file_bytes = await file.download_as_bytearray()
-        
-        # Procesar documento
-        success, message, content = await document_handler.process_document(bytes(file_bytes), filename)
+        # Descargar y procesar (o recuperar de la caché)
+        success, message, content = await load_document(document, context)
         
         if not success:
             await safe_send_message(update, message, get_main_keyboard())
             return
         
-        # Documento procesado exitosamente
-        logger.info(f"Documento procesado para usuario {user.id}: {filename} ({len(content)} chars)")
+        # Documento procesado exitosamente (message describe la cobertura)
+        coverage = message
+        logger.info(f"Documento procesado para usuario {user.id}: {filename} ({len(content)} chars) | {coverage}")
         
-        # Agregar el contenido al contexto
-        history = get_history(user.id)
+        # Indexar el documento: en cada pregunta se inyectan solo los fragmentos relevantes
+        index = await document_retriever.index_document(user.id, filename, content)
+        await asyncio.to_thread(conversation_store.save_document, user.id, filename, content)
+        await asyncio.to_thread(conversation_store.prune_documents, user.id, document_retriever.document_names(user.id))
         
-        # Crear mensaje con el contenido del documento
-        doc_message = f"[Usuario envió el documento '{filename}'. Contenido del documento:\n\n{content}\n\n]"
-        history.append({"role": "user", "content": doc_message})
-        
-        # Pedir al usuario qué quiere hacer con el documento
+        # El documento no se anota en el historial: queda fijado en el prefijo del
+        # prompt (ver build_prompt_prefix) y sus fragmentos se inyectan con cada pregunta
         prompt = "He procesado tu documento. ¿Qué te gustaría saber sobre él? Puedes pedirme:\n- Resumen del contenido\n- Responder preguntas específicas\n- Extraer información particular\n- Traducir el documento\n- Analizar datos (si es Excel/CSV)"
-        history.append({"role": "assistant", "content": prompt})
-        
-        conversations[user.id] = history
         
         await safe_send_message(
             update,
             f"✅ **Documento procesado**\n\n"
             f"📄 {filename}\n"
-            f"📝 {len(content)} caracteres extraídos\n\n"
+            f"📝 {len(content)} caracteres extraídos\n"
+            f"🧩 {len(index.chunks)} fragmentos indexados\n"
+            f"📖 {coverage}\n\n"
             f"{prompt}",
             get_main_keyboard()
         )
@@ -941,6 +1507,147 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             get_main_keyboard()
         )
 
+async def warmup_openai_client():
+    """Abre conexiones con OpenAI antes del primer mensaje (TLS + keep-alive)."""
+    if OPENAI_WARMUP_CONNECTIONS <= 0:
+        return
+    
+    start_time = time.perf_counter()
+    results = await asyncio.gather(
+        *(client.models.list() for _ in range(OPENAI_WARMUP_CONNECTIONS)),
+        return_exceptions=True
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    
+    if failures:
+        # No es crítico: el pool abrirá las conexiones con el primer mensaje
+        logger.warning(f"⚠️ Calentamiento de OpenAI incompleto ({len(failures)}/{len(results)} fallos): {failures[0]}")
+    else:
+        logger.info(f"🔥 Pool de OpenAI calentado: {len(results)} conexiones en {elapsed_ms:.0f} ms")
+
+async def warmup_token_counter():
+    """Carga los codificadores de tiktoken de los modelos configurados en un hilo."""
+    # Incluye "auto": route_model() cuenta los tokens antes de elegir el modelo
+    models = [OPENAI_MODEL, *VALID_OPENAI_MODELS, *model_router.candidates]
+    if conversation_compactor is not None:
+        models.append(conversation_compactor.model)
+    models = list(dict.fromkeys(models))
+
+    start_time = time.perf_counter()
+    loaded = await asyncio.to_thread(warmup_encodings, models)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    logger.info(f"🔤 Codificadores de tokens listos: {loaded}/{len(models)} modelos en {elapsed_ms:.0f} ms")
+
+def register_metric_collectors(application: Application):
+    """Gauges que se leen de las estructuras existentes en cada consulta de /metrics."""
+    registry.add_collector(
+        "bot_update_queue_depth", "Actualizaciones de Telegram encoladas sin procesar",
+        application.update_queue.qsize
+    )
+    if isinstance(application.update_processor, PerUserUpdateProcessor):
+        registry.add_collector(
+            "bot_updates_in_progress", "Actualizaciones en curso o esperando el turno de su usuario",
+            application.update_processor.pending_updates
+        )
+        registry.add_collector(
+            "bot_updates_admitted", "Actualizaciones admitidas sin terminar (tope MAX_PENDING_UPDATES)",
+            application.update_processor.admitted_updates
+        )
+    registry.add_collector(
+        "bot_store_cached_sessions", "Sesiones (historial y configuración) en la caché de RAM",
+        conversation_store.cached_sessions
+    )
+    registry.add_collector(
+        "bot_store_users", "Usuarios con sesión guardada", conversation_store.count_users
+    )
+    if response_cache is not None:
+        registry.add_collector(
+            "bot_response_cache_entries", "Respuestas en la caché de respuestas exactas",
+            lambda: response_cache.stats()["entries"]
+        )
+    if conversation_compactor is not None:
+        registry.add_collector(
+            "bot_compactions_in_progress", "Resúmenes de conversación generándose en segundo plano",
+            lambda: conversation_compactor.in_progress
+        )
+
+async def on_startup(application: Application):
+    """Se ejecuta una vez antes de empezar a recibir actualizaciones."""
+    conversation_store.start()
+    if METRICS_ENABLED:
+        register_metric_collectors(application)
+        await metrics_server.start()
+    # Independientes: la red de OpenAI y la carga de tiktoken se solapan
+    await asyncio.gather(warmup_openai_client(), warmup_token_counter())
+    report_startup_time()
+
+def report_startup_time():
+    """Registra el arranque en frío: desde las importaciones hasta empezar a recibir actualizaciones."""
+    ready = time.perf_counter() - _IMPORT_STARTED
+    startup_seconds.set(IMPORT_SECONDS, phase="imports")
+    startup_seconds.set(ready, phase="ready")
+    logger.info(f"⏱️ Arranque en frío: listo en {ready:.2f}s (importaciones {IMPORT_SECONDS:.2f}s)")
+
+async def on_shutdown(application: Application):
+    """Libera los recursos compartidos al detener el bot."""
+    await metrics_server.stop()
+    if conversation_compactor is not None:
+        await conversation_compactor.close()
+    await client.close()
+    logger.info("🔌 Pool de conexiones de OpenAI cerrado")
+    document_handler.shutdown()
+    await conversation_store.close()
+
+def build_application(base_url: Optional[str] = None, base_file_url: Optional[str] = None,
+                      rate_limit: bool = TELEGRAM_RATE_LIMIT_ENABLED) -> Application:
+    """
+    Crea la aplicación de Telegram con sus handlers.
+    
+    Args:
+        base_url: URL alternativa de la Bot API (p. ej. un servidor falso en benchmarks)
+        base_file_url: URL alternativa de descarga de archivos
+        rate_limit: Pasar los envíos por el limitador de Telegram
+    """
+    update_processor = PerUserUpdateProcessor(
+        MAX_CONCURRENT_UPDATES, message_debouncer, cancel_superseded_completion, MAX_PENDING_UPDATES
+    )
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(update_processor)
+        # Contrapresión: la cola solo entrega actualizaciones con el procesador por debajo
+        # de MAX_PENDING_UPDATES; llena, el webhook tarda en responder y el polling espera
+        .update_queue(AdmissionQueue(update_processor, maxsize=UPDATE_QUEUE_SIZE))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    if rate_limit:
+        # Todos los envíos (respuestas, ediciones, acciones de chat) pasan por el limitador
+        builder = builder.rate_limiter(OutboundRateLimiter())
+    app = builder.build()
+
+    # Antes que cualquier otro handler: un fallo de caché no lee SQLite en el event loop
+    app.add_handler(TypeHandler(Update, preload_session), group=-1)
+
+    # Comandos
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("reset", reset))
+    app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("config", config_command))
+
+    # Manejo de documentos
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    
+    # Manejo de botones y chat general
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_buttons))
+    return app
+
 def main():
     """Función principal con manejo de errores robusto."""
     try:
@@ -951,30 +1658,27 @@ def main():
         
         # Crear aplicación Telegram
         logger.info("📱 Creando aplicación Telegram...")
-        app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-        logger.info("✅ Aplicación Telegram creada")
-
-        # Registrar comandos
-        logger.info("📋 Registrando comandos...")
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(CommandHandler("reset", reset))
-        app.add_handler(CommandHandler("help", help_command))
-        app.add_handler(CommandHandler("stats", stats_command))
-        app.add_handler(CommandHandler("config", config_command))
-
-        # Manejo de documentos
-        app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
-        
-        # Manejo de botones y chat general
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_buttons))
-        logger.info("✅ Handlers registrados exitosamente")
+        app = build_application()
+        logger.info("✅ Aplicación Telegram creada y handlers registrados")
 
         logger.info("🤖 Chat Bot con OpenAI iniciado")
         logger.info(f"🔒 Usuarios autorizados: {len([id for id in [1, 2] if is_user_authorized(id)])}")
         logger.info("🚀 Bot ejecutándose... (Ctrl+C para detener)")
         
         # Iniciar bot
-        app.run_polling()
+        if WEBHOOK_ENABLED:
+            # El servidor de PTB registra el webhook con el secreto y valida la
+            # cabecera X-Telegram-Bot-Api-Secret-Token de cada petición
+            app.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET_TOKEN or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            app.run_polling()
         
     except KeyboardInterrupt:
         logger.info("⏹️ Bot detenido por el usuario")
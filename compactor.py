@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compactación de conversaciones: los turnos antiguos se sustituyen por un resumen
+generado en segundo plano, fuera del camino de la respuesta al usuario.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from openai import AsyncOpenAI
+
+from config.settings import (
+    setup_rotating_logger, MAX_HISTORY_MESSAGES, MAX_PROMPT_TOKENS, COMPACTION_MODEL,
+    COMPACTION_TRIGGER_TOKENS, COMPACTION_KEEP_RECENT, COMPACTION_SUMMARY_TOKENS
+)
+from metrics import conversation_compactions_total, openai_request_seconds, openai_tokens_total
+from storage import conversation_store
+from token_counter import count_message_tokens, get_prompt_budget
+
+logger = setup_rotating_logger("compactor", "compactor.log")
+
+# El resumen es un mensaje de sistema al principio del historial (el system
+# prompt no se guarda en el historial: se antepone en cada petición)
+SUMMARY_PREFIX = "📝 Resumen de la conversación anterior:\n"
+
+SUMMARY_INSTRUCTIONS = (
+    "Resume la conversación entre el usuario y el asistente para que el asistente pueda "
+    "continuarla sin el texto original. Conserva hechos, datos, nombres, decisiones, "
+    "preferencias del usuario y preguntas pendientes; omite saludos y rodeos. Si hay un "
+    "resumen anterior, intégralo. Escribe en el idioma de la conversación, en prosa breve "
+    "o viñetas, sin introducciones."
+)
+
+# Fracción del presupuesto de prompt (tokens o MAX_HISTORY_MESSAGES) que dispara el resumen
+TRIGGER_RATIO = 0.75
+
+# Caracteres de cada mensaje que entran en la transcripción a resumir
+MAX_TRANSCRIPT_CHARS_PER_MESSAGE = 4000
+
+def is_summary_message(message: dict) -> bool:
+    return message.get("role") == "system" and (message.get("content") or "").startswith(SUMMARY_PREFIX)
+
+def pinned_prefix_length(history: List[dict]) -> int:
+    """Mensajes fijos al principio del historial: el resumen, si lo hay."""
+    return 1 if history and is_summary_message(history[0]) else 0
+
+def format_transcript(messages: List[dict]) -> str:
+    """Convierte los turnos a resumir en una transcripción de texto."""
+    speakers = {"user": "Usuario", "assistant": "Asistente"}
+    lines = []
+    for message in messages:
+        content = (message.get("content") or "").strip()
+        if len(content) > MAX_TRANSCRIPT_CHARS_PER_MESSAGE:
+            content = content[:MAX_TRANSCRIPT_CHARS_PER_MESSAGE] + " [...]"
+        lines.append(f"{speakers.get(message['role'], message['role'])}: {content}")
+    return "\n\n".join(lines)
+
+class ConversationCompactor:
+    """
+    Resume en segundo plano la parte antigua de las conversaciones largas.
+
+    Tras cada respuesta, schedule() comprueba si el historial pasa del umbral y,
+    si es así, lanza una tarea que resume los turnos anteriores a los
+    keep_recent más recientes. El resultado se aplica sobre el historial vivo
+    solo si esos turnos siguen ahí (un /reset o un recorte mientras tanto lo
+    descartan), de modo que el historial queda como:
+
+        [resumen, ...turnos recientes literales]
+
+    Las peticiones de resumen comparten con el chat el tope de completions en curso.
+    """
+
+    def __init__(self, client: AsyncOpenAI, slots: asyncio.Semaphore, model: str = COMPACTION_MODEL,
+                 trigger_tokens: int = COMPACTION_TRIGGER_TOKENS, keep_recent: int = COMPACTION_KEEP_RECENT,
+                 summary_tokens: int = COMPACTION_SUMMARY_TOKENS):
+        """
+        Args:
+            client: Cliente de OpenAI compartido con el bot
+            slots: Semáforo de completions en curso del bot
+            model: Modelo que escribe los resúmenes
+            trigger_tokens: Tokens de los turnos a partir de los que se resume
+            keep_recent: Mensajes recientes que se conservan literales
+            summary_tokens: Longitud máxima del resumen
+        """
+        self.client = client
+        self.slots = slots
+        self.model = model
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = max(2, keep_recent)
+        self.summary_tokens = summary_tokens
+        self.trigger_messages = max(self.keep_recent + 2, int(MAX_HISTORY_MESSAGES * TRIGGER_RATIO))
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def needs_compaction(self, history: List[dict], model: str, max_tokens: int) -> bool:
+        """
+        Los turnos (sin el resumen) pasan del umbral de mensajes o
+        de tokens y hay turnos antiguos que resumir. El resumen no cuenta para no
+        volver a compactar en cada turno si el resumen ya es largo.
+        """
+        turns = history[pinned_prefix_length(history):]
+        if len(turns) < self.keep_recent + 2:
+            return False
+        if len(history) >= self.trigger_messages:
+            return True
+        budget = get_prompt_budget(model, max_tokens, MAX_PROMPT_TOKENS)
+        threshold = min(self.trigger_tokens, int(budget * TRIGGER_RATIO))
+        return sum(count_message_tokens(message, model) for message in turns) > threshold
+
+    def schedule(self, user_id: int, history: List[dict], model: str, max_tokens: int) -> bool:
+        """Lanza la compactación en segundo plano si hace falta y no hay otra en curso."""
+        if user_id in self._tasks or not self.needs_compaction(history, model, max_tokens):
+            return False
+        task = asyncio.create_task(self._run(user_id))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+        return True
+
+    def _forget(self, user_id: int, task: asyncio.Task):
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+
+    def cancel(self, user_id: int):
+        """Cancela la compactación en curso del usuario (p. ej. al reiniciar el chat)."""
+        task = self._tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    @property
+    def in_progress(self) -> int:
+        return len(self._tasks)
+
+    async def _run(self, user_id: int):
+        try:
+            await self.compact(user_id)
+        except asyncio.CancelledError:
+            conversation_compactions_total.inc(outcome="cancelled")
+            raise
+        except Exception as e:
+            conversation_compactions_total.inc(outcome="error")
+            logger.error(f"Error compactando la conversación del usuario {user_id}: {e}")
+
+    async def compact(self, user_id: int, keep_recent: Optional[int] = None) -> bool:
+        """
+        Resume los turnos antiguos del usuario y los sustituye en su historial.
+
+        Args:
+            user_id: Usuario cuya conversación se compacta
+            keep_recent: Mensajes recientes que se conservan literales (por defecto self.keep_recent)
+
+        Returns:
+            bool: True si el historial se compactó
+        """
+        keep_recent = self.keep_recent if keep_recent is None else keep_recent
+        history = conversation_store.get_history(user_id)
+        if not history:
+            return False
+        start = pinned_prefix_length(history)
+        older = history[start:len(history) - keep_recent]
+        if not older:
+            return False
+        previous_summary = history[0]["content"][len(SUMMARY_PREFIX):] if start else None
+
+        summary = await self._summarize(previous_summary, older)
+        if not summary:
+            conversation_compactions_total.inc(outcome="empty")
+            return False
+
+        # El historial pudo cambiar mientras se resumía: aplicar solo si los turnos siguen ahí
+        current = conversation_store.get_history(user_id)
+        if not current or pinned_prefix_length(current) != start or current[start:start + len(older)] != older:
+            conversation_compactions_total.inc(outcome="discarded")
+            logger.info(f"Compactación descartada para usuario {user_id}: el historial cambió")
+            return False
+
+        # En el sitio: las peticiones en curso guardan esta misma lista al terminar
+        current[:start + len(older)] = [{"role": "system", "content": SUMMARY_PREFIX + summary}]
+        conversation_store.set_history(user_id, current)
+        conversation_compactions_total.inc(outcome="ok")
+        logger.info(f"🗜️ Conversación del usuario {user_id} compactada: {len(older)} mensajes -> resumen de {len(summary)} caracteres")
+        return True
+
+    async def _summarize(self, previous_summary: Optional[str], messages: List[dict]) -> str:
+        """Pide el resumen a OpenAI registrando latencia y tokens como el resto de peticiones."""
+        prompt = format_transcript(messages)
+        if previous_summary:
+            prompt = f"Resumen anterior:\n{previous_summary}\n\nConversación posterior:\n{prompt}"
+        labels = {"model": self.model, "mode": "compaction"}
+        start_time = time.perf_counter()
+        async with self.slots:
+            resp = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.2,
+                max_tokens=self.summary_tokens
+            )
+        openai_request_seconds.observe(time.perf_counter() - start_time, stream="false", **labels)
+        if resp.usage is not None:
+            openai_tokens_total.inc(resp.usage.prompt_tokens, kind="prompt", **labels)
+            openai_tokens_total.inc(resp.usage.completion_tokens, kind="completion", **labels)
+        return (resp.choices[0].message.content or "").strip()
+
+    async def close(self):
+        """Cancela las compactaciones pendientes (al detener el bot)."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
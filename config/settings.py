@@ -1,7 +1,13 @@
 import os
+import json
+import ipaddress
+import atexit
+import queue
+import random
 import logging
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -12,13 +18,42 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 LOGS_DIR = BASE_DIR / "logs"
 LOGS_DIR.mkdir(exist_ok=True)
 
+def env_flag(name: str, default: str = "false") -> bool:
+    """Lee una variable de entorno booleana (true/false, 1/0, si/no)."""
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "si", "sí", "on")
+
 # Configuración general
 LOG_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_ASYNC = env_flag("LOG_ASYNC", "true")  # Escritura de logs en un hilo aparte (cola + listener)
+LOG_JSON = env_flag("LOG_JSON", "false")  # Logs estructurados en JSON (una línea por registro)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # Fracción conservada de los logs muestreables (1.0 = todos)
 
 # Telegram
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
 
+# Métricas (formato de texto de Prometheus en un puerto local)
+METRICS_ENABLED = env_flag("METRICS_ENABLED", "false")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip()  # Dirección del endpoint /metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Puerto del endpoint /metrics
+
+# Limitador de envíos a Telegram (token buckets global y por chat)
+TELEGRAM_RATE_LIMIT_ENABLED = env_flag("TELEGRAM_RATE_LIMIT_ENABLED", "true")
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # Peticiones por segundo de todo el bot (Telegram: ~30)
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1.0"))  # Peticiones por segundo a un chat privado
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))  # Ráfaga permitida por chat
+TELEGRAM_CHAT_EDIT_RATE = float(os.getenv("TELEGRAM_CHAT_EDIT_RATE", "1.0"))  # Ediciones por segundo en un chat (bucket aparte de los mensajes)
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))  # Peticiones por minuto a un grupo
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "2"))  # Reintentos tras un RetryAfter
+
+# Modo webhook (alternativa a long-polling): servidor de python-telegram-bot[webhooks]
+WEBHOOK_ENABLED = env_flag("WEBHOOK_ENABLED", "false")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0").strip()  # Dirección en la que escuchar
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))  # Puerto en el que escuchar
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip()  # Ruta del webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()  # URL pública registrada en Telegram (obligatoria en modo webhook)
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "").strip()  # Secreto de la cabecera X-Telegram-Bot-Api-Secret-Token (obligatorio salvo escuchando en loopback)
+
 # OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
@@ -26,10 +61,75 @@ SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", (
     "Eres un asistente útil en español. Responde de forma breve, clara y amable."
 )).strip()
 
+# Cliente HTTP de OpenAI (pool de conexiones keep-alive compartido)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))  # Segundos por petición
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))  # Conexiones simultáneas máximas
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))  # Conexiones inactivas reutilizables
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))  # Segundos antes de cerrar una conexión inactiva
+OPENAI_WARMUP_CONNECTIONS = int(os.getenv("OPENAI_WARMUP_CONNECTIONS", "2"))  # Conexiones abiertas al arrancar (0 = sin calentamiento)
+
 # Configuración del chat
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "800"))  # Valor por defecto actualizado a 800
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))  # Valor por defecto actualizado a 0.7
 MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", "100"))  # Valor por defecto actualizado a 100
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "0"))  # Tope de tokens del prompt (0 = ventana completa del modelo)
+
+# Streaming de respuestas (edición progresiva del mensaje en Telegram)
+STREAM_RESPONSES = env_flag("STREAM_RESPONSES", "true")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # Segundos mínimos entre ediciones
+STREAM_MIN_CHARS_PER_EDIT = int(os.getenv("STREAM_MIN_CHARS_PER_EDIT", "40"))  # Caracteres nuevos mínimos para editar
+
+# Caché de respuestas exactas (opcional, solo con temperatura baja)
+RESPONSE_CACHE_ENABLED = env_flag("RESPONSE_CACHE_ENABLED", "false")
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0.3"))  # Temperatura máxima cacheable
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # Segundos de validez
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))  # Respuestas guardadas como máximo
+
+# Compactación de conversaciones (resumen en segundo plano de los turnos antiguos)
+COMPACTION_ENABLED = env_flag("COMPACTION_ENABLED", "true")
+COMPACTION_MODEL = os.getenv("COMPACTION_MODEL", "gpt-4o-mini")  # Modelo que escribe los resúmenes
+COMPACTION_TRIGGER_TOKENS = int(os.getenv("COMPACTION_TRIGGER_TOKENS", "6000"))  # Tokens del historial que disparan el resumen
+COMPACTION_KEEP_RECENT = int(os.getenv("COMPACTION_KEEP_RECENT", "6"))  # Mensajes recientes que se conservan literales
+COMPACTION_SUMMARY_TOKENS = int(os.getenv("COMPACTION_SUMMARY_TOKENS", "500"))  # Longitud máxima del resumen
+
+# Modelo automático (opción "auto" del menú 🧠 Modelo: se elige un modelo en cada turno)
+AUTO_MODEL_CANDIDATES = [m.strip() for m in os.getenv("AUTO_MODEL_CANDIDATES", "gpt-3.5-turbo,gpt-4o-mini,gpt-4o").split(",") if m.strip()]  # De menor a mayor capacidad
+AUTO_MODEL_LONG_QUESTION_TOKENS = int(os.getenv("AUTO_MODEL_LONG_QUESTION_TOKENS", "300"))  # Preguntas más largas no van al modelo más básico
+AUTO_MODEL_LATENCY_HALF_LIFE = float(os.getenv("AUTO_MODEL_LATENCY_HALF_LIFE", "300"))  # Segundos en que una latencia medida pierde la mitad de su peso frente a la supuesta
+
+# Concurrencia (actualizaciones en paralelo entre usuarios, en orden dentro de cada usuario)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "256"))  # Actualizaciones en curso como máximo
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "2000"))  # Admitidas sin terminar (en curso o esperando turno); 0 = sin límite
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", os.getenv("WEBHOOK_QUEUE_SIZE", "1000")))  # Recibidas esperando a ser admitidas; llena, el webhook y el polling esperan
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # Completions de OpenAI en curso como máximo
+
+# Debounce del chat (mensajes seguidos de un usuario -> un solo turno)
+CHAT_DEBOUNCE_SECONDS = float(os.getenv("CHAT_DEBOUNCE_SECONDS", "0"))  # Silencio que cierra la ráfaga (0 = desactivado; p. ej. 1.5)
+CHAT_DEBOUNCE_MAX_WAIT = float(os.getenv("CHAT_DEBOUNCE_MAX_WAIT", "6"))  # Espera máxima desde el primer mensaje
+
+# Procesamiento de documentos (pool de procesos)
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", str(min(4, os.cpu_count() or 1))))  # Procesos de extracción
+DOC_MAX_PENDING_JOBS = int(os.getenv("DOC_MAX_PENDING_JOBS", "16"))  # Tope global de documentos en proceso (en curso + en cola del pool)
+DOC_PARSE_TIMEOUT = float(os.getenv("DOC_PARSE_TIMEOUT", "60"))  # Segundos máximos por documento
+DOC_MAX_CHARS = int(os.getenv("DOC_MAX_CHARS", "30000"))  # Presupuesto de caracteres extraídos (~8000 tokens)
+EXCEL_MAX_ROWS_PER_SHEET = int(os.getenv("EXCEL_MAX_ROWS_PER_SHEET", "5000"))  # Filas leídas como máximo por hoja
+EXCEL_MAX_COLUMNS = int(os.getenv("EXCEL_MAX_COLUMNS", "50"))  # Columnas leídas como máximo por fila
+
+# Recuperación de fragmentos de documentos (índice BM25 por usuario)
+DOC_CHUNK_CHARS = int(os.getenv("DOC_CHUNK_CHARS", "1200"))  # Tamaño de cada fragmento
+DOC_RETRIEVAL_TOP_K = int(os.getenv("DOC_RETRIEVAL_TOP_K", "4"))  # Fragmentos inyectados por pregunta
+DOC_MAX_DOCS_PER_USER = int(os.getenv("DOC_MAX_DOCS_PER_USER", "5"))  # Documentos indexados por usuario
+
+# Caché en disco del texto extraído de documentos
+DOC_CACHE_ENABLED = env_flag("DOC_CACHE_ENABLED", "true")
+DOC_CACHE_DIR = Path(os.getenv("DOC_CACHE_DIR", str(BASE_DIR / "cache" / "documents")))
+DOC_CACHE_MAX_MB = int(os.getenv("DOC_CACHE_MAX_MB", "200"))  # Tamaño máximo en disco
+DOC_CACHE_MAX_ENTRIES = int(os.getenv("DOC_CACHE_MAX_ENTRIES", "2000"))  # Documentos máximos
+
+# Almacenamiento persistente de conversaciones (SQLite en modo WAL)
+STORE_DB_PATH = Path(os.getenv("STORE_DB_PATH", str(BASE_DIR / "data" / "bot.sqlite3")))
+STORE_CACHE_SIZE = int(os.getenv("STORE_CACHE_SIZE", "1000"))  # Sesiones de usuario mantenidas en RAM
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "2.0"))  # Segundos entre escrituras diferidas
 
 # Control de acceso
 AUTHORIZED_USER_IDS = os.getenv("AUTHORIZED_USER_IDS", "").strip()
@@ -42,29 +142,135 @@ def ensure_config():
         missing.append("TELEGRAM_BOT_TOKEN")
     if not OPENAI_API_KEY:
         missing.append("OPENAI_API_KEY")
+    if WEBHOOK_ENABLED and not WEBHOOK_URL:
+        missing.append("WEBHOOK_URL")
     if missing:
         raise RuntimeError(
             "Faltan variables de entorno: " + ", ".join(missing)
         )
+    if WEBHOOK_ENABLED and not WEBHOOK_SECRET_TOKEN and not is_loopback_address(WEBHOOK_LISTEN):
+        # Sin secreto cualquiera que llegue al puerto podría enviar actualizaciones
+        # falsas con el user_id de un usuario autorizado
+        raise RuntimeError(
+            f"WEBHOOK_SECRET_TOKEN es obligatorio con el webhook escuchando en {WEBHOOK_LISTEN} "
+            "(o usa WEBHOOK_LISTEN=127.0.0.1 detrás de un proxy que lo valide)"
+        )
     print("✅ Configuración validada")
     print(f"📁 Directorio base: {BASE_DIR}")
     print(f"📝 Directorio de logs: {LOGS_DIR}")
     print(f"🤖 Modelo: {OPENAI_MODEL}")
     print(f"🔒 Usuarios autorizados: {'Todos' if not AUTHORIZED_USERS else len(AUTHORIZED_USERS)}")
 
+def is_loopback_address(host: str) -> bool:
+    """La dirección solo es accesible desde la propia máquina."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
 def is_user_authorized(user_id: int) -> bool:
     """Verifica si un usuario está autorizado a usar el bot."""
     if not AUTHORIZED_USERS:  # Si no hay restricciones, todos pueden usar
         return True
     return user_id in AUTHORIZED_USERS
 
-def setup_rotating_logger(logger_name: str, log_file: str = "bot.log") -> logging.Logger:
+# Atributos estándar de un LogRecord (el resto son campos extra del registro)
+_STANDARD_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sampled", "log_route"}
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON, incluyendo los campos pasados en extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS:
+                payload[key] = value
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Conserva solo una fracción de los registros marcados como muestreables.
+
+    Se marcan con extra={"sampled": True}; los avisos y errores nunca se descartan.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and record.levelno < logging.WARNING:
+            return random.random() < self.rate
+        return True
+
+# Modo cola: todos los loggers comparten una cola y un único hilo (QueueListener),
+# que reparte cada registro a los handlers del logger que lo emitió
+_LOG_QUEUE: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_LOG_ROUTES: Dict[str, List[logging.Handler]] = {}
+_LOG_LISTENER: Optional[QueueListener] = None
+
+class _RoutedQueueHandler(QueueHandler):
+    """Encola los registros marcados con el logger configurado que los recibe."""
+
+    def __init__(self, route: str):
+        super().__init__(_LOG_QUEUE)
+        self.route = route
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        # Los registros de loggers hijos llegan con su propio nombre: se enrutan por el padre
+        record.log_route = self.route
+        return record
+
+class _LogRouter(logging.Handler):
+    """Handler del listener: entrega cada registro a los handlers de su logger (archivo y consola)."""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in _LOG_ROUTES.get(getattr(record, "log_route", record.name), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+def _start_log_listener():
+    global _LOG_LISTENER
+    if _LOG_LISTENER is None:
+        _LOG_LISTENER = QueueListener(_LOG_QUEUE, _LogRouter())
+        _LOG_LISTENER.start()
+
+def stop_log_listener():
+    """Vacía la cola de logs y detiene su hilo."""
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        _LOG_LISTENER.stop()
+        _LOG_LISTENER = None
+
+atexit.register(stop_log_listener)
+
+def setup_rotating_logger(logger_name: str, log_file: str = "bot.log", use_queue: Optional[bool] = None,
+                          json_format: Optional[bool] = None, sample_rate: Optional[float] = None) -> logging.Logger:
     """
     Configura un logger con rotación automática de archivos.
     
+    En modo cola el logger solo encola los registros y un único hilo en segundo
+    plano (QueueListener), compartido por todos los loggers, escribe en el archivo
+    y en la consola de cada uno, así la escritura y la rotación no bloquean el
+    event loop.
+    
     Args:
         logger_name: Nombre del logger
         log_file: Nombre del archivo de log
+        use_queue: Escribir desde un hilo aparte (None = LOG_ASYNC)
+        json_format: Salida en JSON (None = LOG_JSON)
+        sample_rate: Fracción conservada de los registros muestreables (None = LOG_SAMPLE_RATE)
         
     Returns:
         Logger configurado con rotación
@@ -76,6 +282,11 @@ def setup_rotating_logger(logger_name: str, log_file: str = "bot.log") -> loggin
     if logger.handlers:
         return logger
     
+    use_queue = LOG_ASYNC if use_queue is None else use_queue
+    json_format = LOG_JSON if json_format is None else json_format
+    sample_rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+    
     # Handler con rotación: máximo 10MB por archivo, mantener 5 backups
     log_path = LOGS_DIR / log_file
     file_handler = RotatingFileHandler(
@@ -84,13 +295,22 @@ def setup_rotating_logger(logger_name: str, log_file: str = "bot.log") -> loggin
         backupCount=5,
         encoding='utf-8'
     )
-    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    file_handler.setFormatter(formatter)
     
     # Handler para consola
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    console_handler.setFormatter(formatter)
+    
+    # El muestreo se aplica antes de encolar, así los registros descartados no cuestan nada
+    if sample_rate < 1.0:
+        logger.addFilter(SamplingFilter(sample_rate))
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if use_queue:
+        _LOG_ROUTES[logger_name] = [file_handler, console_handler]
+        _start_log_listener()
+        logger.addHandler(_RoutedQueueHandler(logger_name))
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
     
     return logger
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Agrupación (debounce) de mensajes seguidos de un mismo usuario: varios mensajes
+escritos en pocos segundos se responden como un único turno.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config.settings import setup_rotating_logger, CHAT_DEBOUNCE_SECONDS, CHAT_DEBOUNCE_MAX_WAIT
+from metrics import messages_coalesced_total
+
+logger = setup_rotating_logger("debouncer", "debouncer.log")
+
+# Textos agrupados pendientes de recoger por chat() como máximo
+MAX_MERGED_TEXTS = 1000
+
+# Un mensaje que acaba así se da por completo y cierra la ráfaga sin esperar
+SENTENCE_END = (".", "?", "!", "…")
+
+class MessageBurst:
+    """Mensajes de un usuario que esperan a que se cierre la ventana."""
+    __slots__ = ("leader_id", "texts", "first_arrival", "last_arrival", "flushed")
+
+    def __init__(self, leader_id: int, text: str, now: float):
+        self.leader_id = leader_id
+        self.texts: List[str] = [text]
+        self.first_arrival = now
+        self.last_arrival = now
+        self.flushed = asyncio.Event()
+
+class MessageDebouncer:
+    """
+    Une los mensajes de texto que un usuario envía seguidos en un único turno.
+
+    El primer mensaje de una ráfaga es el "líder": ocupa su sitio en la cola del
+    usuario y, al llegarle el turno, espera hasta que pasen window segundos sin
+    mensajes nuevos (como mucho max_wait desde el primero). Los mensajes que
+    llegan mientras tanto se absorben en el líder sin pasar por la cola, y chat()
+    recoge el texto unido con take().
+
+    La ráfaga se cierra antes si un mensaje acaba en puntuación de final de frase
+    o si llega una actualización que no se agrupa (un botón, un comando, un
+    documento): esta llegó después del líder, así que se procesa después que él,
+    y los mensajes posteriores ya abren una ráfaga nueva.
+    """
+
+    def __init__(self, accepts: Callable[[object], bool], window: float = CHAT_DEBOUNCE_SECONDS,
+                 max_wait: float = CHAT_DEBOUNCE_MAX_WAIT):
+        """
+        Args:
+            accepts: Indica si una actualización es un mensaje de texto agrupable
+            window: Segundos sin mensajes nuevos que cierran la ráfaga
+            max_wait: Segundos como máximo desde el primer mensaje de la ráfaga
+        """
+        self.accepts = accepts
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self._pending: Dict[int, MessageBurst] = {}
+        self._merged: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+
+    def absorb(self, user_id: int, update) -> Optional[MessageBurst]:
+        """
+        Registra un mensaje agrupable.
+
+        Returns:
+            Optional[MessageBurst]: None si se unió a una ráfaga abierta (la
+            actualización no debe procesarse); si no, la ráfaga nueva que encabeza
+        """
+        message = update.message
+        now = asyncio.get_running_loop().time()
+        burst = self._pending.get(user_id)
+        if burst is None:
+            burst = self._pending[user_id] = MessageBurst(message.message_id, message.text, now)
+        else:
+            burst.texts.append(message.text)
+            burst.last_arrival = now
+            messages_coalesced_total.inc()
+        if message.text.rstrip().endswith(SENTENCE_END):
+            self.flush(user_id)
+        return burst if len(burst.texts) == 1 else None
+
+    def flush(self, user_id: int):
+        """
+        Cierra ya la ráfaga abierta del usuario. Deja de aceptar mensajes en el
+        acto (el líder conserva su referencia hasta que le llega el turno).
+        """
+        burst = self._pending.pop(user_id, None)
+        if burst is not None:
+            burst.flushed.set()
+
+    async def wait(self, user_id: int, burst: MessageBurst):
+        """El líder espera a que se cierre la ventana y deja el texto unido para chat()."""
+        loop = asyncio.get_running_loop()
+        try:
+            while not burst.flushed.is_set():
+                deadline = min(burst.last_arrival + self.window, burst.first_arrival + self.max_wait)
+                delay = deadline - loop.time()
+                if delay <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(burst.flushed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass  # Pudo llegar otro mensaje: se recalcula el plazo
+        finally:
+            if self._pending.get(user_id) is burst:
+                del self._pending[user_id]
+
+        if len(burst.texts) > 1:
+            self._merged[(user_id, burst.leader_id)] = "\n".join(burst.texts)
+            while len(self._merged) > MAX_MERGED_TEXTS:
+                self._merged.popitem(last=False)
+            logger.info(f"🧲 {len(burst.texts)} mensajes del usuario {user_id} agrupados en un turno")
+
+    def take(self, user_id: int, message_id: int) -> Optional[str]:
+        """Texto unido de la ráfaga cuyo líder es message_id (None si no se agrupó nada)."""
+        return self._merged.pop((user_id, message_id), None)
+
+    @property
+    def pending_users(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché en disco del texto extraído de documentos.
+Evita volver a descargar y procesar archivos que los usuarios reenvían.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from config.settings import (
+    setup_rotating_logger, DOC_CACHE_ENABLED, DOC_CACHE_DIR, DOC_CACHE_MAX_MB, DOC_CACHE_MAX_ENTRIES
+)
+
+logger = setup_rotating_logger("document-cache", "document-cache.log")
+
+class CachedDocument(NamedTuple):
+    """Resultado de extracción guardado en caché."""
+    filename: str
+    coverage: str
+    content: str
+
+class DocumentCache:
+    """
+    Caché LRU en disco del texto extraído, direccionada por contenido.
+
+    Cada entrada se guarda como un JSON cuyo nombre es el hash SHA-256 del archivo
+    combinado con la firma de extracción (presupuesto, topes de Excel...), de modo
+    que cambiar la configuración invalida las entradas antiguas. Además se guarda
+    un índice file_unique_id -> clave para que un reenvío desde Telegram no tenga
+    que descargarse. La expulsión es LRU por número de entradas y tamaño total;
+    el orden LRU sobrevive a reinicios a través del mtime de los archivos.
+
+    Los métodos hacen E/S de disco: desde el bot se llaman con asyncio.to_thread.
+    """
+
+    INDEX_FILE = "file_ids.json"
+
+    def __init__(self, cache_dir: Path = DOC_CACHE_DIR, max_bytes: int = DOC_CACHE_MAX_MB * 1024 * 1024,
+                 max_entries: int = DOC_CACHE_MAX_ENTRIES):
+        """
+        Inicializa la caché y reconstruye el orden LRU desde disco.
+
+        Args:
+            cache_dir: Directorio de la caché
+            max_bytes: Tamaño total máximo en disco
+            max_entries: Número máximo de documentos
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # clave -> bytes (orden LRU)
+        self._file_ids: Dict[str, str] = {}  # file_unique_id -> clave
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Carga las entradas existentes ordenadas por último acceso."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            if path.name == self.INDEX_FILE:
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        index_path = self.cache_dir / self.INDEX_FILE
+        if index_path.exists():
+            try:
+                file_ids = json.loads(index_path.read_text(encoding="utf-8"))
+                self._file_ids = {fid: key for fid, key in file_ids.items() if key in self._entries}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Índice de caché de documentos ilegible, se descarta: {e}")
+
+        logger.info(f"Caché de documentos: {len(self._entries)} entradas, {self._total_bytes / (1024 * 1024):.1f} MB")
+
+    @staticmethod
+    def _signature_hash(signature: str) -> str:
+        return hashlib.sha256(signature.encode("utf-8")).hexdigest()[:12]
+
+    @classmethod
+    def content_key(cls, file_bytes: bytes, signature: str) -> str:
+        """Clave de caché: hash del contenido más la firma de extracción."""
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+        return f"{content_hash}-{cls._signature_hash(signature)}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[CachedDocument]:
+        """Busca un documento por clave de contenido."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)  # Conserva el orden LRU entre reinicios
+        except (OSError, ValueError) as e:
+            logger.warning(f"Entrada de caché {key} ilegible, se descarta: {e}")
+            with self._lock:
+                self._remove(key)
+            return None
+        return CachedDocument(data["filename"], data["coverage"], data["content"])
+
+    def get_by_file_id(self, file_unique_id: str, signature: str) -> Optional[CachedDocument]:
+        """Busca un documento por el file_unique_id de Telegram (sin descargarlo)."""
+        with self._lock:
+            key = self._file_ids.get(file_unique_id)
+        if key is None or not key.endswith(f"-{self._signature_hash(signature)}"):
+            return None
+        return self.get(key)
+
+    def link(self, file_unique_id: str, key: str):
+        """Asocia un file_unique_id a una entrada existente."""
+        with self._lock:
+            if key in self._entries and self._file_ids.get(file_unique_id) != key:
+                self._file_ids[file_unique_id] = key
+                self._save_index()
+
+    def put(self, key: str, file_unique_id: Optional[str], document: CachedDocument):
+        """Guarda un documento y expulsa las entradas menos usadas si hace falta."""
+        data = json.dumps(document._asdict(), ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"No se pudo guardar {document.filename} en la caché: {e}")
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries[key]
+            self._entries[key] = len(data)
+            self._entries.move_to_end(key)
+            self._total_bytes += len(data)
+            if file_unique_id:
+                self._file_ids[file_unique_id] = key
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        """Expulsa entradas LRU hasta cumplir los límites (requiere el lock)."""
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            logger.info(f"Caché de documentos: expulsada {key[:12]}")
+
+    def _remove(self, key: str):
+        """Elimina una entrada y sus alias (requiere el lock)."""
+        size = self._entries.pop(key, 0)
+        self._total_bytes -= size
+        self._file_ids = {fid: k for fid, k in self._file_ids.items() if k != key}
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"No se pudo borrar la entrada de caché {key}: {e}")
+
+    def _save_index(self):
+        """Persiste el índice de file_unique_id (requiere el lock)."""
+        index_path = self.cache_dir / self.INDEX_FILE
+        tmp_path = index_path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(self._file_ids), encoding="utf-8")
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el índice de la caché de documentos: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Tamaño actual de la caché."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes}
+
+# Instancia global (None si la caché está desactivada)
+document_cache = DocumentCache() if DOC_CACHE_ENABLED else None
@@ -8,46 +8,327 @@ Soporta PDF, Word, Excel y archivos de texto.
 import logging
 import io
 import csv
-from typing import Optional, Tuple
+import codecs
+import asyncio
+import time
+from importlib.util import find_spec
+from typing import Callable, NamedTuple, Optional, Tuple
 from pathlib import Path
-from config.settings import setup_rotating_logger
+from config.settings import (
+    setup_rotating_logger, DOC_WORKERS, DOC_MAX_PENDING_JOBS, DOC_PARSE_TIMEOUT, DOC_MAX_CHARS,
+    EXCEL_MAX_ROWS_PER_SHEET, EXCEL_MAX_COLUMNS
+)
+from metrics import document_parse_seconds, documents_in_flight
+from process_pool import IsolatedProcessPool, WorkerCrashedError
 
-# Importaciones opcionales (se verifican al usar)
-try:
+# Bibliotecas de formato opcionales: solo se comprueba que estén instaladas.
+# Se importan la primera vez que llega un documento de ese tipo, así el
+# arranque del bot (que atiende sobre todo texto) no paga su importación
+PDF_AVAILABLE = find_spec("PyPDF2") is not None
+DOCX_AVAILABLE = find_spec("docx") is not None
+EXCEL_AVAILABLE = find_spec("openpyxl") is not None
+
+logger = setup_rotating_logger("document-handler", "document-handler.log")
+
+# ============================================================================
+# EXTRACTORES (se ejecutan en los procesos del pool, deben ser funciones de módulo)
+# ============================================================================
+
+class ExtractionResult(NamedTuple):
+    """Texto extraído y qué parte del documento se llegó a leer."""
+    text: str
+    units_read: int
+    units_total: Optional[int]  # None si no se conoce sin leer todo
+    unit: str
+    truncated: bool  # Quedó texto sin leer por el presupuesto de caracteres o de filas
+    partial_unit: bool = False  # La última unidad leída se recortó por el presupuesto
+    column_limit: Optional[int] = None  # Columnas leídas si se descartaron las siguientes (Excel)
+    
+    def coverage(self) -> str:
+        """Describe la cobertura de la extracción para el usuario."""
+        if self.units_total is not None:
+            read = f"{self.units_read}/{self.units_total} {self.unit}"
+        else:
+            read = f"{self.units_read} {self.unit}"
+        notes = []
+        if self.truncated:
+            notes.append("documento truncado por longitud")
+        if self.column_limit is not None:
+            notes.append(f"solo las primeras {self.column_limit} columnas")
+        if not notes:
+            return f"Documento completo: {read}"
+        if self.partial_unit:
+            read += ", la última solo en parte"
+        return f"Leídas {read} ({'; '.join(notes)})"
+
+def _decode_text(file_bytes: bytes, max_chars: int) -> Tuple[str, int, bool]:
+    """
+    Decodifica como mucho max_chars caracteres sin decodificar el archivo entero.
+    
+    Returns:
+        Tuple[str, int, bool]: (texto, bytes consumidos, quedó texto sin leer)
+    """
+    # 4 bytes por carácter es el peor caso de UTF-8: el prefijo siempre alcanza
+    prefix = file_bytes[:max_chars * 4]
+    is_partial = len(prefix) < len(file_bytes)
+    
+    # Intentar diferentes codificaciones
+    encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+    
+    text = None
+    for encoding in encodings:
+        try:
+            # El decodificador incremental ignora una secuencia multibyte cortada al final
+            decoder = codecs.getincrementaldecoder(encoding)()
+            text = decoder.decode(prefix, final=not is_partial)
+            break
+        except UnicodeDecodeError:
+            continue
+    
+    if text is None:
+        # Si ninguna funciona, usar utf-8 con reemplazo de errores
+        encoding = 'utf-8'
+        text = prefix.decode('utf-8', errors='replace')
+    
+    if len(text) > max_chars:
+        text = text[:max_chars]
+        is_partial = True
+    consumed = len(text.encode(encoding, errors='replace')) if is_partial else len(file_bytes)
+    return text, consumed, is_partial
+
+def _process_pdf(file_bytes: bytes, filename: str, max_chars: int) -> ExtractionResult:
+    """Extrae texto de un PDF, página a página, hasta agotar el presupuesto."""
+    if not PDF_AVAILABLE:
+        raise ImportError("PyPDF2 no está instalado. Instala con: pip install PyPDF2")
     import PyPDF2  # type: ignore
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+    
+    pdf_file = io.BytesIO(file_bytes)
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    
+    text_content = []
+    total_chars = 0
+    num_pages = len(pdf_reader.pages)
+    pages_read = 0
+    
+    for page_num, page in enumerate(pdf_reader.pages, 1):
+        pages_read = page_num
+        text = page.extract_text()
+        if text.strip():
+            block = f"--- Página {page_num}/{num_pages} ---\n{text}\n"
+            text_content.append(block)
+            total_chars += len(block)
+        if total_chars >= max_chars:
+            break
+    
+    full_text = "\n".join(text_content)
+    
+    if not full_text.strip():
+        raise ValueError("No se pudo extraer texto del PDF")
+    
+    return ExtractionResult(full_text, pages_read, num_pages, "páginas", pages_read < num_pages)
+
+def _process_text(file_bytes: bytes, filename: str, max_chars: int) -> ExtractionResult:
+    """Procesa archivos de texto plano (solo decodifica lo que cabe en el presupuesto)."""
+    text, consumed, is_partial = _decode_text(file_bytes, max_chars)
+    return ExtractionResult(text, consumed, len(file_bytes), "bytes", is_partial)
 
-try:
+def _process_word(file_bytes: bytes, filename: str, max_chars: int) -> ExtractionResult:
+    """Extrae texto de documentos Word (párrafos y luego tablas) hasta agotar el presupuesto."""
+    if not DOCX_AVAILABLE:
+        raise ImportError("python-docx no está instalado. Instala con: pip install python-docx")
     import docx  # type: ignore
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
+    
+    doc_file = io.BytesIO(file_bytes)
+    doc = docx.Document(doc_file)
+    
+    text_content = []
+    total_chars = 0
+    paragraphs = doc.paragraphs
+    tables = doc.tables
+    blocks_total = len(paragraphs) + sum(len(table.rows) for table in tables)
+    blocks_read = 0
+    
+    def add_block(text: str) -> bool:
+        """Añade un bloque; devuelve True cuando se agota el presupuesto."""
+        nonlocal total_chars, blocks_read
+        blocks_read += 1
+        if text.strip():
+            text_content.append(text)
+            total_chars += len(text) + 2
+        return total_chars >= max_chars
+    
+    # Extraer párrafos y después tablas
+    budget_reached = False
+    for para in paragraphs:
+        if add_block(para.text):
+            budget_reached = True
+            break
+    
+    if not budget_reached:
+        for table in tables:
+            for row in table.rows:
+                if add_block(" | ".join([cell.text for cell in row.cells])):
+                    budget_reached = True
+                    break
+            if budget_reached:
+                break
+    
+    full_text = "\n\n".join(text_content)
+    
+    if not full_text.strip():
+        raise ValueError("No se pudo extraer texto del documento Word")
+    
+    return ExtractionResult(full_text, blocks_read, blocks_total, "párrafos/filas", blocks_read < blocks_total)
+
+def _trim_row(row: tuple) -> list:
+    """Convierte una fila a texto descartando las celdas vacías del final."""
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ""):
+        end -= 1
+    return [str(cell) if cell is not None else "" for cell in row[:end]]
 
-try:
+def _process_excel(file_bytes: bytes, filename: str, max_chars: int) -> ExtractionResult:
+    """
+    Extrae datos de archivos Excel en modo streaming, fila a fila, hasta agotar el presupuesto.
+    
+    El libro se abre en modo solo lectura: las filas se leen del XML a medida que
+    se iteran, sin construir el modelo de celdas completo, así que la memoria
+    depende de una fila y no del tamaño del libro.
+    
+    Las dimensiones guardadas en la hoja (<dimension>) no son fiables (otras
+    herramientas las dejan desfasadas), así que se descartan: se leen las filas
+    que hay de verdad y el total solo se conoce si se leyó el libro entero.
+    """
+    if not EXCEL_AVAILABLE:
+        raise ImportError("openpyxl no está instalado. Instala con: pip install openpyxl")
     import openpyxl  # type: ignore
-    EXCEL_AVAILABLE = True
-except ImportError:
-    EXCEL_AVAILABLE = False
+    
+    excel_file = io.BytesIO(file_bytes)
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    
+    try:
+        text_content = []
+        total_chars = 0
+        rows_read = 0
+        rows_truncated = False
+        wide_sheets = []
+        
+        for sheet_name in workbook.sheetnames:
+            sheet = workbook[sheet_name]
+            sheet.reset_dimensions()
+            text_content.append(f"\n=== Hoja: {sheet_name} ===\n")
+            
+            sheet_rows = 0
+            # Sin max_col: cada fila llega con todas sus celdas, así se detecta
+            # cualquier dato más allá de EXCEL_MAX_COLUMNS antes de recortarla
+            for row in sheet.iter_rows(values_only=True):
+                if sheet_rows >= EXCEL_MAX_ROWS_PER_SHEET:
+                    # Tope por hoja: se pasa a la siguiente
+                    text_content.append(f"[... Hoja truncada a {EXCEL_MAX_ROWS_PER_SHEET} filas ...]")
+                    rows_truncated = True
+                    break
+                if len(row) > EXCEL_MAX_COLUMNS and any(cell not in (None, "") for cell in row[EXCEL_MAX_COLUMNS:]):
+                    if sheet_name not in wide_sheets:
+                        wide_sheets.append(sheet_name)
+                row = row[:EXCEL_MAX_COLUMNS]
+                sheet_rows += 1
+                rows_read += 1
+                row_text = " | ".join(_trim_row(row))
+                if row_text.strip():
+                    text_content.append(row_text)
+                    total_chars += len(row_text) + 1
+                if total_chars >= max_chars:
+                    break
+            if total_chars >= max_chars:
+                # Sin dimensiones fiables no se sabe si quedaban filas: se da por truncado
+                rows_truncated = True
+                break
+        
+        for sheet_name in wide_sheets:
+            text_content.append(f"[... Hoja {sheet_name} truncada a {EXCEL_MAX_COLUMNS} columnas ...]")
+    finally:
+        # El modo solo lectura mantiene el ZIP abierto hasta cerrar el libro
+        workbook.close()
+    
+    full_text = "\n".join(text_content)
+    
+    if not full_text.strip():
+        raise ValueError("No se pudo extraer datos del archivo Excel")
+    
+    # Solo si se leyeron todas las filas se conoce el total
+    rows_total = None if rows_truncated else rows_read
+    return ExtractionResult(full_text, rows_read, rows_total, "filas", rows_truncated,
+                            column_limit=EXCEL_MAX_COLUMNS if wide_sheets else None)
 
-logger = setup_rotating_logger("document-handler", "document-handler.log")
+def _process_csv(file_bytes: bytes, filename: str, max_chars: int) -> ExtractionResult:
+    """Procesa archivos CSV, fila a fila, hasta agotar el presupuesto."""
+    # Decodificar solo el prefijo necesario (cada fila de salida es igual o más larga que la de entrada)
+    text_content, _, is_partial = _decode_text(file_bytes, max_chars)
+    
+    # Parsear CSV
+    csv_reader = csv.reader(io.StringIO(text_content))
+    
+    rows = []
+    total_chars = 0
+    budget_reached = False
+    for row in csv_reader:
+        row_text = " | ".join(row)
+        rows.append(row_text)
+        total_chars += len(row_text) + 1
+        if total_chars >= max_chars:
+            budget_reached = True
+            break
+    
+    if is_partial and not budget_reached and rows:
+        # La última fila puede estar cortada a mitad
+        rows.pop()
+    
+    # Con el archivo completo decodificado se conoce el total de filas
+    if is_partial:
+        rows_total = None
+        truncated = True
+    else:
+        rows_total = len(rows) + sum(1 for _ in csv_reader)
+        truncated = rows_total > len(rows)
+    return ExtractionResult("\n".join(rows), len(rows), rows_total, "filas", truncated)
+
+class DocumentTimeoutError(Exception):
+    """El documento superó el tiempo máximo de procesamiento."""
 
 class DocumentHandler:
-    """Procesa diferentes tipos de documentos."""
+    """
+    Procesa diferentes tipos de documentos.
+    
+    La extracción (CPU intensiva) se ejecuta en un pool de procesos acotado para
+    no bloquear el event loop del bot y aprovechar varios núcleos.
+    """
     
-    def __init__(self):
-        """Inicializa el manejador de documentos."""
+    def __init__(self, workers: int = DOC_WORKERS, max_pending_jobs: int = DOC_MAX_PENDING_JOBS,
+                 parse_timeout: float = DOC_PARSE_TIMEOUT, max_chars: int = DOC_MAX_CHARS):
+        """
+        Inicializa el manejador de documentos.
+        
+        Args:
+            workers: Procesos de extracción (0 = hilos del pool por defecto, sin procesos)
+            max_pending_jobs: Documentos admitidos a la vez; el resto espera turno
+            parse_timeout: Segundos máximos de extracción por documento
+            max_chars: Presupuesto de caracteres extraídos por documento
+        """
         self.max_file_size = 20 * 1024 * 1024  # 20 MB
         self.supported_extensions = {
-            'pdf': self._process_pdf,
-            'txt': self._process_text,
-            'docx': self._process_word,
-            'doc': self._process_word,
-            'xlsx': self._process_excel,
-            'xls': self._process_excel,
-            'csv': self._process_csv
+            'pdf': _process_pdf,
+            'txt': _process_text,
+            'docx': _process_word,
+            'doc': _process_word,
+            'xlsx': _process_excel,
+            'xls': _process_excel,
+            'csv': _process_csv
         }
+        self.workers = workers
+        self.max_chars = max_chars
+        self.parse_timeout = parse_timeout
+        self._pool: Optional[IsolatedProcessPool] = None
+        self._job_slots = asyncio.Semaphore(max(1, max_pending_jobs))
     
     def is_supported(self, filename: str) -> bool:
         """Verifica si el archivo es soportado."""
@@ -58,13 +339,26 @@ class DocumentHandler:
         """Retorna lista de formatos soportados."""
         return ", ".join([f".{ext}" for ext in self.supported_extensions.keys()])
     
-    async def process_document(self, file_bytes: bytes, filename: str) -> Tuple[bool, str, Optional[str]]:
+    def extraction_signature(self) -> str:
+        """Parámetros que determinan el texto extraído (forma parte de la clave de caché)."""
+        return f"v4|{self.max_chars}|{EXCEL_MAX_ROWS_PER_SHEET}|{EXCEL_MAX_COLUMNS}"
+    
+    async def process_document(self, file_bytes: bytes, filename: str, max_chars: Optional[int] = None) -> Tuple[bool, str, Optional[str]]:
         """
         Procesa un documento y extrae su contenido.
         
+        El presupuesto de caracteres se pasa a cada extractor, que deja de leer
+        páginas, párrafos o filas en cuanto lo alcanza.
+        
+        Args:
+            file_bytes: Contenido del archivo
+            filename: Nombre del archivo (determina el formato)
+            max_chars: Presupuesto de caracteres (por defecto DOC_MAX_CHARS)
+        
         Returns:
-            Tuple[bool, str, Optional[str]]: (éxito, mensaje, contenido_extraído)
+            Tuple[bool, str, Optional[str]]: (éxito, mensaje o cobertura de la extracción, contenido_extraído)
         """
+        max_chars = max_chars or self.max_chars
         try:
             # Verificar tamaño
             if len(file_bytes) > self.max_file_size:
@@ -77,160 +371,84 @@ class DocumentHandler:
             if extension not in self.supported_extensions:
                 return False, f"❌ Formato no soportado. Formatos válidos: {self.get_supported_formats()}", None
             
-            # Procesar según tipo
+            # Procesar según tipo (fuera del event loop)
             processor = self.supported_extensions[extension]
-            content = await processor(file_bytes, filename)
-            
+            start_time = time.perf_counter()
+            outcome = "error"
+            try:
+                with documents_in_flight.track_inprogress():
+                    result = await self._run_extractor(processor, file_bytes, filename, max_chars)
+                outcome = "ok"
+            except DocumentTimeoutError:
+                outcome = "timeout"
+                raise
+            finally:
+                document_parse_seconds.observe(time.perf_counter() - start_time, extension=extension, outcome=outcome)
+            
+            content = result.text
             if not content or len(content.strip()) == 0:
                 return False, "❌ No se pudo extraer texto del documento", None
             
-            # Limitar longitud del contenido
-            max_chars = 30000  # ~8000 tokens aproximadamente
+            # Los extractores paran al cruzar el presupuesto: recortar el sobrante.
+            # Si el recorte quita texto, la última unidad leída queda incompleta
             if len(content) > max_chars:
-                content = content[:max_chars] + "\n\n[... Documento truncado por longitud ...]"
+                content = content[:max_chars]
+                result = result._replace(truncated=True, partial_unit=True)
+            logger.info(f"Documento {filename} extraído en {time.perf_counter() - start_time:.2f}s | {result.coverage()}")
+            if result.truncated:
+                content += "\n\n[... Documento truncado por longitud ...]"
             
-            return True, f"✅ Documento procesado exitosamente ({len(content)} caracteres)", content
+            return True, result.coverage(), content
             
+        except DocumentTimeoutError:
+            logger.error(f"Tiempo agotado procesando documento {filename} ({self.parse_timeout:.0f}s)")
+            return False, f"⏰ El documento tardó demasiado en procesarse (máximo {self.parse_timeout:.0f}s)", None
         except Exception as e:
             logger.error(f"Error procesando documento {filename}: {e}")
             return False, f"❌ Error procesando documento: {str(e)}", None
     
-    async def _process_pdf(self, file_bytes: bytes, filename: str) -> str:
-        """Extrae texto de un PDF."""
-        if not PDF_AVAILABLE:
-            raise ImportError("PyPDF2 no está instalado. Instala con: pip install PyPDF2")
+    async def _run_extractor(self, processor: Callable[[bytes, str, int], ExtractionResult], file_bytes: bytes,
+                             filename: str, max_chars: int) -> ExtractionResult:
+        """
+        Ejecuta un extractor en el pool con límite de trabajos y timeout.
         
-        try:
-            pdf_file = io.BytesIO(file_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text_content = []
-            num_pages = len(pdf_reader.pages)
-            
-            for page_num, page in enumerate(pdf_reader.pages, 1):
-                text = page.extract_text()
-                if text.strip():
-                    text_content.append(f"--- Página {page_num}/{num_pages} ---\n{text}\n")
-            
-            full_text = "\n".join(text_content)
-            
-            if not full_text.strip():
-                raise ValueError("No se pudo extraer texto del PDF")
-            
-            return full_text
-            
-        except ImportError:
-            raise ImportError("PyPDF2 no está instalado. Instala con: pip install PyPDF2")
-        except Exception as e:
-            logger.error(f"Error procesando PDF {filename}: {e}")
-            raise
-    
-    async def _process_text(self, file_bytes: bytes, filename: str) -> str:
-        """Procesa archivos de texto plano."""
-        try:
-            # Intentar diferentes codificaciones
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings:
+        Cada trabajo ocupa su propio proceso (ver process_pool.py): si el timeout
+        vence se termina solo ese proceso, así un PDF atascado no hace fallar la
+        extracción de otros usuarios. Si el proceso muere durante el trabajo, el
+        documento se reintenta una vez en otro proceso. Al cancelar la tarea que
+        espera, su proceso se termina.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._job_slots:
+            if self.workers <= 0:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(None, processor, file_bytes, filename, max_chars),
+                    timeout=self.parse_timeout
+                )
+            
+            for attempt in range(2):
                 try:
-                    return file_bytes.decode(encoding)
-                except UnicodeDecodeError:
-                    continue
-            
-            # Si ninguna funciona, usar utf-8 con reemplazo de errores
-            return file_bytes.decode('utf-8', errors='replace')
-            
-        except Exception as e:
-            logger.error(f"Error procesando texto {filename}: {e}")
-            raise
+                    return await self._get_pool().run(processor, (file_bytes, filename, max_chars), self.parse_timeout)
+                except asyncio.TimeoutError:
+                    raise DocumentTimeoutError(filename)
+                except WorkerCrashedError:
+                    if attempt == 0:
+                        logger.warning(f"Proceso de extracción caído, reintentando {filename}")
+                        continue
+                    raise
     
-    async def _process_word(self, file_bytes: bytes, filename: str) -> str:
-        """Extrae texto de documentos Word."""
-        if not DOCX_AVAILABLE:
-            raise ImportError("python-docx no está instalado. Instala con: pip install python-docx")
-        
-        try:
-            doc_file = io.BytesIO(file_bytes)
-            doc = docx.Document(doc_file)
-            
-            text_content = []
-            
-            # Extraer párrafos
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    text_content.append(para.text)
-            
-            # Extraer tablas
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = " | ".join([cell.text for cell in row.cells])
-                    if row_text.strip():
-                        text_content.append(row_text)
-            
-            full_text = "\n\n".join(text_content)
-            
-            if not full_text.strip():
-                raise ValueError("No se pudo extraer texto del documento Word")
-            
-            return full_text
-            
-        except ImportError:
-            raise ImportError("python-docx no está instalado. Instala con: pip install python-docx")
-        except Exception as e:
-            logger.error(f"Error procesando Word {filename}: {e}")
-            raise
+    def _get_pool(self) -> IsolatedProcessPool:
+        """Crea el pool de procesos en el primer uso."""
+        if self._pool is None:
+            self._pool = IsolatedProcessPool(self.workers)
+            logger.info(f"Pool de documentos iniciado con {self.workers} procesos")
+        return self._pool
     
-    async def _process_excel(self, file_bytes: bytes, filename: str) -> str:
-        """Extrae datos de archivos Excel."""
-        if not EXCEL_AVAILABLE:
-            raise ImportError("openpyxl no está instalado. Instala con: pip install openpyxl")
-        
-        try:
-            excel_file = io.BytesIO(file_bytes)
-            workbook = openpyxl.load_workbook(excel_file, data_only=True)
-            
-            text_content = []
-            
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                text_content.append(f"\n=== Hoja: {sheet_name} ===\n")
-                
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join([str(cell) if cell is not None else "" for cell in row])
-                    if row_text.strip():
-                        text_content.append(row_text)
-            
-            full_text = "\n".join(text_content)
-            
-            if not full_text.strip():
-                raise ValueError("No se pudo extraer datos del archivo Excel")
-            
-            return full_text
-            
-        except ImportError:
-            raise ImportError("openpyxl no está instalado. Instala con: pip install openpyxl")
-        except Exception as e:
-            logger.error(f"Error procesando Excel {filename}: {e}")
-            raise
-    
-    async def _process_csv(self, file_bytes: bytes, filename: str) -> str:
-        """Procesa archivos CSV."""
-        try:
-            # Decodificar contenido
-            text_content = await self._process_text(file_bytes, filename)
-            
-            # Parsear CSV
-            csv_reader = csv.reader(io.StringIO(text_content))
-            
-            rows = []
-            for row in csv_reader:
-                rows.append(" | ".join(row))
-            
-            return "\n".join(rows)
-            
-        except Exception as e:
-            logger.error(f"Error procesando CSV {filename}: {e}")
-            raise
+    def shutdown(self):
+        """Cierra el pool de procesos (al detener el bot)."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
 # Instancia global
 document_handler = DocumentHandler()
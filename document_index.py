@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice léxico (BM25) de los documentos enviados por cada usuario.
+En lugar de reenviar el documento completo en cada turno, solo se inyectan
+los fragmentos más relevantes para la pregunta actual.
+"""
+
+import asyncio
+import math
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from config.settings import (
+    setup_rotating_logger, DOC_CHUNK_CHARS, DOC_RETRIEVAL_TOP_K, DOC_MAX_DOCS_PER_USER, STORE_CACHE_SIZE
+)
+from storage import conversation_store
+
+logger = setup_rotating_logger("document-index", "document-index.log")
+
+# Parámetros estándar de BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Palabras vacías frecuentes (sin tildes, tras normalizar)
+STOPWORDS = frozenset("""
+a al algo como con cual cuales de del desde donde el ella ellos en entre era es esa ese eso esta este esto
+fue ha hay la las le les lo los mas me mi mis muy no nos o para pero por que se si sin sobre su sus
+te tu un una uno unos unas y ya yo the of and to in is for on it that this with
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Normaliza (minúsculas, sin tildes) y separa en términos, sin palabras vacías."""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return [word for word in _WORD_RE.findall(normalized) if len(word) > 1 and word not in STOPWORDS]
+
+def chunk_text(text: str, chunk_chars: int = DOC_CHUNK_CHARS) -> List[str]:
+    """
+    Divide un texto en fragmentos de hasta chunk_chars caracteres.
+
+    Agrupa párrafos completos mientras quepan; un párrafo más largo que el
+    fragmento se corta por líneas y, en último caso, a longitud fija.
+    """
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= chunk_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            while len(line) > chunk_chars:
+                pieces.append(line[:chunk_chars])
+                line = line[chunk_chars:]
+            if line.strip():
+                pieces.append(line)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+class RetrievedChunk(NamedTuple):
+    """Fragmento recuperado para una pregunta."""
+    filename: str
+    position: int  # índice del fragmento dentro del documento
+    total: int
+    text: str
+    score: float
+
+class DocumentIndex:
+    """Índice BM25 de los fragmentos de un documento."""
+
+    def __init__(self, filename: str, text: str, chunk_chars: int = DOC_CHUNK_CHARS):
+        """Fragmenta el texto y precalcula frecuencias de términos."""
+        self.filename = filename
+        self.chunks = chunk_text(text, chunk_chars)
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freqs: Counter = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        n = len(self.chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def search(self, query_terms: List[str], top_k: int) -> List[RetrievedChunk]:
+        """Devuelve los top_k fragmentos con puntuación BM25 positiva."""
+        terms = [term for term in set(query_terms) if term in self.idf]
+        if not terms or not self.chunks:
+            return []
+
+        scored = []
+        for position, freqs in enumerate(self.term_freqs):
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (BM25_K1 + 1) / (tf + length_norm)
+            if score > 0:
+                scored.append((score, position))
+
+        scored.sort(reverse=True)
+        return [self._chunk(position, score) for score, position in scored[:top_k]]
+
+    def head(self, count: int) -> List[RetrievedChunk]:
+        """Primeros fragmentos del documento (cuando la pregunta no coincide con nada)."""
+        return [self._chunk(position, 0.0) for position in range(min(count, len(self.chunks)))]
+
+    def _chunk(self, position: int, score: float) -> RetrievedChunk:
+        return RetrievedChunk(self.filename, position, len(self.chunks), self.chunks[position], score)
+
+class DocumentRetriever:
+    """
+    Índices de documentos por usuario (al superar el límite se descarta el más antiguo).
+
+    Solo se mantienen en RAM los índices de los max_users usuarios más recientes;
+    el resto se reconstruye bajo demanda a partir del texto persistido (loader).
+    Desde el event loop, load_user() y index_document() hacen la lectura y el
+    cálculo de BM25 en un hilo; los demás métodos solo usan índices ya en RAM.
+    """
+
+    def __init__(self, top_k: int = DOC_RETRIEVAL_TOP_K, max_docs_per_user: int = DOC_MAX_DOCS_PER_USER,
+                 max_users: int = STORE_CACHE_SIZE, loader: Optional[Callable[[int], List[Tuple[str, str]]]] = None):
+        """
+        Args:
+            top_k: Fragmentos inyectados por pregunta
+            max_docs_per_user: Documentos indexados por usuario (se descarta el más antiguo)
+            max_users: Usuarios con índices en RAM
+            loader: Devuelve los documentos persistidos de un usuario como (nombre, texto)
+        """
+        self.top_k = top_k
+        self.max_docs_per_user = max_docs_per_user
+        self.max_users = max(1, max_users)
+        self.loader = loader
+        self._indexes: "OrderedDict[int, OrderedDict[str, DocumentIndex]]" = OrderedDict()
+
+    def _user_indexes(self, user_id: int) -> "OrderedDict[str, DocumentIndex]":
+        """Índices del usuario, reconstruidos desde el almacén si no están en RAM."""
+        user_indexes = self._indexes.get(user_id)
+        if user_indexes is not None:
+            self._indexes.move_to_end(user_id)
+            return user_indexes
+
+        return self._install(user_id, self._build_user_indexes(user_id))
+
+    def _build_user_indexes(self, user_id: int) -> "OrderedDict[str, DocumentIndex]":
+        """Lee los documentos persistidos del usuario y construye sus índices."""
+        user_indexes = OrderedDict()
+        if self.loader is not None:
+            for filename, text in self.loader(user_id)[-self.max_docs_per_user:]:
+                user_indexes[filename] = DocumentIndex(filename, text)
+        return user_indexes
+
+    def _install(self, user_id: int, user_indexes: "OrderedDict[str, DocumentIndex]") -> "OrderedDict[str, DocumentIndex]":
+        self._indexes[user_id] = user_indexes
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+        return user_indexes
+
+    async def load_user(self, user_id: int):
+        """Carga en RAM los índices del usuario sin bloquear el event loop."""
+        if user_id in self._indexes:
+            self._indexes.move_to_end(user_id)
+            return
+        user_indexes = await asyncio.to_thread(self._build_user_indexes, user_id)
+        # Mientras tanto pudo cargarlos otra tarea o vaciarlos un /reset
+        if user_id not in self._indexes:
+            self._install(user_id, user_indexes)
+
+    async def index_document(self, user_id: int, filename: str, text: str) -> DocumentIndex:
+        """Como add_document(), pero con la lectura y el cálculo de BM25 en un hilo."""
+        await self.load_user(user_id)
+        index = await asyncio.to_thread(DocumentIndex, filename, text)
+        return self._add_index(user_id, index)
+
+    def add_document(self, user_id: int, filename: str, text: str) -> DocumentIndex:
+        """Indexa un documento del usuario (reemplaza uno anterior con el mismo nombre)."""
+        return self._add_index(user_id, DocumentIndex(filename, text))
+
+    def _add_index(self, user_id: int, index: DocumentIndex) -> DocumentIndex:
+        user_indexes = self._user_indexes(user_id)
+        filename = index.filename
+        user_indexes.pop(filename, None)
+        user_indexes[filename] = index
+        while len(user_indexes) > self.max_docs_per_user:
+            dropped, _ = user_indexes.popitem(last=False)
+            logger.info(f"Usuario {user_id}: documento {dropped} retirado del índice")
+        return index
+
+    def document_names(self, user_id: int) -> List[str]:
+        """Nombres de los documentos indexados del usuario."""
+        return list(self._user_indexes(user_id).keys())
+
+    def has_documents(self, user_id: int) -> bool:
+        """Indica si el usuario tiene documentos indexados."""
+        return bool(self._user_indexes(user_id))
+
+    def clear(self, user_id: int):
+        """Elimina los documentos indexados del usuario."""
+        self._indexes[user_id] = OrderedDict()
+
+    def search(self, user_id: int, query: str) -> List[RetrievedChunk]:
+        """
+        Fragmentos relevantes para la pregunta, en el orden en que aparecen en cada documento.
+
+        Si todos los documentos del usuario caben en top_k fragmentos se incluyen
+        completos. Si la pregunta no comparte términos con ningún documento
+        (p. ej. "resúmelo"), se usa el comienzo del documento más reciente.
+        """
+        user_indexes = self._user_indexes(user_id)
+        if not user_indexes:
+            return []
+
+        if sum(len(index.chunks) for index in user_indexes.values()) <= self.top_k:
+            results = [chunk for index in user_indexes.values() for chunk in index.head(self.top_k)]
+        else:
+            query_terms = tokenize(query)
+            results = []
+            for index in user_indexes.values():
+                results.extend(index.search(query_terms, self.top_k))
+            results.sort(key=lambda chunk: chunk.score, reverse=True)
+            results = results[:self.top_k]
+
+        if not results:
+            latest = next(reversed(user_indexes.values()))
+            results = latest.head(self.top_k)
+
+        results.sort(key=lambda chunk: (chunk.filename, chunk.position))
+        return results
+
+def format_retrieved_chunks(chunks: List[RetrievedChunk]) -> str:
+    """Da formato a los fragmentos para inyectarlos en el prompt."""
+    parts = ["Fragmentos relevantes de los documentos enviados por el usuario:"]
+    for chunk in chunks:
+        parts.append(f"[{chunk.filename} · fragmento {chunk.position + 1}/{chunk.total}]\n{chunk.text}")
+    return "\n\n".join(parts)
+
+# Instancia global
+document_retriever = DocumentRetriever(loader=conversation_store.load_documents)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor HTTP/1.1 mínimo (asyncio, keep-alive, respuestas chunked) compartido
+por el endpoint de métricas y los servidores falsos de los benchmarks.
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qsl, unquote
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: str
+    headers: Dict[str, str]
+    body: bytes
+
+    def form(self) -> Dict[str, str]:
+        """Cuerpo como formulario urlencoded o JSON (valores como texto)."""
+        content_type = self.headers.get("content-type", "")
+        if "json" in content_type:
+            return {key: value if isinstance(value, str) else json.dumps(value)
+                    for key, value in json.loads(self.body or b"{}").items()}
+        return dict(parse_qsl(self.body.decode("utf-8"), keep_blank_values=True))
+
+    def json(self) -> dict:
+        return json.loads(self.body or b"{}")
+
+    def multipart(self) -> Dict[str, Tuple[Optional[str], bytes]]:
+        """Campos de un cuerpo multipart/form-data: nombre -> (nombre de archivo o None, contenido)."""
+        # Solo lo usan los benchmarks: fuera del arranque del bot
+        from email import policy
+        from email.parser import BytesParser
+
+        head = f"Content-Type: {self.headers.get('content-type', '')}\r\n\r\n".encode("latin-1")
+        message = BytesParser(policy=policy.HTTP).parsebytes(head + self.body)
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+        return fields
+
+# Cuerpo de respuesta: bytes completos o un iterador asíncrono (se envía chunked)
+Body = Union[bytes, AsyncIterator[bytes]]
+Response = Tuple[int, str, Body]  # (código, content-type, cuerpo)
+Handler = Callable[[Request], Awaitable[Response]]
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+def json_response(payload: object, status: int = 200) -> Response:
+    return status, "application/json", json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+def text_response(text: str, status: int = 200, content_type: str = "text/plain; charset=utf-8") -> Response:
+    return status, content_type, text.encode("utf-8")
+
+class MiniHTTPServer:
+    """
+    Atiende cada petición con handler. Sin TLS ni límites de tamaño: solo para
+    escuchar en direcciones locales (métricas, benchmarks).
+    """
+
+    def __init__(self, handler: Handler, host: str = "127.0.0.1", port: int = 0,
+                 idle_timeout: Optional[float] = None):
+        """
+        Args:
+            handler: Corrutina que recibe la petición y devuelve la respuesta
+            host: Dirección de escucha
+            port: Puerto (0 = uno libre, ver port tras start())
+            idle_timeout: Segundos que se espera cada línea de la petición (None = sin límite)
+        """
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _readline(self, reader: asyncio.StreamReader) -> bytes:
+        return await asyncio.wait_for(reader.readline(), self.idle_timeout)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await self._readline(reader)
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await self._readline(reader)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout) if length else b""
+                path, _, query = target.partition("?")
+                path = unquote(path)
+
+                try:
+                    status, content_type, payload = await self.handler(Request(method.upper(), path, query, headers, body))
+                except Exception as e:
+                    status, content_type, payload = json_response({"error": str(e)}, 500)
+
+                head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                if isinstance(payload, bytes):
+                    writer.write(f"{head}Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+                else:
+                    writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode("latin-1"))
+                    async for piece in payload:
+                        writer.write(f"{len(piece):X}\r\n".encode("latin-1") + piece + b"\r\n")
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
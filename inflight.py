@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Completions de OpenAI en curso por usuario, para poder cancelarlas cuando su
+respuesta deja de servir (reinicio del chat, cambio de modo o una pregunta nueva).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from config.settings import setup_rotating_logger
+from metrics import completions_cancelled_total
+
+logger = setup_rotating_logger("inflight", "inflight.log")
+
+class CompletionSuperseded(Exception):
+    """La completion se canceló porque otra acción del usuario la dejó obsoleta."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Completion cancelada ({reason})")
+        self.reason = reason
+
+class InFlightCompletion:
+    """Una completion en curso: la tarea que la ejecuta y, si se canceló, el motivo."""
+    __slots__ = ("user_id", "task", "reason")
+
+    def __init__(self, user_id: int, task: asyncio.Task):
+        self.user_id = user_id
+        self.task = task
+        self.reason: Optional[str] = None
+
+    async def result(self) -> Any:
+        """
+        Espera el resultado de la completion.
+
+        Raises:
+            CompletionSuperseded: si se canceló con InFlightCompletions.cancel()
+        """
+        try:
+            return await self.task
+        except asyncio.CancelledError:
+            if self.reason is None:
+                raise  # Cancelación de quien espera (p. ej. al detener el bot)
+            raise CompletionSuperseded(self.reason) from None
+
+class InFlightCompletions:
+    """
+    Registro de la completion en curso de cada usuario.
+
+    Cada completion corre en su propia tarea (incluida la espera por un hueco de
+    llm_slots), así cancelarla libera el hueco y la conexión sin cancelar el
+    handler que la espera: este recibe CompletionSuperseded y termina sin guardar
+    la respuesta en un historial que ya no es el suyo.
+    """
+
+    def __init__(self):
+        self._completions: Dict[int, InFlightCompletion] = {}
+
+    def start(self, user_id: int, coroutine: "Awaitable[Any]") -> InFlightCompletion:
+        """Lanza la completion del usuario en una tarea y la registra."""
+        completion = InFlightCompletion(user_id, asyncio.ensure_future(coroutine))
+        self._completions[user_id] = completion
+        completion.task.add_done_callback(lambda _: self._forget(completion))
+        return completion
+
+    def _forget(self, completion: InFlightCompletion):
+        if self._completions.get(completion.user_id) is completion:
+            del self._completions[completion.user_id]
+
+    def cancel(self, user_id: int, reason: str) -> bool:
+        """
+        Cancela la completion en curso del usuario, si la hay.
+
+        Returns:
+            bool: True si había una completion sin terminar y se canceló
+        """
+        completion = self._completions.pop(user_id, None)
+        if completion is None or not completion.task.cancel():
+            return False
+        completion.reason = reason
+        completions_cancelled_total.inc(reason=reason)
+        logger.info(f"⏹️ Completion en curso del usuario {user_id} cancelada ({reason})")
+        return True
+
+    @property
+    def in_progress(self) -> int:
+        return len(self._completions)
+
+# Instancia global
+inflight_completions = InFlightCompletions()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+División de respuestas largas en mensajes que respetan el límite de Telegram,
+sin romper bloques de código ni párrafos.
+"""
+
+import re
+from typing import List
+
+# Telegram limita los mensajes a 4096 unidades UTF-16 (los emojis cuentan doble)
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+_FENCE_RE = re.compile(r"^\s*(```+|~~~+)")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…:;])\s+")
+
+def telegram_length(text: str) -> int:
+    """Longitud del texto tal como la cuenta Telegram (unidades UTF-16)."""
+    return len(text.encode("utf-16-le")) // 2
+
+def _split_blocks(text: str) -> List[str]:
+    """
+    Separa el texto en bloques: párrafos (separados por líneas en blanco) y
+    bloques de código completos, que nunca se parten por sus líneas en blanco.
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    fence = None
+    for line in text.split("\n"):
+        match = _FENCE_RE.match(line)
+        if fence is None:
+            if match:
+                if current:
+                    blocks.append("\n".join(current))
+                    current = []
+                fence = match.group(1)
+                current.append(line)
+            elif line.strip():
+                current.append(line)
+            elif current:
+                blocks.append("\n".join(current))
+                current = []
+        else:
+            current.append(line)
+            if match and match.group(1).startswith(fence) and line.strip() == match.group(1):
+                blocks.append("\n".join(current))
+                current = []
+                fence = None
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+def _hard_split(text: str, limit: int) -> List[str]:
+    """Corta un texto sin saltos de línea: por frases, luego por palabras y, en último caso, a longitud fija."""
+    pieces: List[str] = []
+    for unit_re in (_SENTENCE_END_RE, re.compile(r"\s+")):
+        if telegram_length(text) <= limit:
+            break
+        pieces, current = [], ""
+        for unit in unit_re.split(text):
+            candidate = f"{current} {unit}" if current else unit
+            if current and telegram_length(candidate) > limit:
+                pieces.append(current)
+                current = unit
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+        if all(telegram_length(piece) <= limit for piece in pieces):
+            return pieces
+
+    result: List[str] = []
+    current: List[str] = []
+    current_length = 0
+    for char in text:
+        char_length = telegram_length(char)
+        if current_length + char_length > limit:
+            result.append("".join(current))
+            current, current_length = [], 0
+        current.append(char)
+        current_length += char_length
+    if current:
+        result.append("".join(current))
+    return result
+
+def _split_lines(lines: List[str], limit: int) -> List[str]:
+    """Agrupa líneas en trozos de hasta limit, cortando las líneas que no caben solas."""
+    pieces: List[str] = []
+    current = ""
+    for line in lines:
+        for part in (_hard_split(line, limit) if telegram_length(line) > limit else [line]):
+            candidate = f"{current}\n{part}" if current else part
+            if current and telegram_length(candidate) > limit:
+                pieces.append(current)
+                current = part
+            else:
+                current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _split_block(block: str, limit: int) -> List[str]:
+    """Parte un bloque que no cabe en un mensaje."""
+    lines = block.split("\n")
+    match = _FENCE_RE.match(lines[0])
+    if not match:
+        return _split_lines(lines, limit)
+
+    # Bloque de código: cada trozo se cierra y el siguiente reabre la misma cabecera (```python)
+    opening = lines[0].strip()
+    closing = match.group(1)
+    body = lines[1:-1] if len(lines) > 1 and lines[-1].strip() == closing else lines[1:]
+    overhead = telegram_length(opening) + telegram_length(closing) + 2
+    return [f"{opening}\n{piece}\n{closing}" for piece in _split_lines(body, max(1, limit - overhead))]
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Divide un texto en el menor número de mensajes de hasta limit caracteres.
+
+    Empaqueta párrafos completos mientras quepan; un párrafo demasiado largo se
+    corta por líneas, frases o palabras, y un bloque de código se reparte entre
+    varios mensajes cerrando y reabriendo la valla (```), de modo que cada
+    mensaje sigue siendo Markdown válido.
+    """
+    if telegram_length(text) <= limit:
+        return [text]
+
+    chunks: List[str] = []
+    current = ""
+    for block in _split_blocks(text):
+        parts = [block] if telegram_length(block) <= limit else _split_block(block, limit)
+        for part in parts:
+            candidate = f"{current}\n\n{part}" if current else part
+            if current and telegram_length(candidate) > limit:
+                chunks.append(current)
+                current = part
+            else:
+                current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
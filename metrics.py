@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas del bot en formato de texto de Prometheus, servidas en un puerto local.
+Contadores, gauges e histogramas con etiquetas, sin dependencias externas.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from config.settings import setup_rotating_logger, METRICS_HOST, METRICS_PORT
+from http_server import MiniHTTPServer, Request, Response, text_response
+
+logger = setup_rotating_logger("metrics", "metrics.log")
+
+# Límites de los histogramas de latencia (segundos)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric(ABC):
+    """Base de las métricas: nombre, ayuda y nombres de etiquetas."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Líneas de valores en formato de texto de Prometheus."""
+
+class Counter(Metric):
+    """Valor que solo crece."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+class Gauge(Metric):
+    """Valor que sube y baja (p. ej. peticiones en curso)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        """Suma 1 mientras dura el bloque."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+class Histogram(Metric):
+    """Distribución de observaciones en buckets acumulativos, con suma y recuento."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0.0
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[position] += 1
+                break
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observa la duración del bloque (también si lanza una excepción)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas del proceso.
+
+    Además de las métricas que se actualizan al vuelo admite "colectores":
+    funciones que se evalúan en cada lectura para valores que ya existen en
+    otro sitio (tamaño de colas, sesiones en RAM...).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, name: str, documentation: str, callback: Callable[[], float]):
+        """Registra un gauge cuyo valor se calcula al leer las métricas."""
+        self._collectors[name] = (documentation, callback)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        for name, (documentation, callback) in self._collectors.items():
+            try:
+                value = callback()
+            except Exception as e:
+                logger.warning(f"Error leyendo la métrica {name}: {e}")
+                continue
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"])
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Expone GET /metrics con el servidor HTTP mínimo compartido (ver http_server.py)."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self._http = MiniHTTPServer(self._handle, host, port, idle_timeout=10)
+
+    async def start(self):
+        """Empieza a servir las métricas."""
+        await self._http.start()
+        logger.info(f"📈 Métricas en {self._http.url}/metrics")
+
+    async def stop(self):
+        """Deja de servir las métricas."""
+        await self._http.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        if request.method == "GET" and request.path in ("/metrics", "/"):
+            return text_response(self.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+        return text_response("not found\n", 404)
+
+# Instancias globales
+registry = MetricsRegistry()
+metrics_server = MetricsServer(registry)
+
+# OpenAI
+openai_request_seconds = registry.histogram(
+    "bot_openai_request_seconds", "Duración de las peticiones de chat a OpenAI", ("model", "mode", "stream"))
+openai_first_token_seconds = registry.histogram(
+    "bot_openai_first_token_seconds", "Tiempo hasta el primer token en streaming", ("model",))
+openai_tokens_total = registry.counter(
+    "bot_openai_tokens_total", "Tokens consumidos en OpenAI", ("model", "mode", "kind"))
+openai_errors_total = registry.counter(
+    "bot_openai_errors_total", "Errores de las peticiones a OpenAI", ("model", "error"))
+openai_in_flight = registry.gauge(
+    "bot_openai_requests_in_flight", "Peticiones a OpenAI en curso")
+
+# Documentos
+document_download_seconds = registry.histogram(
+    "bot_document_download_seconds", "Descarga de documentos desde Telegram", ("extension",))
+document_parse_seconds = registry.histogram(
+    "bot_document_parse_seconds", "Extracción de texto de documentos", ("extension", "outcome"))
+documents_in_flight = registry.gauge(
+    "bot_documents_in_flight", "Documentos en extracción")
+
+# Telegram
+telegram_send_seconds = registry.histogram(
+    "bot_telegram_send_seconds", "Envío y edición de mensajes en Telegram (con reintentos)", ("method",))
+telegram_send_retries_total = registry.counter(
+    "bot_telegram_send_retries_total", "Reintentos de envío a Telegram", ("method", "reason"))
+telegram_send_failures_total = registry.counter(
+    "bot_telegram_send_failures_total", "Envíos a Telegram fallidos tras agotar los reintentos", ("method",))
+
+# Conversaciones
+conversation_compactions_total = registry.counter(
+    "bot_conversation_compactions_total", "Compactaciones de historial por resultado", ("outcome",))
+messages_coalesced_total = registry.counter(
+    "bot_messages_coalesced_total", "Mensajes unidos a un turno anterior por el debounce del chat")
+completions_cancelled_total = registry.counter(
+    "bot_completions_cancelled_total", "Completions en curso canceladas por motivo (reset, mode, message)", ("reason",))
+
+# Modelo automático
+model_routes_total = registry.counter(
+    "bot_model_routes_total", "Turnos del modelo auto por modelo elegido y motivo (latency, context)", ("model", "reason"))
+
+# Arranque
+startup_seconds = registry.gauge(
+    "bot_startup_seconds", "Arranque en frío por fase (imports, ready)", ("phase",))
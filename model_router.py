@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Elección automática del modelo de cada turno (opción "auto" del menú 🧠 Modelo):
+el modelo más rápido, según la latencia medida, entre los que pueden con el turno.
+"""
+
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config.settings import (
+    setup_rotating_logger, AUTO_MODEL_CANDIDATES, AUTO_MODEL_LONG_QUESTION_TOKENS, AUTO_MODEL_LATENCY_HALF_LIFE
+)
+from metrics import model_routes_total
+from token_counter import get_prompt_budget
+
+# Las decisiones se guardan en JSON (una por línea) para analizarlas después
+logger = setup_rotating_logger("model-router", "model_router.log", json_format=True)
+
+AUTO_MODEL = "auto"
+
+# Modos cuyas respuestas piden un modelo más capaz que el que bastaría por el tamaño del turno
+DEMANDING_MODES = {"🎓 Académico", "👨‍💻 Técnico"}
+
+class LatencyProfile(NamedTuple):
+    """Latencia de un modelo separada en la espera inicial y la velocidad de generación."""
+    first_token: float  # Segundos hasta el primer token
+    per_token: float    # Segundos por token de respuesta
+
+    def turn_seconds(self, output_tokens: int) -> float:
+        return self.first_token + self.per_token * output_tokens
+
+# Latencia supuesta de un modelo sin mediciones (y a la que vuelven las medidas con el tiempo)
+DEFAULT_LATENCY = {
+    "gpt-3.5-turbo": LatencyProfile(0.4, 0.010),
+    "gpt-4o-mini": LatencyProfile(0.5, 0.012),
+    "gpt-4o": LatencyProfile(0.7, 0.025),
+}
+FALLBACK_LATENCY = LatencyProfile(0.6, 0.020)
+
+# Peso de cada medición nueva en la media móvil exponencial
+LATENCY_SMOOTHING = 0.3
+
+class LatencyEstimate:
+    """
+    Media móvil exponencial de la latencia de un modelo que parte de la supuesta.
+
+    Sin mediciones nuevas, la estimación vuelve poco a poco a la supuesta (la
+    diferencia se reduce a la mitad cada half_life segundos): un modelo que tuvo
+    una petición lenta vuelve a elegirse si el resto no es más rápido.
+    """
+    __slots__ = ("prior", "first_token", "per_token", "samples", "updated_at")
+
+    def __init__(self, prior: LatencyProfile, now: float):
+        self.prior = prior
+        self.first_token = prior.first_token
+        self.per_token = prior.per_token
+        self.samples = 0
+        self.updated_at = now
+
+    def current(self, now: float, half_life: float) -> LatencyProfile:
+        """Estimación a fecha de now, descontado el tiempo sin mediciones."""
+        weight = 0.5 ** ((now - self.updated_at) / half_life) if half_life > 0 else 1.0
+        return LatencyProfile(
+            self.prior.first_token + weight * (self.first_token - self.prior.first_token),
+            self.prior.per_token + weight * (self.per_token - self.prior.per_token),
+        )
+
+    def add(self, first_token: Optional[float], per_token: Optional[float], now: float, half_life: float):
+        """Añade una medición; None deja ese componente como estaba."""
+        self.first_token, self.per_token = self.current(now, half_life)
+        if first_token is not None:
+            self.first_token += LATENCY_SMOOTHING * (first_token - self.first_token)
+        if per_token is not None:
+            self.per_token += LATENCY_SMOOTHING * (per_token - self.per_token)
+        self.samples += 1
+        self.updated_at = now
+
+class RoutingDecision(NamedTuple):
+    model: str
+    reason: str
+    required_tier: int
+    estimates: Dict[str, float]  # Latencia estimada de cada candidato válido
+
+class ModelRouter:
+    """
+    Elige el modelo de cada turno para los usuarios con el modelo "auto".
+
+    Los candidatos van de menor a mayor capacidad. El turno exige un nivel
+    mínimo según su contenido (preguntas largas o con fragmentos de documentos
+    no van al modelo más básico; los modos exigentes suben un nivel) y el prompt
+    completo debe caber en la ventana del modelo. Entre los que cumplen, gana el
+    de menor latencia estimada para una respuesta de max_tokens tokens.
+
+    La latencia se mide solo en OpenAI (sin las ediciones de Telegram) y por
+    separado hasta el primer token y por token de respuesta, así una respuesta
+    larga no hace parecer lento al modelo. Se usa la medida para el modo del
+    usuario (su prompt cambia la espera inicial), luego la del modelo en
+    cualquier modo y, sin mediciones, la supuesta. A igualdad, el menos capaz.
+    """
+
+    def __init__(self, candidates: List[str] = AUTO_MODEL_CANDIDATES,
+                 long_question_tokens: int = AUTO_MODEL_LONG_QUESTION_TOKENS,
+                 latency_half_life: float = AUTO_MODEL_LATENCY_HALF_LIFE):
+        """
+        Args:
+            candidates: Modelos elegibles, de menor a mayor capacidad
+            long_question_tokens: Tokens a partir de los que una pregunta no va al modelo más básico
+            latency_half_life: Segundos en que una latencia medida pierde la mitad de su peso frente a la supuesta
+        """
+        self.candidates = list(candidates)
+        self.long_question_tokens = long_question_tokens
+        self.latency_half_life = latency_half_life
+        self._latency: Dict[Tuple[str, Optional[str]], LatencyEstimate] = {}
+
+    def observe(self, model: str, mode: str, first_token_seconds: Optional[float],
+                generation_seconds: float, output_tokens: int):
+        """
+        Registra la latencia de una petición terminada (de cualquier usuario, auto o no).
+
+        Args:
+            model: Modelo de la petición
+            mode: Modo de respuesta del usuario
+            first_token_seconds: Segundos hasta el primer token (None sin streaming)
+            generation_seconds: Segundos desde el primer token hasta el final o, sin
+                streaming, de toda la petición; sin el tiempo gastado en Telegram
+            output_tokens: Tokens de la respuesta
+        """
+        now = time.monotonic()
+        prior = DEFAULT_LATENCY.get(model, FALLBACK_LATENCY)
+        for key in ((model, mode), (model, None)):
+            estimate = self._latency.get(key)
+            if estimate is None:
+                estimate = self._latency[key] = LatencyEstimate(prior, now)
+            per_token = None
+            if output_tokens > 0:
+                seconds = generation_seconds
+                if first_token_seconds is None:
+                    # Sin streaming la petición incluye la espera inicial: se descuenta la estimada
+                    seconds -= estimate.current(now, self.latency_half_life).first_token
+                per_token = max(seconds, 0.0) / output_tokens
+            estimate.add(first_token_seconds, per_token, now, self.latency_half_life)
+
+    def estimate_latency(self, model: str, mode: str, output_tokens: int) -> Tuple[float, str]:
+        """Segundos estimados para una respuesta de output_tokens tokens y de dónde salen (mode, model o default)."""
+        now = time.monotonic()
+        for key, source in (((model, mode), "mode"), ((model, None), "model")):
+            estimate = self._latency.get(key)
+            if estimate is not None:
+                return estimate.current(now, self.latency_half_life).turn_seconds(output_tokens), source
+        return DEFAULT_LATENCY.get(model, FALLBACK_LATENCY).turn_seconds(output_tokens), "default"
+
+    def required_tier(self, question_tokens: int, has_documents: bool, mode: str) -> int:
+        """Nivel mínimo de capacidad (posición en candidates) que pide el turno."""
+        tier = 1 if has_documents or question_tokens > self.long_question_tokens else 0
+        if mode in DEMANDING_MODES:
+            tier += 1
+        return min(tier, len(self.candidates) - 1)
+
+    def choose(self, user_id: int, mode: str, prompt_tokens: int, question_tokens: int,
+               has_documents: bool, max_tokens: int) -> RoutingDecision:
+        """
+        Elige el modelo del turno y registra la decisión.
+
+        Args:
+            user_id: Usuario (solo para el registro)
+            mode: Modo de respuesta del usuario
+            prompt_tokens: Tokens del prompt completo (prefijo, historial y fragmentos)
+            question_tokens: Tokens de la última pregunta
+            has_documents: El turno lleva fragmentos de documentos
+            max_tokens: Tokens reservados para la respuesta
+        """
+        tier = self.required_tier(question_tokens, has_documents, mode)
+        fitting = [model for model in self.candidates[tier:] if get_prompt_budget(model, max_tokens) >= prompt_tokens]
+        estimates = {}
+        sources = {}
+        for model in fitting:
+            estimates[model], sources[model] = self.estimate_latency(model, mode, max_tokens)
+
+        if fitting:
+            # min() conserva el primero (el menos capaz) si hay empate
+            model = min(fitting, key=lambda candidate: round(estimates[candidate], 2))
+            reason = f"latency:{sources[model]}"
+        else:
+            # Nada cabe entero: el de mayor ventana (el historial se recortará)
+            model = max(self.candidates, key=lambda candidate: get_prompt_budget(candidate, max_tokens))
+            reason = "context"
+
+        model_routes_total.inc(model=model, reason=reason.split(":")[0])
+        logger.info(
+            f"🚦 Usuario {user_id}: {model} ({reason})",
+            extra={
+                "user_id": user_id, "model": model, "reason": reason, "mode": mode,
+                "prompt_tokens": prompt_tokens, "question_tokens": question_tokens,
+                "has_documents": has_documents, "max_tokens": max_tokens, "required_tier": tier,
+                "estimates": {name: round(seconds, 3) for name, seconds in estimates.items()}
+            }
+        )
+        return RoutingDecision(model, reason, tier, estimates)
+
+# Instancia global
+model_router = ModelRouter()
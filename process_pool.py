@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de procesos en el que cada trabajo ocupa su propio proceso: si un trabajo
+se atasca, se termina solo ese proceso y los trabajos de los demás siguen.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from config.settings import setup_rotating_logger
+
+logger = setup_rotating_logger("process-pool", "process-pool.log")
+
+class WorkerCrashedError(Exception):
+    """El proceso que ejecutaba el trabajo terminó sin devolver resultado."""
+
+def _worker_main(conn: Connection):
+    """Bucle de un proceso del pool: ejecuta los trabajos que llegan por conn hasta recibir None."""
+    # Ctrl+C lo gestiona el proceso principal, que cierra el pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        func, args = job
+        try:
+            reply = (True, func(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # La excepción no se pudo serializar: se envía su texto
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+def _roundtrip(conn: Connection, job: Tuple[Callable[..., Any], tuple]) -> Tuple[bool, Any]:
+    """Envía un trabajo al proceso y espera su respuesta (en un hilo: ambas llamadas bloquean)."""
+    try:
+        conn.send(job)
+        return conn.recv()
+    except (EOFError, OSError) as e:
+        raise WorkerCrashedError(str(e) or "el proceso terminó") from None
+
+class _Worker:
+    """Un proceso del pool y el extremo del pipe por el que recibe trabajos."""
+    __slots__ = ("process", "conn")
+
+    def __init__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        """Termina el proceso; el hilo que espera su respuesta recibe EOF y termina."""
+        if self.process.is_alive():
+            self.process.kill()
+
+    def stop(self):
+        """Pide al proceso que termine al acabar (solo si está libre)."""
+        try:
+            self.conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.conn.close()
+
+class IsolatedProcessPool:
+    """
+    Pool de hasta max_workers procesos reutilizables, uno por trabajo en curso.
+
+    A diferencia de ProcessPoolExecutor, cada trabajo habla con su proceso por un
+    pipe propio: un timeout o una cancelación terminan solo ese proceso (el
+    siguiente trabajo arranca otro) y un proceso que muere solo hace fallar su
+    trabajo, nunca los de otros usuarios.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._idle: List[_Worker] = []
+        self._workers: Set[_Worker] = set()
+        # Un hilo por trabajo en curso espera la respuesta de su proceso
+        self._waiters = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="process-pool")
+
+    def _take_worker(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.process.is_alive():
+                return worker
+            self._workers.discard(worker)
+        worker = _Worker()
+        self._workers.add(worker)
+        return worker
+
+    def _discard(self, worker: _Worker):
+        worker.kill()
+        self._workers.discard(worker)
+
+    async def run(self, func: Callable[..., Any], args: tuple, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta func(*args) en un proceso del pool.
+
+        Raises:
+            asyncio.TimeoutError: si tarda más de timeout (su proceso se termina)
+            WorkerCrashedError: si el proceso murió durante el trabajo
+        """
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            worker = self._take_worker()
+            try:
+                success, value = await asyncio.wait_for(
+                    loop.run_in_executor(self._waiters, _roundtrip, worker.conn, (func, args)), timeout
+                )
+            except BaseException as e:
+                # Timeout, cancelación o proceso caído: el proceso no se reutiliza
+                self._discard(worker)
+                if isinstance(e, asyncio.TimeoutError):
+                    logger.warning(f"Trabajo de {getattr(func, '__name__', func)} sin terminar en {timeout}s: proceso terminado")
+                raise
+            self._idle.append(worker)
+        if not success:
+            raise value
+        return value
+
+    def shutdown(self):
+        """Termina los procesos: los libres al acabar, los ocupados en el acto."""
+        for worker in list(self._workers):
+            if worker in self._idle:
+                worker.stop()
+            else:
+                worker.kill()
+        self._idle.clear()
+        self._workers.clear()
+        self._waiters.shutdown(wait=False, cancel_futures=True)
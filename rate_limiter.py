@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limitador proactivo de las peticiones salientes a la API de Telegram.
+Reparte los envíos con token buckets (global y por chat) para no llegar a RetryAfter.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config.settings import (
+    setup_rotating_logger, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_EDIT_RATE, TELEGRAM_GROUP_RATE_PER_MINUTE, TELEGRAM_MAX_RETRIES
+)
+
+logger = setup_rotating_logger("rate-limiter", "rate-limiter.log")
+
+# Buckets de chat inactivos conservados antes de limpiar
+MAX_IDLE_CHAT_BUCKETS = 1000
+
+# No son mensajes nuevos: no gastan el cupo de mensajes del chat
+CHAT_ACTION_ENDPOINTS = frozenset({"sendChatAction"})  # Solo el bucket global
+EDIT_ENDPOINTS = frozenset({"editMessageText", "editMessageCaption", "editMessageReplyMarkup"})  # Bucket de ediciones
+
+class TokenBucket:
+    """
+    Token bucket asíncrono: rate fichas por segundo, hasta capacity acumuladas.
+
+    Los que esperan se atienden en orden de llegada (el lock es FIFO), así un
+    chat no adelanta sus propios mensajes.
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_lock")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Consume una ficha, esperando si hace falta; devuelve los segundos esperados."""
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited = delay
+                self._refill()
+            self._tokens -= 1
+        return waited
+
+    def is_idle(self) -> bool:
+        """Indica si el bucket está lleno y sin esperas (se puede descartar)."""
+        self._refill()
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    """
+    Limitador de PTB por el que pasan todas las peticiones del bot (mensajes,
+    ediciones, acciones de chat...).
+
+    - Un bucket global limita los mensajes por segundo de todo el bot.
+    - Cada chat tiene su propio bucket: ~1 mensaje/s en privados y 20/min en grupos.
+    - Las ediciones (p. ej. las del streaming) tienen otro bucket por chat y las
+      acciones de chat ("escribiendo...") solo pasan por el global, así no
+      retrasan los mensajes del chat.
+    - Si aun así Telegram responde RetryAfter, se pausan todas las peticiones
+      durante el tiempo indicado y se reintenta (hasta max_retries veces). Es
+      el único sitio que reintenta un RetryAfter.
+
+    Las peticiones sin chat (getMe, getFile, setWebhook...) no se limitan.
+    """
+
+    __slots__ = ("global_bucket", "chat_rate", "chat_burst", "edit_rate", "group_rate", "max_retries",
+                 "_chat_buckets", "_resume_at", "throttled", "retry_after_hits")
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: float = TELEGRAM_CHAT_BURST, group_rate_per_minute: float = TELEGRAM_GROUP_RATE_PER_MINUTE,
+                 max_retries: int = TELEGRAM_MAX_RETRIES, edit_rate: float = TELEGRAM_CHAT_EDIT_RATE):
+        """
+        Args:
+            global_rate: Peticiones por segundo de todo el bot
+            chat_rate: Peticiones por segundo a un chat privado
+            chat_burst: Ráfaga permitida por chat
+            group_rate_per_minute: Peticiones por minuto a un grupo
+            max_retries: Reintentos tras un RetryAfter
+            edit_rate: Ediciones por segundo en un chat
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.edit_rate = edit_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._chat_buckets: Dict[Tuple[Union[int, str], bool], TokenBucket] = {}
+        self._resume_at = 0.0
+        self.throttled = 0  # Peticiones que tuvieron que esperar
+        self.retry_after_hits = 0
+
+    async def initialize(self) -> None:
+        """No requiere recursos."""
+
+    async def shutdown(self) -> None:
+        """No requiere recursos."""
+
+    def _chat_bucket(self, chat_id: Union[int, str], edits: bool = False) -> TokenBucket:
+        key = (chat_id, edits)
+        bucket = self._chat_buckets.get(key)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.is_idle()}
+            # Los grupos y canales tienen ids negativos (o @nombre)
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.group_rate, self.chat_burst)
+            elif edits:
+                bucket = TokenBucket(self.edit_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[key] = bucket
+        return bucket
+
+    async def _wait_for_resume(self):
+        """Espera si Telegram ha pedido pausar los envíos."""
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        """Espera turno en los buckets del chat y global y hace la petición."""
+        chat_id = data.get("chat_id")
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_resume()
+            if chat_id is not None:
+                waited = 0.0
+                if endpoint not in CHAT_ACTION_ENDPOINTS:
+                    waited += await self._chat_bucket(chat_id, edits=endpoint in EDIT_ENDPOINTS).acquire()
+                waited += await self.global_bucket.acquire()
+                if waited:
+                    self.throttled += 1
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after_hits += 1
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"RetryAfter de Telegram en {endpoint}: pausa de {retry_after:.1f}s ({attempt + 1}/{self.max_retries})")
+
+    def stats(self) -> Dict[str, int]:
+        """Peticiones demoradas, RetryAfter recibidos y chats con bucket."""
+        return {
+            "throttled": self.throttled,
+            "retry_after": self.retry_after_hits,
+            "chats": len({chat_id for chat_id, _ in self._chat_buckets})
+        }
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché de respuestas exactas para configuraciones deterministas (temperatura baja).
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL
+)
+
+class ResponseCache:
+    """
+    Caché LRU en memoria con caducidad (TTL) de respuestas de OpenAI.
+
+    La clave incluye modelo, modo, temperatura, max_tokens y un hash de la lista
+    de mensajes efectiva (historial + contexto de documentos), así que solo
+    coincide cuando la petición sería idéntica.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL):
+        """
+        Args:
+            max_entries: Respuestas guardadas como máximo
+            ttl: Segundos de validez de cada respuesta
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # clave -> (caduca, respuesta)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, mode: str, temperature: float, max_tokens: int, messages: List[dict]) -> str:
+        """Clave de caché de una petición."""
+        payload = json.dumps(
+            [model, mode, temperature, max_tokens, messages],
+            ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Respuesta guardada para la clave, o None (cuenta aciertos y fallos)."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, answer: str):
+        """Guarda una respuesta, expulsando la menos usada si se supera el límite."""
+        self._entries[key] = (time.monotonic() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Aciertos, fallos, tasa de acierto y entradas actuales."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._entries)
+        }
+
+# Instancia global (None si la caché está desactivada)
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
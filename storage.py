@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacenamiento persistente de conversaciones, configuración y documentos por usuario.
+SQLite en modo WAL con una caché LRU de sesiones activas en RAM y escritura diferida.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from config.settings import (
+    setup_rotating_logger, STORE_DB_PATH, STORE_CACHE_SIZE, STORE_FLUSH_INTERVAL
+)
+
+logger = setup_rotating_logger("storage", "storage.log")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    history TEXT,
+    config TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    user_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, filename)
+);
+"""
+
+class Session:
+    """Estado en RAM de un usuario (historial y configuración)."""
+    __slots__ = ("history", "config")
+
+    def __init__(self, history: Optional[List[dict]] = None, config: Optional[Dict] = None):
+        self.history = history
+        self.config = config
+
+class ConversationStore:
+    """
+    Almacén de sesiones con caché LRU delante de SQLite.
+
+    - Las lecturas se sirven desde la caché; en un fallo se lee la fila de SQLite
+      por una conexión solo de lectura: en modo WAL no espera a las escrituras
+      en curso, así que el event loop no se bloquea mientras se guarda un lote.
+    - Las escrituras solo marcan la sesión como sucia: una tarea periódica
+      (write-behind) serializa las sesiones sucias en el event loop y las escribe
+      en una sola transacción desde un hilo, sin bloquear el bot.
+    - Al salir de la caché, una sesión sucia se serializa de inmediato y queda
+      pendiente de escritura, así que no se pierden cambios. Mientras un lote se
+      está escribiendo sigue siendo legible, de modo que un fallo de caché no lee
+      la fila anterior de la base de datos.
+
+    Los historiales y configuraciones devueltos son los objetos vivos de la caché:
+    tras modificarlos hay que llamar a set_history/set_config para marcarlos.
+    """
+
+    def __init__(self, db_path: Path = STORE_DB_PATH, cache_size: int = STORE_CACHE_SIZE,
+                 flush_interval: float = STORE_FLUSH_INTERVAL):
+        """
+        Args:
+            db_path: Ruta de la base de datos SQLite
+            cache_size: Sesiones mantenidas en RAM
+            flush_interval: Segundos entre escrituras diferidas
+        """
+        self.db_path = Path(db_path)
+        self.cache_size = max(1, cache_size)
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[int, Session]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        self._pending: Dict[int, Tuple[Optional[str], Optional[str]]] = {}  # serializadas, sin escribir
+        self._in_flight: Dict[int, Tuple[Optional[str], Optional[str]]] = {}  # lote que se está escribiendo
+        self._unsaved_users: Set[int] = set()  # usuarios que aún no tienen fila en SQLite
+        self._loading: Set[int] = set()  # usuarios cuya sesión se está leyendo en un hilo (load_session)
+        self._raced: Set[int] = set()  # ...y que se cargaron por otra vía mientras tanto
+        self._db_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Seguro con WAL y mucho más rápido
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        (self._persisted_users,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        # Lecturas sin pasar por _db_lock: en WAL no esperan a la transacción de escritura.
+        # Sesiones y documentos usan conexiones distintas para que un fallo de caché
+        # no espere a que load_documents traiga todos los documentos de un usuario
+        self._read_conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._docs_conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._docs_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Sesiones
+    # ------------------------------------------------------------------
+
+    def _get_session(self, user_id: int) -> Session:
+        """
+        Devuelve la sesión desde la caché o la carga de la base de datos.
+
+        Un fallo de caché lee SQLite en el event loop: los handlers llaman antes a
+        load_session, que hace esa lectura en un hilo.
+        """
+        session = self._cache.get(user_id)
+        if session is not None:
+            self._cache.move_to_end(user_id)
+            return session
+
+        unwritten = self._pending.get(user_id) or self._in_flight.get(user_id)
+        if unwritten is not None:
+            session = self._decode(*unwritten)
+        else:
+            session = self._fetch_session(user_id)
+            if session is None:
+                self._unsaved_users.add(user_id)
+                session = Session()
+        if user_id in self._loading:
+            self._raced.add(user_id)
+        self._cache_session(user_id, session)
+        return session
+
+    async def load_session(self, user_id: int):
+        """
+        Trae a la caché la sesión del usuario leyendo SQLite y el JSON en un hilo,
+        para que el get_history/get_config siguiente no bloquee el event loop.
+        """
+        if user_id in self._cache or user_id in self._pending or user_id in self._in_flight:
+            return
+        self._loading.add(user_id)
+        try:
+            session = await asyncio.to_thread(self._fetch_session, user_id)
+        finally:
+            self._loading.discard(user_id)
+            raced = user_id in self._raced
+            self._raced.discard(user_id)
+        # Cargada por otra vía mientras tanto: esa copia (o lo que quedó pendiente) es más reciente
+        if raced or user_id in self._cache or user_id in self._pending or user_id in self._in_flight:
+            return
+        if session is None:
+            self._unsaved_users.add(user_id)
+            session = Session()
+        self._cache_session(user_id, session)
+
+    def _fetch_session(self, user_id: int) -> Optional[Session]:
+        """Lee y decodifica la sesión guardada del usuario, o None si no tiene fila."""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT history, config FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return self._decode(*row) if row else None
+
+    @staticmethod
+    def _decode(history_json: Optional[str], config_json: Optional[str]) -> Session:
+        return Session(
+            json.loads(history_json) if history_json else None,
+            json.loads(config_json) if config_json else None
+        )
+
+    def _cache_session(self, user_id: int, session: Session):
+        self._cache[user_id] = session
+        self._evict()
+
+    def _evict(self):
+        """Saca de RAM las sesiones menos usadas, dejando las sucias pendientes de escritura."""
+        while len(self._cache) > self.cache_size:
+            user_id, session = self._cache.popitem(last=False)
+            if user_id in self._dirty:
+                self._dirty.discard(user_id)
+                self._pending[user_id] = self._serialize(session)
+
+    @staticmethod
+    def _serialize(session: Session) -> Tuple[Optional[str], Optional[str]]:
+        history_json = json.dumps(session.history, ensure_ascii=False) if session.history is not None else None
+        config_json = json.dumps(session.config, ensure_ascii=False) if session.config is not None else None
+        return history_json, config_json
+
+    def get_history(self, user_id: int) -> Optional[List[dict]]:
+        """Historial del usuario, o None si no tiene."""
+        return self._get_session(user_id).history
+
+    def set_history(self, user_id: int, history: List[dict]):
+        """Guarda (de forma diferida) el historial del usuario."""
+        self._get_session(user_id).history = history
+        self._dirty.add(user_id)
+
+    def get_config(self, user_id: int) -> Optional[Dict]:
+        """Configuración del usuario, o None si no tiene."""
+        return self._get_session(user_id).config
+
+    def set_config(self, user_id: int, config: Dict):
+        """Guarda (de forma diferida) la configuración del usuario."""
+        self._get_session(user_id).config = config
+        self._dirty.add(user_id)
+
+    def count_users(self) -> int:
+        """Número total de usuarios con sesión (persistidos o pendientes), sin consultar SQLite."""
+        return self._persisted_users + len(self._unsaved_users & (self._dirty | set(self._pending) | set(self._in_flight)))
+
+    def cached_sessions(self) -> int:
+        """Sesiones actualmente en RAM."""
+        return len(self._cache)
+
+    # ------------------------------------------------------------------
+    # Documentos
+    # ------------------------------------------------------------------
+
+    def save_document(self, user_id: int, filename: str, content: str):
+        """Persiste el texto de un documento del usuario (llamar desde un hilo)."""
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (user_id, filename, content, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, filename, content, time.time())
+            )
+            self._conn.commit()
+
+    def load_documents(self, user_id: int) -> List[Tuple[str, str]]:
+        """Documentos del usuario como (nombre, texto), del más antiguo al más reciente (llamar desde un hilo)."""
+        with self._docs_lock:
+            return self._docs_conn.execute(
+                "SELECT filename, content FROM documents WHERE user_id = ? ORDER BY created_at", (user_id,)
+            ).fetchall()
+
+    def delete_document(self, user_id: int, filename: str):
+        """Elimina un documento del usuario."""
+        with self._db_lock:
+            self._conn.execute("DELETE FROM documents WHERE user_id = ? AND filename = ?", (user_id, filename))
+            self._conn.commit()
+
+    def prune_documents(self, user_id: int, keep: List[str]):
+        """Elimina los documentos del usuario que ya no están en keep."""
+        with self._db_lock:
+            placeholders = ",".join("?" for _ in keep) or "NULL"
+            self._conn.execute(
+                f"DELETE FROM documents WHERE user_id = ? AND filename NOT IN ({placeholders})",
+                (user_id, *keep)
+            )
+            self._conn.commit()
+
+    def delete_documents(self, user_id: int):
+        """Elimina todos los documentos del usuario."""
+        with self._db_lock:
+            self._conn.execute("DELETE FROM documents WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Escritura diferida
+    # ------------------------------------------------------------------
+
+    def _collect_pending(self) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """Serializa las sesiones sucias y devuelve todo lo pendiente de escribir."""
+        for user_id in self._dirty:
+            session = self._cache.get(user_id)
+            if session is not None:
+                self._pending[user_id] = self._serialize(session)
+        self._dirty.clear()
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def _write_batch(self, batch: Dict[int, Tuple[Optional[str], Optional[str]]]):
+        """Escribe un lote de sesiones en una sola transacción."""
+        now = time.time()
+        with self._db_lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO sessions (user_id, history, config, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET history = excluded.history, "
+                    "config = excluded.config, updated_at = excluded.updated_at",
+                    [(user_id, history, config, now) for user_id, (history, config) in batch.items()]
+                )
+
+    async def flush(self):
+        """Escribe las sesiones sucias sin bloquear el event loop."""
+        batch = self._collect_pending()
+        if not batch:
+            return
+        # Legible mientras se escribe (ver _get_session)
+        self._in_flight = batch
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+            self._mark_persisted(batch)
+        except Exception as e:
+            # Se reintentará en el siguiente ciclo (sin pisar cambios más recientes)
+            logger.error(f"Error guardando {len(batch)} sesiones: {e}")
+            self._requeue(batch)
+        except asyncio.CancelledError:
+            # Al detener el bot: flush_sync() lo vuelve a escribir
+            self._requeue(batch)
+            raise
+        finally:
+            self._in_flight = {}
+
+    def _mark_persisted(self, batch: Dict[int, Tuple[Optional[str], Optional[str]]]):
+        """Tras escribir un lote: sus usuarios nuevos ya tienen fila (y cuentan en count_users)."""
+        inserted = self._unsaved_users.intersection(batch)
+        self._persisted_users += len(inserted)
+        self._unsaved_users -= inserted
+
+    def _requeue(self, batch: Dict[int, Tuple[Optional[str], Optional[str]]]):
+        """Devuelve un lote sin confirmar a pendientes, sin pisar cambios más recientes."""
+        for user_id, data in batch.items():
+            self._pending.setdefault(user_id, data)
+
+    def flush_sync(self):
+        """Escribe todo lo pendiente de forma síncrona (al detener el bot)."""
+        batch = self._collect_pending()
+        if batch:
+            self._write_batch(batch)
+            self._mark_persisted(batch)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Arranca la escritura diferida periódica (requiere un event loop en marcha)."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self):
+        """Detiene la escritura periódica, guarda lo pendiente y cierra la base de datos."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.flush_sync()
+        with self._db_lock:
+            self._conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+        with self._docs_lock:
+            self._docs_conn.close()
+        logger.info("💾 Almacén de conversaciones guardado y cerrado")
+
+# Instancia global
+conversation_store = ConversationStore()
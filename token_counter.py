@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conteo de tokens offline para presupuestar el contexto enviado a OpenAI.
+Usa tiktoken si está disponible y, si no, una estimación por caracteres.
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+from config.settings import setup_rotating_logger
+
+# Importación opcional (se verifica al usar)
+try:
+    import tiktoken  # type: ignore
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = setup_rotating_logger("token-counter", "token-counter.log")
+
+# Ventana de contexto (tokens) por modelo
+MODEL_CONTEXT_LIMITS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_LIMIT = 16385
+
+# Sobrecoste del formato de chat de OpenAI
+TOKENS_PER_MESSAGE = 3  # <|start|>rol ... <|end|>
+TOKENS_PER_REPLY = 3    # Cebado de la respuesta del asistente
+
+# Estimación cuando tiktoken no está disponible (conservadora para español)
+CHARS_PER_TOKEN = 3.5
+
+def get_context_limit(model: str) -> int:
+    """Devuelve la ventana de contexto del modelo en tokens."""
+    return MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT)
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Obtiene (una sola vez por modelo) el codificador de tiktoken, o None si no hay."""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Sin red ni caché local tiktoken no puede cargar el vocabulario
+        logger.warning(f"tiktoken no disponible para {model}, usando estimación: {e}")
+        return None
+
+def warmup_encodings(models: Iterable[str]) -> int:
+    """
+    Carga de antemano los codificadores de los modelos (llamar desde un hilo).
+
+    La primera carga puede descargar el vocabulario BPE de tiktoken; hecha en el
+    arranque no bloquea el event loop en el primer mensaje de cada modelo.
+
+    Returns:
+        int: Modelos con codificador de tiktoken (el resto usa la estimación)
+    """
+    return sum(_get_encoding(model) is not None for model in models)
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str) -> int:
+    """Cuenta los tokens de un texto (con caché: el historial se recuenta en cada turno)."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return int(len(text) / CHARS_PER_TOKEN) + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(message: dict, model: str) -> int:
+    """Cuenta los tokens de un mensaje de chat, incluido el sobrecoste del formato."""
+    return TOKENS_PER_MESSAGE + count_tokens(message.get("role", ""), model) + count_tokens(message.get("content") or "", model)
+
+def count_messages_tokens(messages: List[dict], model: str) -> int:
+    """Cuenta los tokens de una lista de mensajes tal como se envía a la API."""
+    return sum(count_message_tokens(msg, model) for msg in messages) + TOKENS_PER_REPLY
+
+def get_prompt_budget(model: str, max_tokens: int, max_prompt_tokens: Optional[int] = None) -> int:
+    """
+    Tokens disponibles para el prompt: contexto del modelo menos la reserva para la respuesta.
+
+    Args:
+        model: Modelo de OpenAI
+        max_tokens: Tokens reservados para la respuesta
+        max_prompt_tokens: Tope opcional (0 o None = sin tope adicional)
+    """
+    budget = get_context_limit(model) - max_tokens - TOKENS_PER_REPLY
+    if max_prompt_tokens:
+        budget = min(budget, max_prompt_tokens)
+    return max(budget, 0)
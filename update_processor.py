@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Procesamiento concurrente de actualizaciones de Telegram con orden estricto por usuario.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from debouncer import MessageDebouncer
+
+def get_update_user_id(update: object) -> Optional[int]:
+    """Usuario al que pertenece una actualización (None si no tiene)."""
+    if isinstance(update, Update) and update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Procesa en paralelo las actualizaciones de distintos usuarios y en serie las
+    de un mismo usuario.
+
+    Cada usuario tiene un asyncio.Lock (FIFO) que se adquiere en el orden de
+    llegada de sus actualizaciones, así sus turnos nunca se intercalan ni compiten
+    por el mismo historial. Los locks se eliminan cuando el usuario no tiene
+    actualizaciones en curso, por lo que la memoria no crece con el número de usuarios.
+
+    El tope global (max_concurrent_updates) se aplica solo a la actualización
+    que tiene el turno de cada usuario: las que esperan detrás, en su cola, no
+    ocupan huecos, así la cola de un usuario no retrasa a los demás.
+
+    Con un debouncer, los mensajes de texto que llegan seguidos se unen al
+    primero de la ráfaga antes de entrar en la cola, así no esperan turno ni
+    generan una respuesta cada uno.
+
+    on_arrival se llama con cada actualización de un usuario al llegar, antes de
+    esperar turno: sirve para reaccionar sin esperar a que termine lo anterior
+    (p. ej. cancelar una respuesta en curso que la actualización deja obsoleta).
+
+    Con max_pending_updates, la cola de la aplicación (AdmissionQueue) no entrega
+    más actualizaciones mientras haya esas admitidas sin terminar (en curso o
+    esperando turno): la cola se llena y el webhook o el polling esperan.
+    """
+
+    __slots__ = ("_user_locks", "_user_waiters", "debouncer", "on_arrival", "_admission", "_admitted")
+
+    def __init__(self, max_concurrent_updates: int, debouncer: Optional[MessageDebouncer] = None,
+                 on_arrival: Optional[Callable[[int, Update], None]] = None, max_pending_updates: int = 0):
+        """
+        Args:
+            max_concurrent_updates: Actualizaciones procesándose a la vez (una por usuario como mucho)
+            debouncer: Agrupa los mensajes de texto seguidos de un usuario
+            on_arrival: Se llama con (user_id, update) al llegar cada actualización
+            max_pending_updates: Actualizaciones admitidas sin terminar (0 = sin límite)
+        """
+        super().__init__(max_concurrent_updates)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_waiters: Dict[int, int] = {}
+        self.debouncer = debouncer
+        self.on_arrival = on_arrival
+        self._admission = asyncio.Semaphore(max_pending_updates) if max_pending_updates > 0 else None
+        self._admitted: Set[int] = set()  # id() de las actualizaciones admitidas sin terminar
+
+    async def admit(self, update: object):
+        """Espera hueco entre las actualizaciones admitidas y reserva uno para update."""
+        if self._admission is None:
+            return
+        await self._admission.acquire()
+        self._admitted.add(id(update))
+
+    def _release(self, update: object):
+        if id(update) in self._admitted:
+            self._admitted.discard(id(update))
+            self._admission.release()
+
+    async def process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        """
+        Procesa la actualización.
+
+        Sustituye a la de BaseUpdateProcessor, que toma el semáforo global antes
+        de do_process_update: aquí se toma dentro, al llegar el turno del usuario.
+        """
+        try:
+            await self.do_process_update(update, coroutine)
+        finally:
+            self._release(update)
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        """Espera el turno del usuario y un hueco global, y procesa la actualización."""
+        user_id = get_update_user_id(update)
+        if user_id is None:
+            async with self._semaphore:
+                await coroutine
+            return
+
+        if self.on_arrival is not None:
+            self.on_arrival(user_id, update)
+        burst = None
+        if self.debouncer is not None:
+            if self.debouncer.accepts(update):
+                burst = self.debouncer.absorb(user_id, update)
+                if burst is None:
+                    coroutine.close()  # Unido al mensaje que abrió la ráfaga
+                    return
+            else:
+                self.debouncer.flush(user_id)
+
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                if burst is not None:
+                    await self.debouncer.wait(user_id, burst)
+                async with self._semaphore:
+                    await coroutine
+        finally:
+            self._user_waiters[user_id] -= 1
+            if self._user_waiters[user_id] == 0:
+                del self._user_waiters[user_id]
+                del self._user_locks[user_id]
+
+    def pending_updates(self) -> int:
+        """Actualizaciones en curso o esperando turno."""
+        return sum(self._user_waiters.values())
+
+    def admitted_updates(self) -> int:
+        """Actualizaciones admitidas por la cola sin terminar (incluye las agrupadas aún sin cerrar)."""
+        return len(self._admitted)
+
+    async def initialize(self) -> None:
+        """No requiere recursos."""
+
+    async def shutdown(self) -> None:
+        """No requiere recursos."""
+
+class AdmissionQueue(asyncio.Queue):
+    """
+    Cola de actualizaciones de la aplicación que solo entrega una actualización
+    cuando el procesador tiene hueco (ver PerUserUpdateProcessor.admit).
+
+    PTB saca cada actualización de la cola y la lanza en su propia tarea sin
+    esperar, así que una cola normal nunca se llena. Con esta, si el procesador
+    está al límite la cola se llena y put() espera: el webhook tarda en responder
+    a Telegram y el polling deja de pedir actualizaciones.
+    """
+
+    def __init__(self, processor: PerUserUpdateProcessor, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self) -> Any:
+        item = await super().get()
+        if isinstance(item, Update):  # La señal de parada de PTB no se procesa
+            await self.processor.admit(item)
+        return item
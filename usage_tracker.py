@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consumo de tokens por usuario, separando los tokens de prompt servidos desde la
+caché de prefijos del proveedor (más baratos y rápidos) de los que no.
+"""
+
+from collections import OrderedDict
+from typing import Optional
+
+from config.settings import STORE_CACHE_SIZE
+
+def cached_prompt_tokens(usage) -> int:
+    """Tokens del prompt servidos desde la caché de prefijos (0 si la API no lo informa)."""
+    # Versiones antiguas del SDK no declaran prompt_tokens_details y lo dejan como dict
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return int(details.get("cached_tokens") or 0)
+    return int(getattr(details, "cached_tokens", 0) or 0)
+
+class TokenUsage:
+    """Tokens acumulados de un usuario (o de todos)."""
+    __slots__ = ("requests", "prompt_tokens", "cached_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens: int, cached_tokens: int, completion_tokens: int):
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+
+    @property
+    def uncached_tokens(self) -> int:
+        return self.prompt_tokens - self.cached_tokens
+
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+class UsageTracker:
+    """
+    Tokens por usuario desde el arranque, en memoria.
+
+    Solo se conservan los max_users usuarios más recientes; los totales globales
+    incluyen a todos.
+    """
+
+    def __init__(self, max_users: int = STORE_CACHE_SIZE):
+        self.max_users = max(1, max_users)
+        self._users: "OrderedDict[int, TokenUsage]" = OrderedDict()
+        self.totals = TokenUsage()
+
+    def record(self, user_id: int, usage) -> int:
+        """
+        Suma el consumo de una respuesta (CompletionUsage) al usuario.
+
+        Returns:
+            int: Tokens del prompt servidos desde la caché
+        """
+        cached = cached_prompt_tokens(usage)
+        user_usage = self._users.get(user_id)
+        if user_usage is None:
+            user_usage = self._users[user_id] = TokenUsage()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        user_usage.add(usage.prompt_tokens, cached, usage.completion_tokens)
+        self.totals.add(usage.prompt_tokens, cached, usage.completion_tokens)
+        return cached
+
+    def for_user(self, user_id: int) -> Optional[TokenUsage]:
+        return self._users.get(user_id)
+
+# Instancia global
+usage_tracker = UsageTracker()